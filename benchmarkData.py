@@ -0,0 +1,361 @@
+"""
+Benchmarks of the parsing and loading hot paths of fetchData.
+
+Every benchmark reports its throughput (items per second) and peak Python memory, for the
+sample files under data/FUSER and for synthetic inputs of generateData scaled 1x, 10x, ...
+(one day of reports per scale step). Results can be saved as a baseline and later runs
+compared against it. Before the benchmarks, every ParseCache format is checked to give back
+the same frames from a warm cache as a cold load, and the token parser (parser="tokens") is
+compared with the regular expressions on the synthetic reports and on randomly damaged copies of
+them. The run fails on any difference.
+
+Usage:
+    python benchmarkData.py --scales 1 10 --save-baseline benchmark_baseline.json
+    python benchmarkData.py --scales 1 10 --baseline benchmark_baseline.json
+"""
+import argparse
+import gc
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import h5py
+import numpy as np
+import pandas as pd
+
+import fetchData
+import generateData
+
+sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'FUSER')
+
+# Stations of the synthetic METAR and TAF inputs, every scale step adds one day of reports
+benchmark_stations = ['KATL', 'KDEN', 'KJFK', 'KORD', 'KLAX', 'KDFW', 'KSEA', 'KMIA', 'KBOS', 'EGLL', 'EDDF', 'LFPG']
+metar_reports_per_hour = 4
+taf_reports_per_day = 24
+cwam_polygons_per_scale = 5
+cloud_groups_per_scale = 5000
+
+# Groups inserted by damaged_reports, partly matching or out of place groups of both report types
+damage_groups = ['BKN005TCU', 'OVC///', '27015KTS', '12345', '1234SM', 'P6SM', 'WND', '200V250', '200V250X',
+                 'TX21/0120ZX', 'PROB4', 'QNH2992INSX', 'A30452', 'A3045==', 'Q996', 'M05/M1', 'COR', 'AUTO',
+                 'AMD', 'PART', '1', 'OF', 'TAF', 'K_TL', 'CAVOK', 'TSRAGRSN', 'RAFEW005', 'FEW0280', '/////KT',
+                 'RMK', '=', '']
+# Separators of the groups of damaged_reports
+damage_separators = [' ', ' ', ' ', ' ', '  ', '\t', ' \n ', '\xa0']
+
+# load_data options of the METAR and TAF frames compared by check_cache
+cache_check_options = [{}, {'cloud_format': 'columns'}, {'compact': True}, {'compact': True, 'cloud_format': 'columns'}]
+
+def measure(func, repeat):
+    """Return the best wall time of func over repeat runs and the peak traced memory of one run."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+class Inputs:
+    """Synthetic input files of one scale, written by generateData under a data directory."""
+
+    def __init__(self, base_dir, scale):
+        self.base_dir = base_dir
+        self.scale = scale
+        start = pd.Timestamp('2022-09-01')
+        file_name = f'synthetic_{scale}'
+
+        self.num_metar = generateData.write_metar(os.path.join(base_dir, 'METAR', 'test', f'{file_name}.txt'),
+                                                  benchmark_stations, start, scale, metar_reports_per_hour, seed=scale)
+        self.num_taf = generateData.write_taf(os.path.join(base_dir, 'TAF', 'test', f'{file_name}.txt'),
+                                              benchmark_stations, start, scale, taf_reports_per_day, seed=scale)
+        self.cwam_path = os.path.join(base_dir, 'CWAM', 'test', 'part_1', '09', '01', f'{file_name}.h5.CWAM.h5')
+        self.num_polygons = generateData.write_cwam(self.cwam_path, polygons_per_group=cwam_polygons_per_scale * scale,
+                                                    seed=scale)
+        self.cwam_name = file_name
+
+        with open(os.path.join(base_dir, 'METAR', 'test', f'{file_name}.txt')) as file:
+            self.metar_pairs = fetchData.pair_metar_lines(file.read().split('\n'))
+        rng = np.random.default_rng(scale)
+        issue_times = pd.date_range(start, periods=self.num_taf, freq='min')
+        self.taf_reports = [
+            (generateData.date_line(time), ' '.join(generateData.taf_report(rng, station, time)).rstrip('='))
+            for time, station in zip(issue_times, benchmark_stations * self.num_taf)
+        ]
+        self.cloud_groups = ['FEW250', 'BKN035CB', 'OVC008', 'SCT030', 'NSC'] * (cloud_groups_per_scale * scale // 5)
+
+def sample_fuser_inputs(base_dir):
+    """Link the cleaned FUSER sample files into the raw FUSER layout, return their load_data file names."""
+    file_names = []
+    for source in sorted(glob.glob(os.path.join(sample_dir, '*', '*.csv'))):
+        purpose = os.path.basename(os.path.dirname(source))
+        date = os.path.basename(source)[:-len('.csv')]
+        path = os.path.join(base_dir, 'FUSER', purpose, 'KATL')
+        os.makedirs(path, exist_ok=True)
+        file_name = fetchData.get_fuser_file_name('KATL', date, 'sample')
+        os.symlink(source, os.path.join(path, f'{file_name}.csv'))
+        file_names.append((purpose, file_name))
+    return file_names
+
+def parse_metar_lines(pairs):
+    return [fetchData.parse_metar_line(date_time, report)
+            for date_time, report in zip(pairs['date_time'], pairs['report'])]
+
+def parse_taf_blocks(reports, parser='tokens'):
+    """parse_taf_block on (date_time, report) pairs, for parser "regex" after remove_duplicates_in_report."""
+    if parser == 'regex':
+        reports = [(date_time, fetchData.remove_duplicates_in_report(report)) for date_time, report in reports]
+    return [fetchData.parse_taf_block(date_time, report, parser=parser) for date_time, report in reports]
+
+def damaged_reports(reports, rng):
+    """Copies of reports with groups dropped, swapped, repeated, cut, glued or taken from damage_groups."""
+    damaged = []
+    for report in reports:
+        groups = report.split()
+        for _ in range(rng.integers(1, 4)):
+            action, position = rng.integers(6), rng.integers(len(groups) + 1)
+            if action == 0 and position < len(groups):
+                del groups[position]
+            elif action == 1:
+                groups.insert(position, damage_groups[rng.integers(len(damage_groups))])
+            elif action == 2 and position + 1 < len(groups):
+                groups[position], groups[position + 1] = groups[position + 1], groups[position]
+            elif action == 3 and position < len(groups):
+                groups.insert(position, groups[position])
+            elif action == 4:
+                groups = groups[:position]
+            elif action == 5 and position + 1 < len(groups):
+                groups[position:position + 2] = [groups[position] + groups[position + 1]]
+        separator = damage_separators[rng.integers(len(damage_separators))]
+        damaged.append(separator.join(groups) + separator * int(rng.integers(2)))
+    return damaged
+
+def same_values(left, right):
+    """== of two parse results, with NaN equal to NaN."""
+    if isinstance(left, dict) and isinstance(right, dict):
+        return left.keys() == right.keys() and all(same_values(left[key], right[key]) for key in left)
+    return left == right or (pd.isna(left) is True and pd.isna(right) is True)
+
+def check_parsers(inputs, base_dir):
+    """Return the differences between parser "tokens" and "regex" on the inputs of one scale."""
+    differences = []
+    rng = np.random.default_rng(inputs.scale)
+    metar = inputs.metar_pairs['report'].tolist()
+    metar += damaged_reports(metar, rng)
+    for report in metar:
+        match = fetchData.metar_pattern.match(report)
+        if fetchData.metar_token_groups(report) != (match.group(*fetchData.metar_group_names) if match else None):
+            differences.append(('METAR groups', report))
+    pairs = pd.DataFrame({'date_time': inputs.metar_pairs['date_time'].iloc[0], 'report': metar}, dtype=object)
+    for cloud_format in ('list', 'columns'):
+        frames = [fetchData.parse_metar_batch(pairs, cloud_format=cloud_format, parser=parser)
+                  for parser in ('regex', 'tokens')]
+        try:
+            pd.testing.assert_frame_equal(*frames)
+        except AssertionError as error:
+            differences.append((f'parse_metar_batch[{cloud_format}]', str(error)))
+
+    taf = [report for _, report in inputs.taf_reports]
+    taf += damaged_reports(taf, rng)
+    date_time = inputs.taf_reports[0][0]
+    for report in taf:
+        deduplicated = fetchData.remove_duplicates_in_report(report)
+        match = fetchData.taf_pattern.match(deduplicated)
+        if fetchData.taf_token_groups(report) != (match.groupdict() if match else None):
+            differences.append(('TAF groups', report))
+        elif not same_values(fetchData.parse_taf_block(date_time, report, parser='tokens'),
+                             fetchData.parse_taf_block(date_time, deduplicated, parser='regex')):
+            differences.append(('parse_taf_block', report))
+
+    for data_type in ('METAR', 'TAF'):
+        for cloud_format in ('list', 'columns'):
+            frames = [fetchData.load_data(data_type, 'test', file_name=f'synthetic_{inputs.scale}', base_dir=base_dir,
+                                          cloud_format=cloud_format, parser=parser) for parser in ('regex', 'tokens')]
+            try:
+                pd.testing.assert_frame_equal(*frames)
+            except AssertionError as error:
+                differences.append((f'load_data_{data_type}[{cloud_format}]', str(error)))
+    return differences
+
+def value_types(df):
+    """Types of the values of the object columns of a frame, which assert_frame_equal does not compare."""
+    return {name: sorted({type(value).__name__ for value in df[name]})
+            for name, dtype in df.dtypes.items() if dtype == object}
+
+def check_cache(inputs, base_dir):
+    """Return the differences between cold and warm ParseCache loads on the inputs of one scale."""
+    differences = []
+    for file_format in fetchData.ParseCache.formats:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = fetchData.ParseCache(cache_dir, file_format=file_format)
+            for data_type in ('METAR', 'TAF'):
+                for options in cache_check_options:
+                    cold, warm = [fetchData.load_data(data_type, 'test', file_name=f'synthetic_{inputs.scale}',
+                                                      base_dir=base_dir, cache=cache, **options) for _ in range(2)]
+                    name = f'{file_format} {data_type} {options}'
+                    try:
+                        pd.testing.assert_frame_equal(cold, warm)
+                    except AssertionError as error:
+                        differences.append((name, str(error)))
+                    if value_types(cold) != value_types(warm):
+                        differences.append((name, f'{value_types(cold)} != {value_types(warm)}'))
+    return differences
+
+def benchmarks(inputs, base_dir):
+    """Return (name, function, number of items, unit) of every benchmark of one scale."""
+    scale = inputs.scale
+
+    def get_dataset():
+        with h5py.File(inputs.cwam_path, 'r') as file:
+            fetchData.get_dataset(file)
+
+    return [
+        (f'parse_metar_line[{scale}x]', lambda: parse_metar_lines(inputs.metar_pairs), inputs.num_metar, 'reports'),
+        (f'parse_metar_batch[{scale}x]', lambda: fetchData.parse_metar_batch(inputs.metar_pairs),
+         inputs.num_metar, 'reports'),
+        (f'parse_metar_batch_regex[{scale}x]', lambda: fetchData.parse_metar_batch(inputs.metar_pairs, parser='regex'),
+         inputs.num_metar, 'reports'),
+        (f'parse_taf_block[{scale}x]', lambda: parse_taf_blocks(inputs.taf_reports), inputs.num_taf, 'reports'),
+        (f'parse_taf_block_regex[{scale}x]', lambda: parse_taf_blocks(inputs.taf_reports, 'regex'),
+         inputs.num_taf, 'reports'),
+        (f'parse_cloud_layers[{scale}x]', lambda: fetchData.parse_cloud_layers(inputs.cloud_groups),
+         len(inputs.cloud_groups), 'groups'),
+        (f'get_dataset[{scale}x]', get_dataset, inputs.num_polygons, 'polygons'),
+        (f'load_data_METAR[{scale}x]', lambda: fetchData.load_data(
+            'METAR', 'test', file_name=f'synthetic_{scale}', base_dir=base_dir), inputs.num_metar, 'reports'),
+        (f'load_data_METAR_regex[{scale}x]', lambda: fetchData.load_data(
+            'METAR', 'test', file_name=f'synthetic_{scale}', base_dir=base_dir, parser='regex'),
+         inputs.num_metar, 'reports'),
+        (f'load_data_METAR_arrow[{scale}x]', lambda: fetchData.load_data(
+            'METAR', 'test', file_name=f'synthetic_{scale}', base_dir=base_dir, output='arrow'),
+         inputs.num_metar, 'reports'),
+        (f'load_data_METAR_cached[{scale}x]', lambda: fetchData.load_data(
+            'METAR', 'test', file_name=f'synthetic_{scale}', base_dir=base_dir, cache=True),
+         inputs.num_metar, 'reports'),
+        (f'load_data_METAR_dedupe[{scale}x]', lambda: fetchData.load_data(
+            'METAR', 'test', file_name=f'synthetic_{scale}', base_dir=base_dir, dedupe=True),
+         inputs.num_metar, 'reports'),
+        (f'load_data_TAF[{scale}x]', lambda: fetchData.load_data(
+            'TAF', 'test', file_name=f'synthetic_{scale}', base_dir=base_dir), inputs.num_taf, 'reports'),
+        (f'load_data_TAF_regex[{scale}x]', lambda: fetchData.load_data(
+            'TAF', 'test', file_name=f'synthetic_{scale}', base_dir=base_dir, parser='regex'),
+         inputs.num_taf, 'reports'),
+        (f'load_data_TAF_cached[{scale}x]', lambda: fetchData.load_data(
+            'TAF', 'test', file_name=f'synthetic_{scale}', base_dir=base_dir, cache=True),
+         inputs.num_taf, 'reports'),
+        (f'load_data_TAF_arrow[{scale}x]', lambda: fetchData.load_data(
+            'TAF', 'test', file_name=f'synthetic_{scale}', base_dir=base_dir, output='arrow'),
+         inputs.num_taf, 'reports'),
+        (f'load_data_CWAM[{scale}x]', lambda: fetchData.load_data(
+            'CWAM', 'test', 'part_1', '09', '01', inputs.cwam_name, base_dir=base_dir),
+         inputs.num_polygons, 'polygons'),
+        (f'load_data_CWAM_arrow[{scale}x]', lambda: fetchData.load_data(
+            'CWAM', 'test', 'part_1', '09', '01', inputs.cwam_name, base_dir=base_dir, output='arrow'),
+         inputs.num_polygons, 'polygons')
+    ]
+
+def fuser_benchmarks(base_dir):
+    """Benchmarks of load_data on the FUSER sample files."""
+    file_names = sample_fuser_inputs(base_dir)
+    if not file_names:
+        return []
+    num_rows = sum(sum(1 for _ in open(os.path.join(base_dir, 'FUSER', purpose, 'KATL', f'{name}.csv'))) - 1
+                   for purpose, name in file_names)
+
+    def load_all(**kwargs):
+        for purpose, file_name in file_names:
+            fetchData.load_data('FUSER', purpose, 'KATL', file_name=file_name, base_dir=base_dir, **kwargs)
+
+    sample_paths = sorted(glob.glob(os.path.join(sample_dir, '*', '*.csv')))
+    return [
+        ('load_data_FUSER[sample]', load_all, num_rows, 'rows'),
+        ('load_data_FUSER_typed[sample]', lambda: load_all(typed=True), num_rows, 'rows'),
+        ('load_data_FUSER_arrow[sample]', lambda: load_all(output='arrow'), num_rows, 'rows'),
+        ('build_feature_tensor[sample]', lambda: fetchData.build_feature_tensor(sample_paths), num_rows, 'rows')
+    ]
+
+def run(scales, repeat, only=None):
+    """
+    Run the benchmarks and return {name: {"throughput", "unit", "seconds", "peak_bytes"}}.
+    Raise an AssertionError first if check_cache or check_parsers finds differences.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as base_dir:
+        cases = fuser_benchmarks(base_dir)
+        for scale in scales:
+            inputs = Inputs(base_dir, scale)
+            differences = check_cache(inputs, base_dir)
+            for name, detail in differences[:10]:
+                print(f"cache difference {name}: {detail}")
+            if differences:
+                raise AssertionError(f"{len(differences)} cache differences at scale {scale}")
+            differences = check_parsers(inputs, base_dir)
+            for name, detail in differences[:10]:
+                print(f"parser difference {name}: {detail!r}")
+            if differences:
+                raise AssertionError(f"{len(differences)} parser differences at scale {scale}")
+            cases += benchmarks(inputs, base_dir)
+
+        for name, func, num_items, unit in cases:
+            if only and not any(part in name for part in only):
+                continue
+            seconds, peak = measure(func, repeat)
+            results[name] = {'throughput': num_items / seconds, 'unit': f'{unit}/s',
+                             'seconds': seconds, 'peak_bytes': peak}
+            print(f"{name:40s} {num_items / seconds:14,.0f} {unit}/s {seconds:9.3f} s "
+                  f"{peak / 2 ** 20:9.1f} MiB peak", flush=True)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Print the change of every benchmark against the baseline, return the names that regressed."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = result['throughput'] / baseline[name]['throughput'] - 1
+        flag = ''
+        if change < -tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:40s} {change:+8.1%} throughput{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10],
+                        help='Synthetic input scales, e.g. 1 10 100 1000')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark, the best one is kept')
+    parser.add_argument('--only', nargs='+', help='Only run benchmarks whose name contains one of these')
+    parser.add_argument('--baseline', help='Baseline JSON file to compare against')
+    parser.add_argument('--save-baseline', help='Write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed throughput drop against the baseline before failing')
+    args = parser.parse_args(argv)
+
+    try:
+        results = run(args.scales, args.repeat, args.only)
+    except AssertionError as error:
+        print(error)
+        return 1
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            json.dump(results, file, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
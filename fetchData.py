@@ -1,9 +1,23 @@
 import os
+import numpy as np
 import pandas as pd
 from datetime import datetime, timezone, timedelta
 from dateutil.relativedelta import relativedelta
 import h5py
 import re
+try:
+    import pyarrow
+    import pyarrow.csv
+except ImportError:
+    pyarrow = None
+import hashlib
+import inspect
+import json
+import pickle
+import time
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 file_extension ={'CWAM' : 'h5',
                  'FUSER' :'csv',
@@ -29,18 +43,52 @@ cloud_cover_dict = {
     "VV": 9    # Vertical Visibility (obscured sky, treated as full overcast)
 }
 
+# Token decoders memoized by token, so the regular expressions run once per distinct group.
+# token_decoders keeps the undecorated functions so set_token_cache_size can rewrap them.
+token_cache_size = 4096
+token_decoders = {}
+
+def _memoized(function):
+    """Put a token decoder behind an LRU cache of token_cache_size tokens."""
+    token_decoders[function.__name__] = function
+    return lru_cache(maxsize=token_cache_size)(function)
+
+def token_cache_info():
+    """Return {decoder name: {"hits", "misses", "maxsize", "currsize"}} of the token decoders."""
+    return {name: globals()[name].cache_info()._asdict() for name in token_decoders}
+
+def clear_token_caches():
+    """Empty the caches of the token decoders and reset their statistics."""
+    for name in token_decoders:
+        globals()[name].cache_clear()
+
+def set_token_cache_size(maxsize):
+    """Rebuild the token decoder caches with room for maxsize tokens each, None for no bound."""
+    global token_cache_size
+    token_cache_size = maxsize
+    for name, function in token_decoders.items():
+        globals()[name] = lru_cache(maxsize=maxsize)(function)
+
+@_memoized
+def decode_cloud_layer(layer):
+    """Return (sky cover, altitude in feet, CB flag) of a cloud layer code, None if it does not match."""
+    # Match cloud layer code, altitude, and CB flag if present
+    match = re.match(r"([A-Z]{3})(\d{3})?(CB)?", layer)
+    if not match:
+        return None
+    cloud_code, altitude, cumulonimbus = match.groups()
+    sky_cover = cloud_cover_dict.get(cloud_code, None)  # Get sky cover value
+    altitude_ft = int(altitude) * 100 if altitude else None  # Convert altitude to feet if present
+    cb_flag = 1 if cumulonimbus else 0  # Cumulonimbus flag (1 for CB, 0 otherwise)
+    return sky_cover, altitude_ft, cb_flag
+
 def parse_cloud_layers(cloud_layers):
     """Convert cloud layer codes to structured data for modeling."""
     parsed_layers = []
     for layer in cloud_layers:
-        # Match cloud layer code, altitude, and CB flag if present
-        match = re.match(r"([A-Z]{3})(\d{3})?(CB)?", layer)
-        if match:
-            cloud_code, altitude, cumulonimbus = match.groups()
-            sky_cover = cloud_cover_dict.get(cloud_code, None)  # Get sky cover value
-            altitude_ft = int(altitude) * 100 if altitude else None  # Convert altitude to feet if present
-            cb_flag = 1 if cumulonimbus else 0  # Cumulonimbus flag (1 for CB, 0 otherwise)
-
+        decoded = decode_cloud_layer(layer)
+        if decoded:
+            sky_cover, altitude_ft, cb_flag = decoded
             # Append the structured cloud data
             parsed_layers.append({
                 "sky_cover": sky_cover,           # Numerical sky cover level
@@ -49,9 +97,168 @@ def parse_cloud_layers(cloud_layers):
             })
     return parsed_layers
 
+# Fixed-width cloud columns: layers kept per report, and the sky covers that make a ceiling (BKN, OVC, VV)
+cloud_layer_count = 4
+ceiling_sky_covers = [cloud_cover_dict['BKN'], cloud_cover_dict['OVC'], cloud_cover_dict['VV']]
+cloud_group_pattern = re.compile(r'(FEW|SCT|BKN|OVC|NSC|VV|NCD|CLR|SKC|///)(\d{3})?(CB)?')
+
+def cloud_layer_names(num_layers=cloud_layer_count):
+    """Names of the columns of cloud_layer_columns."""
+    return ([f'sky_cover_{i}' for i in range(1, num_layers + 1)] +
+            [f'altitude_ft_{i}' for i in range(1, num_layers + 1)] +
+            [f'cb_{i}' for i in range(1, num_layers + 1)] +
+            ['ceiling_ft', 'max_sky_cover', 'any_cb'])
+
+def cloud_layer_columns(clouds, num_layers=cloud_layer_count):
+    """
+    Decode cloud groups into fixed-width numeric columns, one row per report.
+
+    Every distinct cloud group string is decoded once. Unlike parse_cloud_layers, VV layers are
+    kept, so they count for the ceiling.
+
+    Parameters:
+    - clouds (array): Cloud group strings, e.g. "FEW030 BKN250CB", None for no clouds.
+    - num_layers (int): Layers kept per report, the lowest ones as reported.
+
+    Returns:
+    - Dict of float32 arrays sky_cover_1..N, altitude_ft_1..N and cb_1..N, padded with NaN,
+      ceiling_ft (lowest BKN, OVC or VV layer), max_sky_cover and the bool any_cb, all computed
+      over every layer of the report.
+    """
+    codes, uniques = pd.factorize(pd.Series(clouds, dtype=object).fillna(''))
+    shape = (len(uniques), num_layers)
+    sky_cover = np.full(shape, np.nan, dtype=np.float32)
+    altitude_ft = np.full(shape, np.nan, dtype=np.float32)
+    cb = np.full(shape, np.nan, dtype=np.float32)
+    ceiling_ft = np.full(len(uniques), np.nan, dtype=np.float32)
+    max_sky_cover = np.full(len(uniques), np.nan, dtype=np.float32)
+    any_cb = np.zeros(len(uniques), dtype=bool)
+
+    for row, value in enumerate(uniques):
+        layers = []
+        for layer in value.split():
+            match = cloud_group_pattern.match(layer)
+            if match:
+                cloud_code, altitude, cumulonimbus = match.groups()
+                layers.append((cloud_cover_dict.get(cloud_code, np.nan),
+                               int(altitude) * 100 if altitude else np.nan, 1 if cumulonimbus else 0))
+        if not layers:
+            continue
+        layers = np.array(layers, dtype=np.float32)
+        kept = layers[:num_layers]
+        sky_cover[row, :len(kept)], altitude_ft[row, :len(kept)], cb[row, :len(kept)] = kept.T
+        ceiling = layers[np.isin(layers[:, 0], ceiling_sky_covers), 1]
+        if not np.isnan(ceiling).all():
+            ceiling_ft[row] = np.nanmin(ceiling)
+        if not np.isnan(layers[:, 0]).all():
+            max_sky_cover[row] = np.nanmax(layers[:, 0])
+        any_cb[row] = layers[:, 2].any()
+
+    columns = {}
+    for name, values in (('sky_cover', sky_cover), ('altitude_ft', altitude_ft), ('cb', cb)):
+        for i in range(num_layers):
+            columns[f'{name}_{i + 1}'] = values[codes, i]
+    columns.update(ceiling_ft=ceiling_ft[codes], max_sky_cover=max_sky_cover[codes], any_cb=any_cb[codes])
+    return columns
+
+def expand_cloud_layers(df, num_layers=cloud_layer_count):
+    """
+    Replace the raw "clouds" column of records parsed with decode_clouds=False by the
+    cloud_layer_columns, at the same position.
+    """
+    if df.empty or 'clouds' not in df.columns:
+        return df
+    position = df.columns.get_loc('clouds')
+    columns = pd.DataFrame(cloud_layer_columns(df['clouds'], num_layers), index=df.index)
+    return pd.concat([df.iloc[:, :position], columns, df.iloc[:, position + 1:]], axis=1)
+
 def get_defult_base_dir():
     return defult_base_dir
 
+class LoadStats:
+    """
+    Opt-in instrumentation of load_data and the parsers, passed as their stats argument.
+
+    Wall time is accumulated per file and stage ("read", "split", "match", "post-process",
+    "frame") and records are counted per file, parser and outcome ("matched", "rejected",
+    "fallback", "duplicate"). The same LoadStats can be passed to many load_data calls. Without stats the
+    parsers only pay for an "is not None" check.
+
+    Parameters:
+    - callback (callable): Called with a dict for every stage time ({"file", "stage", "seconds"})
+      and every count ({"file", "parser", "outcome", "count"}).
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.file = None
+        self.times = {}
+        self.counts = {}
+
+    @contextmanager
+    def track(self, file_path):
+        """Attribute the stages and counts inside the block to file_path."""
+        previous, self.file = self.file, file_path
+        try:
+            yield self
+        finally:
+            self.file = previous
+
+    @contextmanager
+    def stage(self, name):
+        """Add the wall time of the block to a stage."""
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, stage, seconds):
+        key = (self.file, stage)
+        self.times[key] = self.times.get(key, 0.0) + seconds
+        if self.callback is not None:
+            self.callback({'file': self.file, 'stage': stage, 'seconds': seconds})
+
+    def count(self, parser, outcome, count=1):
+        if not count:
+            return
+        key = (self.file, parser, outcome)
+        self.counts[key] = self.counts.get(key, 0) + int(count)
+        if self.callback is not None:
+            self.callback({'file': self.file, 'parser': parser, 'outcome': outcome, 'count': int(count)})
+
+    def timings(self):
+        """DataFrame with the seconds of every file and stage."""
+        return pd.DataFrame([(file, stage, seconds) for (file, stage), seconds in self.times.items()],
+                            columns=['file', 'stage', 'seconds'])
+
+    def counters(self):
+        """DataFrame with the record count of every file, parser and outcome."""
+        return pd.DataFrame([key + (count,) for key, count in self.counts.items()],
+                            columns=['file', 'parser', 'outcome', 'count'])
+
+    def summary(self):
+        """Totals over all files, {"seconds": {stage: seconds}, "counts": {parser: {outcome: count}}}."""
+        seconds = {}
+        for (_, stage), value in self.times.items():
+            seconds[stage] = seconds.get(stage, 0.0) + value
+        counts = {}
+        for (_, parser, outcome), value in self.counts.items():
+            counts.setdefault(parser, {})
+            counts[parser][outcome] = counts[parser].get(outcome, 0) + value
+        return {'seconds': seconds, 'counts': counts}
+
+    def reset(self):
+        self.times.clear()
+        self.counts.clear()
+
+    def __repr__(self):
+        return f"LoadStats({self.summary()})"
+
+def _stage(stats, name):
+    """Time a stage on stats, or do nothing without stats."""
+    return stats.stage(name) if stats is not None else nullcontext()
+
 # Enhanced METAR pattern to capture complex remarks and additional fields
 metar_pattern = re.compile(
     r'^(?P<station>[A-Z0-9]{4})\s+'                        # Station code
@@ -68,10 +275,12 @@ metar_pattern = re.compile(
 )
 
 # Parse METAR report
-def parse_metar_line(date_time, line):
+def parse_metar_line(date_time, line, stats=None):
     match = metar_pattern.match(line)
     if match:
         data = match.groupdict()
+        if stats is not None:
+            stats.count('metar', 'matched')
 
         # Convert `date_time` to UTC format
         try:
@@ -80,6 +289,8 @@ def parse_metar_line(date_time, line):
             data['date_time'] = pd.to_datetime(data['date_time'], utc=True)
         except ValueError as e:
             data['date_time'] = None
+            if stats is not None:
+                stats.count('metar', 'fallback')
 
         # AUTO handling
         data['auto'] = True if data.get('clouds') == 'AUTO' else False
@@ -146,8 +357,239 @@ def parse_metar_line(date_time, line):
             if field in data:
                 del data[field]
         return data
+    if stats is not None:
+        stats.count('metar', 'rejected')
     return None
 
+# Date lines in METAR and TAF text files, e.g. "2022/09/01 00:52"
+date_line_pattern = re.compile(r'\d{4}/\d{2}/\d{2} \d{2}:\d{2}')
+
+@_memoized
+def decode_date_line(date_time):
+    """Return a date line as a UTC Timestamp, None if it is not a valid date. Reports of a date line share it."""
+    try:
+        utc_date = datetime.strptime(date_time, "%Y/%m/%d %H:%M").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return pd.to_datetime(utc_date.strftime("%Y-%m-%d %H:%M:%S"), utc=True)
+
+# Conversion tables for parse_metar_batch. Wind speeds have two digits and pressure values
+# four, so every possible value is converted once with the same rounding as parse_metar_line.
+knots_to_mps = np.array([round(speed * 0.514444, 2) for speed in range(100)])
+kmh_to_mps = np.array([round(speed / 3.6, 2) for speed in range(100)])
+inhg_to_hpa = np.array([round(value * 33.8639 / 100, 2) for value in range(10000)])
+
+def pair_metar_lines(lines):
+    """
+    Pair every METAR report with the date line right above it.
+
+    Parameters:
+    - lines (list): Raw lines of a METAR file.
+
+    Returns:
+    - DataFrame with a "date_time" and a "report" column, one row per report.
+    """
+    lines = pd.Series([line.strip() for line in lines], dtype=object)
+    lines = lines[lines != ''].reset_index(drop=True)
+    is_date = lines.str.match(date_line_pattern).astype(bool)
+
+    # Only the line directly after a date line is a report, other lines are ignored
+    is_report = ~is_date & is_date.shift(1, fill_value=False)
+    return pd.DataFrame({
+        'date_time': lines.shift(1)[is_report].to_numpy(),
+        'report': lines[is_report].to_numpy()
+    })
+
+# Text columns of the METAR frames and the type pandas gives a column of strings and None, so a
+# batch without any COR report still has the column types of a whole file
+metar_text_columns = ['station', 'datetime', 'cor', 'weather']
+text_dtype = pd.Series(['', None]).dtype
+
+def _none_if_missing(values):
+    """Replace missing values with None, like the dictionaries of parse_metar_line."""
+    values = values.astype(object)
+    return values.where(values.notna(), None).tolist()
+
+def cloud_layers_arrow_type():
+    """Arrow type of the cloud_layers column: a list of parse_cloud_layers structs."""
+    return pyarrow.list_(pyarrow.struct([('sky_cover', pyarrow.int64()), ('altitude_ft', pyarrow.int64()),
+                                         ('cumulonimbus', pyarrow.int64())]))
+
+def report_arrow_types(data_type):
+    """
+    Arrow types of the METAR or TAF columns that hold Python objects, so that a column with
+    only missing values keeps its type instead of becoming a null column.
+    """
+    if data_type == 'METAR':
+        return {**{name: pyarrow.string() for name in ('station', 'datetime', 'cor', 'weather')},
+                'visibility_meters': pyarrow.int64()}
+    types = {name: pyarrow.int64() for name in ('wind_speed_kt', 'wind_gust_kt', 'visibility_meters', 'qnh_hpa',
+                                                'variable_wind_from', 'variable_wind_to', 'max_temp_value',
+                                                'min_temp_value')}
+    types.update(station=pyarrow.string(), issue_datetime=pyarrow.string(), weather=pyarrow.string(),
+                 additional_sections=pyarrow.string(), cloud_layers=cloud_layers_arrow_type())
+    return types
+
+def _arrow_table(columns, types=None):
+    """
+    Build a pyarrow.Table from a dictionary of columns: numpy arrays, pandas Series, lists or
+    pyarrow arrays. Numeric buffers are used without copying them, NaN and None become nulls.
+    types maps column names to Arrow types, the others are inferred.
+    """
+    types = {} if types is None else types
+    return pyarrow.table({name: values if isinstance(values, (pyarrow.Array, pyarrow.ChunkedArray))
+                          else pyarrow.array(values, type=types.get(name), from_pandas=True)
+                          for name, values in columns.items()})
+
+def _arrow_output(df, types=None):
+    """pyarrow.Table of a DataFrame built by load_data, without its index. Null columns take their types."""
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    for name, arrow_type in ({} if types is None else types).items():
+        position = table.schema.get_field_index(name)
+        if position < 0:
+            continue
+        inferred = table.schema.field(position).type
+        if pyarrow.types.is_null(inferred) or (pyarrow.types.is_list(inferred)
+                                               and pyarrow.types.is_null(inferred.value_type)):
+            table = table.set_column(position, name, table.column(position).cast(arrow_type))
+    return table
+
+def _arrow_cloud_layers(clouds):
+    """cloud_layers column of cloud groups as an Arrow list array, decoded once per distinct group."""
+    codes, groups = pd.factorize(clouds)
+    layers = pyarrow.array([parse_cloud_layers(group.strip().split()) for group in groups],
+                           type=cloud_layers_arrow_type())
+    return layers.take(pyarrow.array(codes, type=pyarrow.int32()))
+
+def parse_metar_batch(source, stats=None, cloud_format='list', num_cloud_layers=cloud_layer_count,
+                      output='dataframe', parser='tokens'):
+    """
+    Parse many METAR reports at once with column-wise string extraction and unit conversion.
+
+    Parameters:
+    - source (str, DataFrame or list): The whole content of a METAR file, the output of
+      pair_metar_lines, or a list of (date_time, line) pairs.
+    - stats (LoadStats): Optional stage timer and record counter, reports with a date line that
+      does not parse are counted as "fallback".
+    - cloud_format (str): "list" for the cloud_layers column of parse_cloud_layers dictionaries,
+      "columns" for the numeric columns of cloud_layer_columns in its place.
+    - num_cloud_layers (int): Layers kept with cloud_format "columns".
+    - output (str): "dataframe", or "arrow" for a pyarrow.Table built from the same columns, with
+      cloud_layers as a list of structs (cloud_layers_arrow_type).
+    - parser (str): "tokens" to match the reports with extract_metar_tokens, "regex" with
+      metar_pattern. Both give the same groups.
+
+    Returns:
+    - DataFrame with the same rows, columns and values as calling parse_metar_line on every report
+      (with cloud_format "list"), or a pyarrow.Table.
+    """
+    with _stage(stats, 'split'):
+        if isinstance(source, str):
+            source = pair_metar_lines(source.split('\n'))
+        elif not isinstance(source, pd.DataFrame):
+            source = pd.DataFrame(list(source), columns=['date_time', 'report'], dtype=object)
+
+    with _stage(stats, 'match'):
+        if parser == 'tokens':
+            groups = extract_metar_tokens(source['report'])
+        elif parser == 'regex':
+            groups = source['report'].astype(object).str.extract(metar_pattern)
+        else:
+            raise ValueError(f"Unsupported parser: {parser}")
+        matched = groups['station'].notna().to_numpy()
+    if stats is not None:
+        stats.count('metar', 'rejected', len(matched) - matched.sum())
+    if output not in ('dataframe', 'arrow'):
+        raise ValueError(f"Unsupported output: {output}")
+    if not matched.any():
+        return pd.DataFrame() if output == 'dataframe' else pyarrow.table({})
+    with _stage(stats, 'post-process'):
+        columns = _metar_columns(groups[matched].reset_index(drop=True),
+                                 source['date_time'][matched].reset_index(drop=True), cloud_format, num_cloud_layers,
+                                 arrow=output == 'arrow')
+    if stats is not None:
+        stats.count('metar', 'matched', len(columns['station']))
+        stats.count('metar', 'fallback', columns['date_time'].isna().sum())
+    with _stage(stats, 'frame'):
+        if output == 'arrow':
+            return _arrow_table(columns, report_arrow_types('METAR'))
+        return pd.DataFrame(columns).astype(dict.fromkeys(metar_text_columns, text_dtype))
+
+def _metar_columns(groups, date_times, cloud_format='list', num_cloud_layers=cloud_layer_count, arrow=False):
+    """
+    Output columns of parse_metar_batch from the matched METAR groups and their date lines, with
+    arrow the cloud_layers column is an Arrow array.
+    """
+    size = len(groups)
+
+    # Temperature and dewpoint, "M" marks negative values and "//" missing ones
+    temperature = pd.to_numeric(groups['temperature'].str.replace('M', '-'), errors='coerce')
+    dewpoint = pd.to_numeric(groups['dewpoint'].str.replace('M', '-'), errors='coerce')
+
+    # Visibility conversion (to meters)
+    visibility = groups['visibility']
+    visibility_meters = np.full(size, np.nan)
+    is_miles = visibility.str.contains('SM', regex=False).fillna(False).to_numpy(dtype=bool)
+    is_digits = visibility.str.isdigit().fillna(False).to_numpy(dtype=bool)
+    miles = pd.to_numeric(visibility[is_miles].str.replace('SM', '')).to_numpy(dtype=float)
+    visibility_meters[is_miles] = np.trunc(miles * 1609.34)
+    visibility_meters[is_digits] = visibility[is_digits].astype(int).to_numpy()
+    visibility_meters[(visibility == 'CAVOK').to_numpy()] = 10000
+    if not np.isnan(visibility_meters).any():
+        # Whole meters, int64 like the frames of parse_metar_line when no visibility is missing
+        visibility_meters = visibility_meters.astype(np.int64)
+
+    # Wind speed conversion (to m/s) from the first two digits of the wind group
+    wind = groups['wind']
+    has_wind = (wind.notna() & ~wind.str.contains('/////', regex=False).fillna(True)).to_numpy(dtype=bool)
+    wind_speed = pd.to_numeric(wind.str.extract(r'(\d{2})', expand=False)).fillna(0).to_numpy(dtype=int)
+    is_knots = has_wind & wind.str.contains('KT', regex=False).fillna(False).to_numpy(dtype=bool)
+    is_kmh = has_wind & ~is_knots & wind.str.contains('KMH', regex=False).fillna(False).to_numpy(dtype=bool)
+    is_mps = has_wind & ~is_knots & ~is_kmh & wind.str.contains('MPS', regex=False).fillna(False).to_numpy(dtype=bool)
+    wind_speed_mps = np.full(size, np.nan)
+    wind_speed_mps[is_knots] = knots_to_mps[wind_speed[is_knots]]
+    wind_speed_mps[is_kmh] = kmh_to_mps[wind_speed[is_kmh]]
+    wind_speed_mps[is_mps] = wind_speed[is_mps]
+
+    # Pressure handling with unit conversion, inHg (A) to hPa (Q)
+    pressure_indicator = groups['pressure_indicator']
+    pressure_value = pd.to_numeric(groups['pressure_value'], errors='coerce')
+    has_pressure = pressure_value.notna().to_numpy()
+    pressure_value = pressure_value.fillna(0).to_numpy(dtype=int)
+    is_inhg = has_pressure & (pressure_indicator == 'A').to_numpy()
+    is_hpa = has_pressure & (pressure_indicator == 'Q').to_numpy()
+    pressure = np.full(size, np.nan)
+    pressure[is_inhg] = inhg_to_hpa[pressure_value[is_inhg]]
+    pressure[is_hpa] = pressure_value[is_hpa]
+
+    # Cloud layers are decoded once per distinct cloud group
+    clouds = groups['clouds'].fillna('')
+    if cloud_format == 'columns':
+        cloud_columns = cloud_layer_columns(clouds, num_cloud_layers)
+    elif cloud_format == 'list' and arrow:
+        cloud_columns = {'cloud_layers': _arrow_cloud_layers(clouds)}
+    elif cloud_format == 'list':
+        # Every row gets its own list and dictionaries, so editing one row leaves the others as they are
+        cloud_layers = {value: parse_cloud_layers(value.strip().split()) for value in clouds.unique()}
+        cloud_columns = {'cloud_layers': [[dict(layer) for layer in cloud_layers[value]] for value in clouds]}
+    else:
+        raise ValueError(f"Unsupported cloud format: {cloud_format}")
+
+    return {
+        'station': _none_if_missing(groups['station']),
+        'datetime': _none_if_missing(groups['datetime']),
+        'cor': _none_if_missing(groups['cor']),
+        'auto': (groups['clouds'] == 'AUTO').to_numpy(),
+        'weather': _none_if_missing(groups['weather']),
+        'temperature': temperature,
+        'dewpoint': dewpoint,
+        'date_time': pd.to_datetime(date_times, format="%Y/%m/%d %H:%M", utc=True, errors='coerce'),
+        **cloud_columns,
+        'visibility_meters': visibility_meters,
+        'wind_speed_mps': wind_speed_mps,
+        'pressure': pressure
+    }
+
 taf_pattern = re.compile(
     r'^(?:PART\s+\d+(?:\s+OF(?:\s+\d+)?)?\s+)?'                           # Optional PART X OF Y
     r'(?:TAF\s+)*'                                               # Allow multiple TAF prefixes
@@ -244,29 +686,20 @@ def process_validity(data):
     data['valid_end_date'] = valid_end_date
     return data
 
-def process_wind(data):
-    """Processes the wind field, extracts direction and speed, and converts units to knots if necessary."""
-    # Extract the wind field
-    wind_str = data.get('wind')
-    if wind_str is None:
-        # Set default values for missing wind data
-        data['has_wind'] = 0
-        data['wind_is_variable'] = 0
-        data['wind_direction'] = -2
-        data['wind_speed_kt'] = None
-        data['wind_gust_kt'] = None
-        return data
+@_memoized
+def decode_wind(wind_str):
+    """
+    Decode a TAF wind group, e.g. "27010G20KT".
 
+    Returns:
+    - (has_wind, wind_is_variable, wind_direction, wind_speed_kt, wind_gust_kt), speeds in knots.
+      Unrecognized groups give (0, 0, -1, None, None).
+    """
     # Use regex to match and extract components of the wind string
     match = re.match(r'^(VRB|\d{3})?([/?]?\d{2,3})(G[/?]?\d{2,3})?(KT|MPS|KMH)?$', wind_str)
     if not match:
         # Set defaults for unrecognized wind patterns
-        data['has_wind'] = 0
-        data['wind_is_variable'] = 0
-        data['wind_direction'] = -1
-        data['wind_speed_kt'] = None
-        data['wind_gust_kt'] = None
-        return data
+        return 0, 0, -1, None, None
 
     # Extract matched components
     direction, speed, gust, unit = match.groups()
@@ -284,12 +717,24 @@ def process_wind(data):
         speed = round(speed * 0.539957) if speed else None  # KMH to KT
         gust = round(gust * 0.539957) if gust else None
 
+    return 1 if speed is not None else 0, 1 if direction == -1 else 0, direction, speed, gust
+
+def process_wind(data):
+    """Processes the wind field, extracts direction and speed, and converts units to knots if necessary."""
+    # Extract the wind field
+    wind_str = data.get('wind')
+    if wind_str is None:
+        # Set default values for missing wind data
+        data['has_wind'] = 0
+        data['wind_is_variable'] = 0
+        data['wind_direction'] = -2
+        data['wind_speed_kt'] = None
+        data['wind_gust_kt'] = None
+        return data
+
     # Update data dictionary with processed values
-    data['has_wind'] = 1 if speed is not None else 0
-    data['wind_is_variable'] = 1 if direction == -1  else 0
-    data['wind_direction'] = direction
-    data['wind_speed_kt'] = speed
-    data['wind_gust_kt'] = gust
+    (data['has_wind'], data['wind_is_variable'], data['wind_direction'],
+     data['wind_speed_kt'], data['wind_gust_kt']) = decode_wind(wind_str)
     return data
 
 weather_mapping = {
@@ -327,18 +772,13 @@ intensity_mapping = {
     None: 1.0  # Standard intensity
 }
 
-def process_weather(data):
-    """Processes the 'weather' field in the data dictionary to assign a score based on intensity and type."""
-    weather_str = data.get('weather', None)
-    if not weather_str:
-        data['weather_score'] = 0  # Default score if no weather data is present
-        return data
-
+@_memoized
+def decode_weather(weather_str):
+    """Return the score of a weather group, e.g. "-RA", 0 for unrecognized groups."""
     # Extract intensity and weather type
     match = re.match(r'^(\+|-)?([A-Z]{2,6})$', weather_str)
     if not match:
-        data['weather_score'] = 0  # Default score for unrecognized patterns
-        return data
+        return 0  # Default score for unrecognized patterns
 
     # Get the intensity and weather code
     intensity, weather_code = match.groups()
@@ -346,12 +786,34 @@ def process_weather(data):
     # Calculate score based on weather code and intensity
     base_score = weather_mapping.get(weather_code, 0)  # Get base score for weather type
     multiplier = intensity_mapping.get(intensity, 1.0)  # Apply multiplier based on intensity
-    score = base_score * multiplier
+    return base_score * multiplier
+
+def process_weather(data):
+    """Processes the 'weather' field in the data dictionary to assign a score based on intensity and type."""
+    weather_str = data.get('weather', None)
+    if not weather_str:
+        data['weather_score'] = 0  # Default score if no weather data is present
+        return data
 
     # Update data dictionary with calculated weather score
-    data['weather_score'] = score
+    data['weather_score'] = decode_weather(weather_str)
     return data
 
+@_memoized
+def decode_qnh(qnh_str):
+    """Return a QNH group, e.g. "QNH2992INS", in HPA, None for unrecognized groups."""
+    # Match QNH format
+    match = re.match(r'QNH(\d{4})(INS|HPA)?', qnh_str)
+    if not match:
+        return None  # Default for unrecognized patterns
+    qnh_value, unit = match.groups()
+    qnh_value = int(qnh_value)
+
+    # Convert INS to HPA if necessary
+    if unit == "INS":
+        qnh_value = round(qnh_value * 33.8639)  # 1 inHg = 33.8639 hPa
+    return qnh_value
+
 def process_qnh(data):
     """
     Process the 'qnh' field to a unified unit in HPA.
@@ -364,19 +826,7 @@ def process_qnh(data):
         data['qnh_hpa'] = None
         return data
 
-    # Match QNH format
-    match = re.match(r'QNH(\d{4})(INS|HPA)?', qnh_str)
-    if match:
-        qnh_value, unit = match.groups()
-        qnh_value = int(qnh_value)
-
-        # Convert INS to HPA if necessary
-        if unit == "INS":
-            qnh_value = round(qnh_value * 33.8639)  # 1 inHg = 33.8639 hPa
-        data['qnh_hpa'] = qnh_value
-    else:
-        data['qnh_hpa'] = None  # Default for unrecognized patterns
-
+    data['qnh_hpa'] = decode_qnh(qnh_str)
     return data
 
 def process_variable_wind(data):
@@ -456,6 +906,138 @@ def convert_temp_to_datetime(data):
 
     return data
 
+# Column-wise TAF time resolution. The helpers work on datetime64[ns] arrays and follow
+# process_validity and convert_temp_to_datetime, including the day clipping of relativedelta.
+one_day = np.timedelta64(1, 'D')
+one_hour = np.timedelta64(1, 'h')
+
+def _days_in_month(months):
+    """Number of days of every datetime64[M] value."""
+    return ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+
+def _add_month(times):
+    """Add one month like relativedelta(months=1), clipping the day to the end of the new month."""
+    months = times.astype('datetime64[M]')
+    days = times.astype('datetime64[D]')
+    day = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+    next_months = months + 1
+    day = np.minimum(day, _days_in_month(next_months))
+    return next_months.astype('datetime64[D]') + (day - 1) * one_day + (times - days)
+
+def _roll_forward(times, limits):
+    """Add months to every time before its limit, like the while loops of process_validity."""
+    before = times < limits
+    for _ in range(24):
+        if not before.any():
+            break
+        times[before] = _add_month(times[before])
+        before = times < limits
+    return times
+
+def _taf_field(values, size):
+    """Turn a day or hour field into a float array, missing values become NaN."""
+    if values is None:
+        return np.full(size, np.nan)
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+def _resolve_temperature_times(base, day, hour):
+    """Column-wise calculate_temperature_time of convert_temp_to_datetime."""
+    months = base.astype('datetime64[M]')
+    month_start = months.astype('datetime64[D]')
+    minutes = (base - base.astype('datetime64[h]'))
+    missing = np.isnan(day) | np.isnan(hour) | np.isnat(base)
+    day = np.nan_to_num(day).astype(np.int64)
+    hour = np.nan_to_num(hour).astype(np.int64) % 24
+
+    fits = (day >= 1) & (day <= _days_in_month(months))
+    times = np.where(
+        fits,
+        month_start + (day - 1) * one_day + hour * one_hour + minutes,
+        # Day outside the month: first of the next month, then day - 2 days later
+        (months + 1).astype('datetime64[D]') + hour * one_hour + minutes + (day - 2) * one_day
+    ).astype('datetime64[ns]')
+    times[missing] = np.datetime64('NaT')
+    return _roll_forward(times, base)
+
+def resolve_taf_times(date_times, valid_start_day, valid_start_hour, valid_end_day, valid_end_hour,
+                      max_temp_day=None, max_temp_hour=None, min_temp_day=None, min_temp_hour=None):
+    """
+    Resolve TAF validity and temperature times for many reports at once.
+
+    Gives the same valid_start_date, valid_end_date, max_temperature_time and min_temperature_time
+    as process_validity and convert_temp_to_datetime, using NumPy datetime64 arithmetic. Month
+    rollover and hour 24 are handled the same way. Reports that make process_validity raise,
+    e.g. a validity starting at hour 24, get NaT.
+
+    Parameters:
+    - date_times (array): Report date times (the date line of the TAF file).
+    - valid_start_day, valid_start_hour, valid_end_day, valid_end_hour (array): Validity fields.
+    - max_temp_day, max_temp_hour, min_temp_day, min_temp_hour (array): Optional TX/TN fields,
+      missing values give NaT.
+
+    Returns:
+    - DataFrame with the four UTC datetime columns, one row per report.
+    """
+    base = pd.to_datetime(pd.Series(date_times), utc=True).dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+    size = len(base)
+    months = base.astype('datetime64[M]')
+    month_start = months.astype('datetime64[D]')
+    minutes = base - base.astype('datetime64[h]')
+
+    # Validity start: the start day and hour in the month of the report
+    start_day = _taf_field(valid_start_day, size)
+    start_hour = _taf_field(valid_start_hour, size)
+    missing = np.isnan(start_day) | np.isnan(start_hour) | np.isnat(base)
+    start_day = np.nan_to_num(start_day).astype(np.int64)
+    start_hour = np.nan_to_num(start_hour).astype(np.int64)
+    fits = (start_day >= 1) & (start_day <= _days_in_month(months))
+    # Otherwise the next month, the day clipped to its length (day 0 keeps the report day)
+    next_months = months + 1
+    next_day = np.where(start_day == 0, (base.astype('datetime64[D]') - month_start).astype(np.int64) + 1, start_day)
+    next_day = np.minimum(next_day, _days_in_month(next_months))
+    start_dates = np.where(fits, month_start + (start_day - 1) * one_day,
+                           next_months.astype('datetime64[D]') + (next_day - 1) * one_day)
+    valid_start = (start_dates + start_hour * one_hour + minutes).astype('datetime64[ns]')
+    valid_start[missing | (start_hour < 0) | (start_hour > 23)] = np.datetime64('NaT')
+    valid_start = _roll_forward(valid_start, base)
+
+    # Validity end: hour 24 is hour 0, counted in days from the first of the report month
+    end_day = _taf_field(valid_end_day, size)
+    end_hour = _taf_field(valid_end_hour, size)
+    missing = np.isnan(end_day) | np.isnan(end_hour) | np.isnat(valid_start)
+    end_day = np.nan_to_num(end_day).astype(np.int64)
+    end_hour = np.nan_to_num(end_hour).astype(np.int64) % 24
+    valid_end = (month_start + (end_day - 1) * one_day + end_hour * one_hour).astype('datetime64[ns]')
+    valid_end[missing] = np.datetime64('NaT')
+    valid_end = _roll_forward(valid_end, valid_start)
+
+    max_temperature_time = _resolve_temperature_times(base, _taf_field(max_temp_day, size),
+                                                      _taf_field(max_temp_hour, size))
+    min_temperature_time = _resolve_temperature_times(base, _taf_field(min_temp_day, size),
+                                                      _taf_field(min_temp_hour, size))
+
+    return pd.DataFrame({
+        'valid_start_date': pd.to_datetime(valid_start, utc=True),
+        'valid_end_date': pd.to_datetime(valid_end, utc=True),
+        'max_temperature_time': pd.to_datetime(max_temperature_time, utc=True),
+        'min_temperature_time': pd.to_datetime(min_temperature_time, utc=True)
+    })
+
+def resolve_taf_frame(df, stats=None):
+    """
+    Fill the validity and temperature datetimes of TAF rows parsed with resolve_times=False
+    and drop their day and hour fields. stats (LoadStats) counts rows whose validity could not
+    be resolved as "fallback".
+    """
+    if df.empty:
+        return df
+    times = resolve_taf_times(*(df[field] for field in ['date_time'] + taf_time_fields))
+    if stats is not None:
+        stats.count('taf', 'fallback', times['valid_start_date'].isna().sum())
+    for column in times.columns:
+        df[column] = times[column]
+    return df.drop(columns=taf_time_fields)
+
 def process_probability(data):
     prob_str = data.get('probability', None)
 
@@ -480,31 +1062,52 @@ def remove_duplicates_in_report(report):
     return ' '.join(result)
 
 # Parse TAF report
-def parse_taf_block(date_time, line):
-    """Parse a full TAF block into its components."""
+# Day and hour fields of parse_taf_block that resolve_taf_times turns into datetimes
+taf_time_fields = ['valid_start_day', 'valid_start_hour', 'valid_end_day', 'valid_end_hour',
+                   'max_temp_day', 'max_temp_hour', 'min_temp_day', 'min_temp_hour']
 
-    # Regex pattern to match main TAF components across multiple lines
-    match = taf_pattern.match(line)
+def parse_taf_block(date_time, line, resolve_times=True, stats=None, decode_clouds=True, parser='tokens'):
+    """
+    Parse a full TAF block into its components.
+    With resolve_times False, the validity and temperature datetimes are left as None and the
+    day and hour fields of taf_time_fields are kept, so resolve_taf_frame can resolve them in bulk.
+    With decode_clouds False, the raw "clouds" group is kept instead of cloud_layers, for
+    expand_cloud_layers. stats (LoadStats) counts matched and rejected blocks.
+    parser "tokens" matches the block with taf_token_groups, which also removes repeated words,
+    "regex" with taf_pattern. Both give the same groups.
+    """
 
-    if match:
-        data = match.groupdict()
+    if parser == 'tokens':
+        data = taf_token_groups(line)
+    elif parser == 'regex':
+        # Regex pattern to match main TAF components across multiple lines
+        match = taf_pattern.match(line)
+        data = match.groupdict() if match else None
+    else:
+        raise ValueError(f"Unsupported parser: {parser}")
 
+    if data is not None:
         # Convert `date_time` to UTC format
-        try:
-            utc_date = datetime.strptime(date_time, "%Y/%m/%d %H:%M").replace(tzinfo=timezone.utc)
-            data['date_time'] = utc_date.strftime("%Y-%m-%d %H:%M:%S")
-            data['date_time'] = pd.to_datetime(data['date_time'], utc=True)
-        except ValueError as e:
+        data['date_time'] = decode_date_line(date_time)
+        if data['date_time'] is None:
+            if stats is not None:
+                stats.count('taf', 'rejected')
             return None
+        if stats is not None:
+            stats.count('taf', 'matched')
 
-        # Amended handling
-        data['amended'] = True if data.get('amended') == 'AMD' else False
+        # Amended handling, the group keeps the whitespace after AMD
+        data['amended'] = True if (data.get('amended') or '').strip() == 'AMD' else False
 
         # corection handling
-        data['corection'] = True if data.get('corection') == 'COR' else False
+        data['corection'] = True if (data.get('corection') or '').strip() == 'COR' else False
 
         # validity date handling
-        data = process_validity(data)
+        if resolve_times:
+            data = process_validity(data)
+        else:
+            data['valid_start_date'] = None
+            data['valid_end_date'] = None
 
         data = process_wind(data)
 
@@ -532,55 +1135,1646 @@ def parse_taf_block(date_time, line):
 
         data = process_weather(data)
 
-        clouds = data.get('clouds')
-        data['cloud_layers'] = parse_cloud_layers(clouds.strip().split()) if clouds else []
+        if decode_clouds:
+            clouds = data.get('clouds')
+            data['cloud_layers'] = parse_cloud_layers(clouds.strip().split()) if clouds else []
 
         data = process_qnh(data)
 
         data = process_variable_wind(data)
 
-        data = convert_temp_to_datetime(data)
+        if resolve_times:
+            data = convert_temp_to_datetime(data)
+        else:
+            data['max_temperature_time'] = None
+            data['min_temperature_time'] = None
         data = process_probability(data)
         fields_to_drop = ['valid_start_day', 'valid_start_hour', 'valid_end_hour', 'valid_end_day',
                            'wind', 'clouds', 'qnh', 'variable_wind', 'max_temp_day', 'max_temp_hour'
                            , 'min_temp_day', 'min_temp_hour', 'max_temp', 'min_temp', 'validity',
                            'prob_value', 'visibility']
+        if not resolve_times:
+            fields_to_drop = [field for field in fields_to_drop if field not in taf_time_fields]
+        if not decode_clouds:
+            fields_to_drop.remove('clouds')
         for field in fields_to_drop:
             if field in data:
                 del data[field]
         return data
+    if stats is not None:
+        stats.count('taf', 'rejected')
     return None
 
+def split_taf_reports(lines, parser='tokens'):
+    """
+    Split the lines of a TAF file into (date_time, report) pairs.
+
+    The lines after a date line are joined and split on "=" into reports. With parser "regex"
+    repeated words of every report are removed, parser "tokens" leaves them to taf_token_groups.
+    """
+    splitter = TafStreamParser(parser=parser)
+    return splitter.split(lines) + splitter.split_pending()
+
+# Token parser of parser="tokens". A report is split on whitespace once and its groups are
+# classified left to right: every group is matched against the group patterns of the fields still
+# open, in the order of metar_pattern and taf_pattern, so a report costs time linear in its length.
+# The group patterns are the pieces of the full patterns and a step keeps their exact semantics,
+# a group that only partly matches hands the rest of its characters to the next fields. A TAF
+# report drops its repeated groups in the same pass, like remove_duplicates_in_report.
+metar_token_fields = [
+    ('cor', r'(?P<cor>COR\s+)'),
+    ('auto', r'(?P<auto>AUTO\s+)'),
+    ('wind', r'(?P<wind>(VRB|\d{3}|/////)\d{2}(G\d{2})?(KT|MPS|KMH)?\s*)'),
+    # Continues the wind group when it follows the wind
+    ('variable_wind', r'(?P<wind>\d{3}V\d{3})\s*'),
+    ('visibility', r'(?P<visibility>////|CAVOK|\d{4}(SM|NDV)?|[0-9]+SM)\s*'),
+    ('weather', r'(?P<weather>[\+\-]?[A-Z]{2,6}\s*)'),
+    ('clouds', r'(?P<clouds>(FEW|SCT|BKN|OVC|NSC|VV|NCD|CLR|SKC|///)\d{0,3}(CB)?\s*)'),
+    ('temperature', r'(?P<temperature>M?\d{2}|//)/(?P<dewpoint>M?\d{2}|//)\s+'),
+    ('pressure', r'(?P<pressure_indicator>[QA])(?P<pressure_value>\d{4}|////)(=)?\s*'),
+    ('rmk', r'(?P<has_rmk>RMK\s+)')
+]
+metar_token_patterns = [re.compile(pattern) for _, pattern in metar_token_fields]
+metar_group_names = list(metar_pattern.groupindex)
+metar_station_pattern = re.compile(r'[A-Z0-9]{4}')
+metar_datetime_pattern = re.compile(r'\d{2}\d{4}Z')
+# Step state after the last field, the rest of the report is not matched
+metar_token_end = len(metar_token_fields)
+# The field patterns only see digits through \d, so groups are classified by their shape with
+# every digit replaced by 0 and a batch has few distinct shapes to step
+token_shape_table = str.maketrans('123456789', '000000000')
+# A group and the whitespace after it, for reports with other whitespace than single spaces
+token_separator_pattern = re.compile(r'(\S+)(\s*)')
+
+@_memoized
+def metar_token_step(state, token, separator):
+    """
+    Match one group of a METAR report and the whitespace after it, from field index state on.
+
+    Parameters:
+    - state (int): Index in metar_token_fields of the first field still open.
+    - token (str): The group.
+    - separator (str): The whitespace after the group, "" for the last group.
+
+    Returns:
+    - Tuple of the state of the next group, metar_token_end when the report ends in this group,
+      and the (group index in metar_group_names, start, end) character spans of the fields it fills.
+    """
+    text = token + separator
+    position = 0
+    spans = []
+    while state < metar_token_end:
+        match = metar_token_patterns[state].match(text, position)
+        if match is None:
+            # Without a wind group there is no variable wind
+            state += 2 if metar_token_fields[state][0] == 'wind' else 1
+            continue
+        for name, (start, end) in zip(match.re.groupindex, (match.span(name) for name in match.re.groupindex)):
+            if start >= 0:
+                spans.append((metar_group_names.index(name), start, end))
+        position = match.end()
+        if metar_token_fields[state][0] != 'clouds':
+            state += 1
+        if position == len(text):
+            return state, tuple(spans)
+    return metar_token_end, tuple(spans)
+
+def metar_token_groups(report):
+    """
+    Match a METAR report group by group.
+
+    Returns:
+    - Tuple of the metar_pattern groups in metar_group_names order, None when the report does
+      not match. The values are the ones of metar_pattern.match.
+    """
+    if not report or report[0].isspace():
+        return None
+    parts = list(token_separator_pattern.finditer(report))
+    if (len(parts) < 2 or not parts[0].group(2) or not parts[1].group(2)
+            or not metar_station_pattern.fullmatch(parts[0].group(1))
+            or not metar_datetime_pattern.fullmatch(parts[1].group(1))):
+        return None
+    groups = [parts[0].group(1), parts[1].group(1)] + [None] * (len(metar_group_names) - 2)
+    starts = {}
+    ends = {}
+    state = 0
+    for part in parts[2:]:
+        state, spans = metar_token_step(state, part.group(1), part.group(2))
+        for index, start, end in spans:
+            starts.setdefault(index, part.start() + start)
+            ends[index] = part.start() + end
+        if state == metar_token_end:
+            break
+    for index, start in starts.items():
+        groups[index] = report[start:ends[index]]
+    clouds = metar_group_names.index('clouds')
+    if groups[clouds] is None:
+        groups[clouds] = ''
+    return tuple(groups)
+
+def extract_metar_tokens(reports):
+    """
+    Match many METAR reports with the token parser, column by column: the reports are split in
+    one pass, every distinct group is classified once, and the groups at the same position of all
+    reports are stepped together.
+
+    Parameters:
+    - reports (Series): METAR reports.
+
+    Returns:
+    - DataFrame of the metar_pattern groups with the index of reports, like
+      reports.str.extract(metar_pattern).
+    """
+    index = reports.index
+    # Values that are not text do not match, like with str.extract
+    reports = [report if isinstance(report, str) else '' for report in reports.tolist()]
+    size = len(reports)
+    text = ' \n '.join(reports)
+    if text.count('\n') != size - 1:
+        # A report with a line break of its own goes through metar_token_groups
+        broken = [row for row, report in enumerate(reports) if '\n' in report]
+        return _replace_rows(extract_metar_tokens(pd.Series([report if '\n' not in report else ''
+                                                             for report in reports], index=index)), broken, reports)
+    tokens = text.translate(token_shape_table).split(' ')
+    codes, uniques = pd.factorize(np.array(tokens, dtype=object))
+    uniques = list(uniques)
+    lengths = np.fromiter(map(len, uniques), dtype=np.int64, count=len(uniques))
+    # Character offset of every group in text
+    offsets = np.zeros(len(codes), dtype=np.int64)
+    np.cumsum(lengths[codes[:-1]] + 1, out=offsets[1:])
+    newline = uniques.index('\n') if '\n' in uniques else -1
+    is_break = codes == newline
+    report_index = np.cumsum(is_break)
+    codes, offsets, report_index = codes[~is_break], offsets[~is_break], report_index[~is_break]
+    counts = np.bincount(report_index, minlength=size)
+    firsts = np.cumsum(counts) - counts
+
+    # Reports with other whitespace than single spaces go through metar_token_groups
+    irregular_token = np.array([not token or not token.isprintable() for token in uniques], dtype=bool)
+    irregular = np.bincount(report_index, weights=irregular_token[codes], minlength=size) > 0
+    irregular |= counts == 0
+    is_station = np.array([bool(metar_station_pattern.fullmatch(token)) for token in uniques], dtype=bool)
+    is_datetime = np.array([bool(metar_datetime_pattern.fullmatch(token)) for token in uniques], dtype=bool)
+    matched = ~irregular & (counts >= 3)
+    matched[matched] = (is_station[codes[firsts[matched]]] & is_datetime[codes[firsts[matched] + 1]])
+
+    num_groups = len(metar_group_names)
+    starts = np.full((size, num_groups), -1, dtype=np.int64)
+    ends = np.full((size, num_groups), -1, dtype=np.int64)
+    rows = np.flatnonzero(matched)
+    for group in (0, 1):
+        starts[rows, group] = offsets[firsts[rows] + group]
+        ends[rows, group] = starts[rows, group] + lengths[codes[firsts[rows] + group]]
+
+    # Step ids of (state, group code, last group) and their next states and spans, numbered per batch
+    step_ids = np.full((metar_token_end, len(uniques), 2), -1, dtype=np.int64)
+    steps = []
+    state = np.where(matched, 0, metar_token_end)
+    position = 2
+    while True:
+        active = np.flatnonzero((state < metar_token_end) & (counts > position))
+        if not len(active):
+            break
+        token_index = firsts[active] + position
+        keys = (state[active], codes[token_index], (counts[active] == position + 1).astype(np.int64))
+        ids = step_ids[keys]
+        if (ids < 0).any():
+            for key in set(zip(*(part[ids < 0].tolist() for part in keys))):
+                step_ids[key] = len(steps)
+                steps.append(metar_token_step(key[0], uniques[key[1]], '' if key[2] else ' '))
+            ids = step_ids[keys]
+            step_states = np.array([next_state for next_state, _ in steps], dtype=np.int64)
+            step_spans = np.full((len(steps), max(len(spans) for _, spans in steps), 3), -1, dtype=np.int64)
+            for step, (_, spans) in enumerate(steps):
+                if spans:
+                    step_spans[step, :len(spans)] = spans
+        state[active] = step_states[ids]
+        for slot in range(step_spans.shape[1]):
+            spans = step_spans[ids, slot]
+            filled = spans[:, 0] >= 0
+            if not filled.any():
+                continue
+            span_rows, groups = active[filled], spans[filled, 0]
+            token_starts = offsets[token_index[filled]]
+            first = starts[span_rows, groups] < 0
+            starts[span_rows[first], groups[first]] = token_starts[first] + spans[filled, 1][first]
+            ends[span_rows, groups] = token_starts + spans[filled, 2]
+        position += 1
+
+    columns = {}
+    for group, name in enumerate(metar_group_names):
+        values = np.full(size, np.nan, dtype=object)
+        present = np.flatnonzero(starts[:, group] >= 0)
+        values[present] = [text[start:end] for start, end in zip(starts[present, group].tolist(),
+                                                                  ends[present, group].tolist())]
+        columns[name] = values
+    columns['clouds'][matched & (starts[:, metar_group_names.index('clouds')] < 0)] = ''
+    return _replace_rows(pd.DataFrame(columns, index=index, dtype=object), np.flatnonzero(irregular), reports)
+
+def _replace_rows(groups, rows, reports):
+    """Set the rows of an extract_metar_tokens frame to the metar_token_groups of their reports."""
+    for row in rows:
+        values = metar_token_groups(reports[row])
+        if values is not None:
+            groups.iloc[row] = [np.nan if value is None else value for value in values]
+    return groups
+
+taf_group_names = list(taf_pattern.groupindex)
+taf_empty_groups = dict.fromkeys(taf_group_names)
+# Wind, visibility and weather of taf_pattern, up to the whitespace that must follow them. They
+# can give back characters to each other, so they are matched together on the next three groups.
+taf_slot_pattern = re.compile(taf_pattern.pattern[taf_pattern.pattern.index('(?P<wind>'):
+                                                  taf_pattern.pattern.index('(?P<clouds>')])
+taf_token_fields = [
+    ('clouds', r'(?P<clouds>(FEW|SCT|BKN|OVC|NSC|VV|NCD|CLR|SKC|///)\d{3}(CB)?\s*)'),
+    ('qnh', r'(?P<qnh>QNH\d{4}(INS|HPA)?)\s*'),
+    ('variable_wind', r'(?P<variable_wind>WND\s+\d{3}V\d{3})\s*'),
+    ('max_temp', r'(?P<max_temp>TX(?P<max_temp_value>M?\d{2})/'
+                 r'(?P<max_temp_day>\d{2})(?P<max_temp_hour>\d{2})Z\s*)'),
+    ('min_temp', r'(?P<min_temp>TN(?P<min_temp_value>M?\d{2})/'
+                 r'(?P<min_temp_day>\d{2})(?P<min_temp_hour>\d{2})Z\s*)'),
+    ('probability', r'(?P<probability>PROB(?P<prob_value>\d{2}))\s*')
+]
+taf_token_patterns = [re.compile(pattern) for _, pattern in taf_token_fields]
+
+@_memoized
+def taf_slot_step(window):
+    """
+    Match the wind, visibility and weather of a TAF report after its validity.
+
+    Parameters:
+    - window (str): The next three groups joined by spaces, with a space after them when the
+      report goes on.
+
+    Returns:
+    - Tuple of the number of groups taken, 0 when they do not match, and the (name, start, end)
+      character spans of the groups they fill.
+    """
+    match = taf_slot_pattern.match(window)
+    if match is None:
+        return 0, ()
+    spans = tuple((name, match.start(name), match.end(name)) for name in match.re.groupindex
+                  if match.start(name) >= 0)
+    return match.group().count(' '), spans
+
+def taf_token_tail(text, position):
+    """
+    Match the groups of a TAF report after its weather, field by field in the order of taf_pattern
+    from character position on. Each field is tried once, clouds as often as they repeat, so the
+    rest of the report is read once.
+
+    Returns:
+    - Tuple of the (name, start, end) character spans of the fields it fills and the position
+      additional_sections starts at.
+    """
+    spans = []
+    for (field, _), pattern in zip(taf_token_fields, taf_token_patterns):
+        match = pattern.match(text, position)
+        while match is not None:
+            for name in pattern.groupindex:
+                if match.start(name) >= 0:
+                    spans.append((name, match.start(name), match.end(name)))
+            position = match.end()
+            match = pattern.match(text, position) if field == 'clouds' else None
+    return spans, position
+
+def _is_taf_station(token):
+    """True when token matches \\w{4}: str.isalnum is \\w without the underscore."""
+    return len(token) == 4 and (token.isalnum() or token.replace('_', 'A').isalnum())
+
+def _taf_headers(tokens):
+    """
+    Yield every way taf_pattern can match the groups before the wind of a TAF report without
+    repeated words, in the order the regular expression tries them: (AMD taken, COR taken, index
+    of the station, issue time taken, index of the validity).
+    """
+    size = len(tokens)
+    if not size:
+        return
+    parts = [0]
+    if size > 2 and tokens[0] == 'PART' and tokens[1].isdecimal():
+        parts = [2, 0]
+        if tokens[2] == 'OF':
+            parts = [3, 2, 0] if size > 3 else parts
+            if size > 4 and tokens[3].isdecimal():
+                parts = [4, 3, 2, 0]
+    for part in parts:
+        # "TAF" is in the report once at most
+        for prefix in ((part + 1, part) if tokens[part] == 'TAF' and part + 1 < size else (part,)):
+            for amended in ((1, 0) if tokens[prefix] == 'AMD' and prefix + 1 < size else (0,)):
+                flagged = prefix + amended
+                for corrected in ((1, 0) if tokens[flagged] == 'COR' and flagged + 1 < size else (0,)):
+                    station = flagged + corrected
+                    if station + 2 >= size or not _is_taf_station(tokens[station]):
+                        continue
+                    second = station + 2 < size and _is_taf_station(tokens[station + 1])
+                    for issue in ((station + 2, station + 1) if second else (station + 1,)):
+                        token = tokens[issue]
+                        issued = (issue + 1 < size and len(token) == 7 and token[6] == 'Z'
+                                  and token[:6].isdecimal())
+                        for validity in ((issue + 1, issue) if issued else (issue,)):
+                            token = tokens[validity]
+                            if (validity + 1 >= size or len(token) != 9 or token[4] != '/'
+                                    or not token[:4].isdecimal() or not token[5:].isdecimal()):
+                                continue
+                            yield amended, corrected, station, validity > issue, validity
+
+def taf_token_groups(report):
+    """
+    Match a TAF report group by group. Repeated words are removed in the same pass, like
+    remove_duplicates_in_report.
+
+    Returns:
+    - Dict of the taf_pattern groups, None when the report does not match. The values are the
+      ones of taf_pattern.match on the report without repeated words.
+    """
+    tokens = list(dict.fromkeys(report.split()))
+    size = len(tokens)
+    for amended, corrected, station, issued, validity in _taf_headers(tokens):
+        wind = validity + 1
+        window = ' '.join(tokens[wind:wind + 3])
+        if size > wind + 3:
+            window += ' '
+        taken, spans = taf_slot_step(window.translate(token_shape_table))
+        if taken:
+            break
+    else:
+        return None
+    text = ' '.join(tokens)
+    groups = taf_empty_groups.copy()
+    if amended:
+        groups['amended'] = 'AMD '
+    if corrected:
+        groups['corection'] = 'COR '
+    groups['station'] = tokens[station]
+    if issued:
+        groups['issue_datetime'] = tokens[validity - 1] + ' '
+    groups['validity'] = token = tokens[validity]
+    groups['valid_start_day'] = token[:2]
+    groups['valid_start_hour'] = token[2:4]
+    groups['valid_end_day'] = token[5:7]
+    groups['valid_end_hour'] = token[7:]
+    for name, start, end in spans:
+        groups[name] = window[start:end]
+    offset = len(text) - len(' '.join(tokens[wind + taken:]))
+    spans, offset = taf_token_tail(text, offset)
+    starts = {}
+    ends = {}
+    for name, start, end in spans:
+        starts.setdefault(name, start)
+        ends[name] = end
+    for name, start in starts.items():
+        groups[name] = text[start:ends[name]]
+    if groups['clouds'] is None:
+        groups['clouds'] = ''
+    groups['additional_sections'] = text[offset:]
+    return groups
+
+# Column types of the compact METAR and TAF frames. Nullable integer types keep missing values,
+# the sky_cover_N, altitude_ft_N and cb_N columns of cloud_layer_columns follow compact_cloud_dtypes.
+compact_dtypes = {
+    'station': 'category', 'datetime': 'category', 'cor': 'category', 'weather': 'category',
+    'issue_datetime': 'category',
+    'auto': 'boolean', 'amended': 'boolean', 'corection': 'boolean', 'has_prob': 'boolean', 'any_cb': 'boolean',
+    'temperature': 'Int8', 'dewpoint': 'Int8', 'max_temp_value': 'Int8', 'min_temp_value': 'Int8',
+    'visibility_meters': 'Int32', 'wind_speed_mps': 'float32', 'pressure': 'float32', 'probability': 'float32',
+    'has_wind': 'Int8', 'wind_is_variable': 'Int8', 'wind_direction': 'Int16', 'wind_speed_kt': 'Int16',
+    'wind_gust_kt': 'Int16', 'weather_score': 'float32', 'qnh_hpa': 'Int32', 'variable_wind_from': 'Int16',
+    'variable_wind_to': 'Int16', 'ceiling_ft': 'Int32', 'max_sky_cover': 'Int8',
+    'date_time': 'datetime64[ns, UTC]', 'valid_start_date': 'datetime64[ns, UTC]',
+    'valid_end_date': 'datetime64[ns, UTC]', 'max_temperature_time': 'datetime64[ns, UTC]',
+    'min_temperature_time': 'datetime64[ns, UTC]'
+}
+compact_cloud_dtypes = {'sky_cover': 'Int8', 'altitude_ft': 'Int32', 'cb': 'Int8'}
+
+def compact_frame(df):
+    """
+    Return a parsed METAR or TAF frame with the smaller column types of compact_dtypes:
+    categorical codes, nullable int8/int16/int32, float32 and datetime64[ns, UTC]. Columns
+    not listed, e.g. cloud_layers or additional_sections, are kept as they are.
+    """
+    columns = {}
+    for column in df.columns:
+        dtype = compact_dtypes.get(column) or compact_cloud_dtypes.get(column.rsplit('_', 1)[0])
+        values = df[column]
+        if dtype is None or values.dtype == dtype:
+            columns[column] = values
+        elif dtype == 'category':
+            columns[column] = values.astype('category')
+        elif dtype.startswith('datetime64'):
+            columns[column] = pd.to_datetime(values, utc=True).dt.as_unit('ns')
+        elif dtype == 'boolean':
+            columns[column] = values.astype('boolean')
+        else:
+            columns[column] = pd.to_numeric(values, errors='coerce').astype(dtype)
+    return pd.DataFrame(columns, index=df.index)
+
+def concat_compact(frames):
+    """Concatenate frames like pd.concat, merging the categories of categorical columns so they stay categorical."""
+    frames = list(frames)
+    columns = {column for frame in frames for column in frame.columns
+               if isinstance(frame[column].dtype, pd.CategoricalDtype)}
+    for column in columns:
+        parts = [frame[column] for frame in frames
+                 if column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)]
+        categories = pd.api.types.union_categoricals(parts, ignore_order=True).categories
+        frames = [frame.assign(**{column: frame[column].astype(pd.CategoricalDtype(categories))})
+                  if column in frame.columns else frame for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+# Versions of one report: METARs of a station with the same observation time, TAFs of a station
+# with the same issue time. data type -> (day and time group column, correction flag columns)
+report_version_columns = {'METAR': ('datetime', ('cor',)), 'TAF': ('issue_datetime', ('amended', 'corection'))}
+
+def resolve_day_times(groups, reference):
+    """
+    Resolve DDHHMMZ groups, e.g. "010048Z", to the matching time in the month of their reference
+    time or the month before or after, whichever is closest.
+
+    Parameters:
+    - groups (array): Day and time groups, missing and malformed ones take their reference time.
+    - reference (array): Reference times in UTC nanoseconds, e.g. of the date lines.
+
+    Returns:
+    - int64 array of UTC nanoseconds, the int64 minimum where the reference is missing.
+    """
+    reference = np.asarray(reference, dtype=np.int64)
+    parts = pd.Series(groups, dtype=object).str.extract(r'^\s*(\d{2})(\d{2})(\d{2})Z')
+    valid = parts[0].notna().to_numpy() & (reference != np.iinfo(np.int64).min)
+    result = reference.copy()
+    if valid.any():
+        day, hour, minute = (parts.loc[valid, column].astype(np.int64).to_numpy() for column in range(3))
+        offset = (((day - 1) * 24 + hour) * 60 + minute).astype('timedelta64[m]')
+        times = reference[valid].astype('datetime64[ns]')
+        month = times.astype('datetime64[M]')
+        candidates = np.stack([(month + months).astype('datetime64[ns]') + offset for months in (-1, 0, 1)])
+        closest = np.abs((candidates - times).astype(np.int64)).argmin(axis=0)
+        result[valid] = candidates[closest, np.arange(len(times))].astype(np.int64)
+    return result
+
+def _report_versions(df, data_type):
+    """Station, report time, corrected flag and receive time (date line) of every row of a METAR or TAF frame."""
+    if data_type not in report_version_columns:
+        raise ValueError(f"Unsupported data type: {data_type}")
+    time_column, flag_columns = report_version_columns[data_type]
+    stations = df['station'].astype(object).where(df['station'].notna(), None).to_numpy()
+    received = _utc_ns(df['date_time'])
+    times = resolve_day_times(df[time_column].astype(object).to_numpy() if time_column in df.columns
+                              else np.full(len(df), None), received)
+    corrected = np.zeros(len(df), dtype=bool)
+    for column in flag_columns:
+        if column in df.columns:
+            # METAR "cor" holds the COR word, the TAF flags are booleans
+            flags = df[column].astype(object).map(bool, na_action='ignore')
+            corrected |= flags.fillna(False).to_numpy(dtype=bool)
+    return stations, times, corrected, received
+
+def dedupe_reports(df, data_type):
+    """
+    Keep one version of every report of a METAR or TAF frame: a corrected (COR) or amended
+    (AMD) version wins over a routine one, then the one received last (date line), then the
+    first one in the frame. Rows without a station or time are kept.
+
+    Parameters:
+    - df (DataFrame): Output of load_data('METAR') or load_data('TAF').
+    - data_type (str): "METAR" or "TAF".
+
+    Returns:
+    - (DataFrame, int): The rows kept, in their order and with their index, and the number of
+      duplicates dropped.
+    """
+    if df.empty:
+        return df, 0
+    stations, times, corrected, received = _report_versions(df, data_type)
+    positions = np.flatnonzero(pd.notna(stations) & (times != np.iinfo(np.int64).min))
+    # Best version first, so the first row of every key in this order is kept
+    order = positions[np.lexsort((positions, ~received[positions], ~corrected[positions]))]
+    duplicated = pd.DataFrame({'station': stations[order], 'time': times[order]}).duplicated().to_numpy()
+    if not duplicated.any():
+        return df, 0
+    keep = np.ones(len(df), dtype=bool)
+    keep[order[duplicated]] = False
+    return df[keep], int(duplicated.sum())
+
+class ReportDeduplicator:
+    """
+    Single pass deduplication of a stream of METAR or TAF frames with a hash index of the best
+    version seen of every (station, report time), ranked like dedupe_reports.
+
+    filter returns the rows that are new or better than the version seen before, so a correction
+    that arrives later is returned again and replaces the earlier version downstream: the last
+    row returned for a report is the one dedupe_reports keeps for the whole stream.
+
+    Parameters:
+    - data_type (str): "METAR" or "TAF".
+    - horizon (str or Timedelta): Forget reports older than this before the newest report time
+      seen, so the index stays small on endless streams. A version arriving after its report was
+      forgotten is returned again. None keeps every report.
+    """
+
+    def __init__(self, data_type, horizon=None):
+        if data_type not in report_version_columns:
+            raise ValueError(f"Unsupported data type: {data_type}")
+        self.data_type = data_type
+        self.horizon = None if horizon is None else pd.Timedelta(horizon).value
+        self.index = {}
+        self.dropped = 0
+        self.newest = np.iinfo(np.int64).min
+        self.next_prune = 1024
+
+    def __len__(self):
+        return len(self.index)
+
+    def filter(self, df):
+        """Return the rows of df that are new or better versions, and count the others in dropped."""
+        df, dropped = dedupe_reports(df, self.data_type)
+        self.dropped += dropped
+        if df.empty:
+            return df
+        stations, times, corrected, received = _report_versions(df, self.data_type)
+        missing = np.iinfo(np.int64).min
+        keep = np.ones(len(df), dtype=bool)
+        for row, (station, report_time, version) in enumerate(zip(stations, times.tolist(),
+                                                                  zip(corrected.tolist(), received.tolist()))):
+            if station is None or report_time == missing:
+                continue
+            key = (station, report_time)
+            seen = self.index.get(key)
+            if seen is not None and version <= seen:
+                keep[row] = False
+            else:
+                self.index[key] = version
+        self.dropped += int(len(df) - keep.sum())
+        if len(times):
+            self.newest = max(self.newest, int(times.max()))
+        if self.horizon is not None and len(self.index) >= self.next_prune:
+            oldest = self.newest - self.horizon
+            self.index = {key: version for key, version in self.index.items() if key[1] >= oldest}
+            self.next_prune = max(1024, 2 * len(self.index))
+        return df if keep.all() else df[keep]
+
+def _report_deduplicator(dedupe, data_type):
+    """ReportDeduplicator of a dedupe argument: a new one for True, None for False, an instance as it is."""
+    if isinstance(dedupe, ReportDeduplicator):
+        return dedupe
+    return ReportDeduplicator(data_type) if dedupe else None
+
+class MetarStreamParser:
+    """
+    Incremental METAR parser for files that keep growing. Like pair_metar_lines, the line right
+    after a date line is a report. The last date line is kept between calls, so a report is
+    parsed as soon as its line arrives.
+
+    Parameters:
+    - cloud_format (str): "list" or "columns", as in parse_metar_batch.
+    - compact (bool): Return the column types of compact_frame.
+    - dedupe (bool or ReportDeduplicator): Drop the reports a ReportDeduplicator has seen a
+      version of at least as good, pass one to share its index and dropped count.
+    - parser (str): "tokens" or "regex", as in parse_metar_batch.
+    """
+
+    def __init__(self, cloud_format='list', compact=False, dedupe=False, parser='tokens'):
+        self.cloud_format = cloud_format
+        self.compact = compact
+        self.deduplicator = _report_deduplicator(dedupe, 'METAR')
+        self.parser = parser
+        self.current_date_time = None
+        self.expecting_report = False
+
+    @property
+    def pending(self):
+        """A METAR is complete with its line, nothing is ever pending."""
+        return False
+
+    def split(self, lines):
+        """Return the (date_time, report) pairs completed by lines."""
+        pairs = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            date_time_match = date_line_pattern.match(line)
+            if date_time_match:
+                self.current_date_time = line
+                self.expecting_report = True
+            elif self.expecting_report:
+                pairs.append((self.current_date_time, line))
+                self.expecting_report = False
+        return pairs
+
+    def feed(self, lines):
+        """Parse the reports completed by lines, return a DataFrame like load_data('METAR')."""
+        pairs = self.split(lines)
+        if not pairs:
+            return pd.DataFrame()
+        df = parse_metar_batch(pairs, cloud_format=self.cloud_format, parser=self.parser)
+        if self.deduplicator is not None:
+            df = self.deduplicator.filter(df).reset_index(drop=True)
+        return compact_frame(df) if self.compact and not df.empty else df
+
+    def flush(self):
+        return pd.DataFrame()
+
+    def reset(self):
+        """Forget the last date line, e.g. when the file starts over."""
+        self.current_date_time = None
+        self.expecting_report = False
+
+class TafStreamParser:
+    """
+    Incremental TAF parser for files that keep growing. It keeps the state of the TAF loop of
+    load_data, the current date line and the lines of the report being read, and parses a
+    report as soon as its closing "=" arrives. A report without "=" ends at the next date line
+    or at flush().
+
+    Parameters:
+    - cloud_format (str): "list" or "columns", as in load_data.
+    - compact (bool): Return the column types of compact_frame.
+    - dedupe (bool or ReportDeduplicator): As in MetarStreamParser.
+    - parser (str): "tokens" or "regex", as in parse_taf_block.
+    """
+
+    def __init__(self, cloud_format='list', compact=False, dedupe=False, parser='tokens'):
+        self.cloud_format = cloud_format
+        self.compact = compact
+        self.deduplicator = _report_deduplicator(dedupe, 'TAF')
+        self.parser = parser
+        self.current_date_time = None
+        self.current_report_lines = []
+
+    @property
+    def pending(self):
+        """True when lines of an unfinished report are buffered."""
+        return bool(self.current_report_lines)
+
+    def _split_reports(self, text):
+        """(date_time, report) pairs of text, split on "=" like the TAF loop of load_data."""
+        reports = []
+        for report in re.split(r'=\s*', text):
+            report = report.strip()
+            if report:
+                # taf_token_groups removes repeated words itself
+                reports.append((self.current_date_time,
+                                report if self.parser == 'tokens' else remove_duplicates_in_report(report)))
+        return reports
+
+    def split(self, lines):
+        """Return the (date_time, report) pairs completed by lines."""
+        reports = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue  # Skip empty lines
+            # Check if the line contains a date-time
+            date_time_match = date_line_pattern.match(line)
+            if date_time_match:
+                # A new date line ends the accumulated report
+                reports += self.split_pending()
+                self.current_date_time = date_time_match.group()
+            elif self.current_date_time is not None:
+                # Continue accumulating lines for the current report, lines before the first
+                # date line have no date and are skipped
+                self.current_report_lines.append(line)
+                if '=' in line:
+                    # Every report before the last "=" is complete, the rest keeps accumulating
+                    full_report, rest = ' '.join(self.current_report_lines).rsplit('=', 1)
+                    reports += self._split_reports(full_report)
+                    self.current_report_lines = [rest] if rest.strip() else []
+        return reports
+
+    def split_pending(self):
+        """Return the reports of the buffered lines and clear them."""
+        reports = self._split_reports(' '.join(self.current_report_lines))
+        self.current_report_lines = []
+        return reports
+
+    def parse(self, reports):
+        """Parse (date_time, report) pairs into a DataFrame like load_data('TAF')."""
+        decode_clouds = self.cloud_format == 'list'
+        data_entries = []
+        for date_time, report in reports:
+            parsed_data = parse_taf_block(date_time, report, resolve_times=False, decode_clouds=decode_clouds,
+                                          parser=self.parser)
+            if parsed_data:
+                data_entries.append(parsed_data)
+        df = resolve_taf_frame(pd.DataFrame(data_entries))
+        if self.deduplicator is not None:
+            df = self.deduplicator.filter(df).reset_index(drop=True)
+        df = expand_cloud_layers(df) if self.cloud_format == 'columns' else df
+        return compact_frame(df) if self.compact and not df.empty else df
+
+    def feed(self, lines):
+        """Parse the reports completed by lines."""
+        return self.parse(self.split(lines))
+
+    def flush(self):
+        """Parse the buffered report, e.g. at the end of a file."""
+        return self.parse(self.split_pending())
+
+    def reset(self):
+        """Forget the date line and the buffered lines, e.g. when the file starts over."""
+        self.current_date_time = None
+        self.current_report_lines = []
+
+def follow_weather_file(file_path, data_type, poll_interval=1.0, from_start=True, idle_flush=None, stop=None,
+                        cloud_format='list', compact=False, dedupe=False, parser='tokens'):
+    """
+    Tail a METAR or TAF text file and yield the reports appended to it as soon as they are
+    complete, without parsing the file again.
+
+    Partial lines are kept until their newline is written. A file that is replaced (log
+    rotation) or truncated below the position already read ends like a file does at stop, and
+    is read again from its start with the parser reset.
+
+    Parameters:
+    - file_path (str): Path of the text file.
+    - data_type (str): "METAR" or "TAF".
+    - poll_interval (float): Seconds to wait when there is no new data.
+    - from_start (bool): Parse the reports already in the file first, otherwise only new ones.
+    - idle_flush (float): Parse a TAF report without its closing "=" after this many seconds
+      without new data, None waits for the next date line.
+    - stop (callable): Called at every poll, the generator flushes and ends when it returns True.
+      None follows the file forever.
+    - cloud_format (str), compact (bool), parser (str): As in load_data.
+    - dedupe (bool or ReportDeduplicator): Drop the versions of reports already yielded unless
+      they are better, see ReportDeduplicator. Pass one to read its dropped count.
+
+    Yields:
+    - Non-empty DataFrames of new records, with the columns of load_data.
+    """
+    if data_type not in ("METAR", "TAF"):
+        raise ValueError(f"Unsupported data type: {data_type}")
+    parser_class = MetarStreamParser if data_type == "METAR" else TafStreamParser
+    stream = parser_class(cloud_format=cloud_format, compact=compact, dedupe=dedupe, parser=parser)
+    # The same encodings as load_data
+    encoding, errors = ('utf-8', 'replace') if data_type == "METAR" else ('ISO-8859-1', 'strict')
+
+    file = open(file_path, 'r', encoding=encoding, errors=errors)
+    try:
+        if not from_start:
+            file.seek(0, os.SEEK_END)
+        buffer = ''
+        last_data = time.monotonic()
+        while True:
+            data = file.read()
+            if data:
+                last_data = time.monotonic()
+                lines = (buffer + data).split('\n')
+                # The last piece has no newline yet, it is kept for the next read
+                buffer = lines.pop()
+                df = stream.feed(lines)
+                if not df.empty:
+                    yield df
+                continue
+
+            if stop is not None and stop():
+                break
+            if idle_flush is not None and stream.pending and time.monotonic() - last_data >= idle_flush:
+                df = stream.flush()
+                if not df.empty:
+                    yield df
+
+            # Start over when the file was truncated or replaced
+            try:
+                current = os.stat(file_path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and (current.st_ino != os.fstat(file.fileno()).st_ino
+                                        or current.st_size < file.tell()):
+                file.close()
+                file = open(file_path, 'r', encoding=encoding, errors=errors)
+                # The reports of the old file end with it, the new file starts without a date line
+                for df in (stream.feed([buffer]), stream.flush()):
+                    if not df.empty:
+                        yield df
+                stream.reset()
+                buffer = ''
+                continue
+            time.sleep(poll_interval)
+
+        # Parse what is left when following stops
+        df = stream.feed([buffer])
+        if not df.empty:
+            yield df
+        df = stream.flush()
+        if not df.empty:
+            yield df
+    finally:
+        file.close()
+
 # CWAM
-def get_dataset(f):
+cwam_root = 'Deviation Probability'
+
+def _normalize_cwam_filter(values):
+    """Turn a CWAM filter argument into a set of strings, None keeps every group."""
+    if values is None:
+        return None
+    if isinstance(values, (str, int, float)):
+        values = [values]
+    return {str(value) for value in values}
+
+def _cwam_group_selected(name, allowed):
+    """
+    Return True if a CWAM group passes a filter. A filter value matches the group name
+    itself or the number in it, e.g. 250 or "250" both select the group "FLVL250".
+    """
+    if allowed is None or name in allowed:
+        return True
+    number = re.search(r'\d+', name)
+    return number is not None and (number.group() in allowed or str(int(number.group())) in allowed)
+
+def iter_cwam_polygons(f, forecast_times=None, flight_levels=None, thresholds=None, contours=None):
+    """
+    Walk the Deviation Probability groups of a CWAM file.
+    Groups outside the filters are never opened and no polygon is read.
+
+    Parameters:
+    - f (h5py.File): Opened CWAM file.
+    - forecast_times (list): Forecast time groups to keep, None keeps all of them.
+    - flight_levels (list): Flight level groups to keep, None keeps all of them.
+    - thresholds (list): Threshold groups to keep, None keeps all of them.
+    - contours (list): Contour groups to keep, None keeps all of them.
+
+    Yields:
+    - (forecast_time, flight_level, contour, threshold, polygon, group) tuples, where
+      group[polygon] is the polygon dataset.
+    """
+    forecast_times = _normalize_cwam_filter(forecast_times)
+    flight_levels = _normalize_cwam_filter(flight_levels)
+    thresholds = _normalize_cwam_filter(thresholds)
+    contours = _normalize_cwam_filter(contours)
+
+    root = f[cwam_root]
+    for forecast_time in root:
+        if not _cwam_group_selected(forecast_time, forecast_times):
+            continue
+        forecast_group = root[forecast_time]
+        for flight_level in forecast_group:
+            if not _cwam_group_selected(flight_level, flight_levels):
+                continue
+            flight_level_group = forecast_group[flight_level]
+            for contour in flight_level_group:
+                if not _cwam_group_selected(contour, contours):
+                    continue
+                contour_group = flight_level_group[contour]
+                for threshold in contour_group:
+                    if not _cwam_group_selected(threshold, thresholds):
+                        continue
+                    threshold_group = contour_group[threshold]
+                    for polygon in threshold_group:
+                        yield forecast_time, flight_level, contour, threshold, polygon, threshold_group
+
+def get_dataset(f, forecast_times=None, flight_levels=None, thresholds=None, contours=None):
+    """
+    Read the polygons of a CWAM file into a DataFrame, one row per polygon.
+    The filters are the same as in iter_cwam_polygons.
+    """
     data_entries = []
-    for forecast_time in f['Deviation Probability']:
-        for flight_level in f[f'Deviation Probability/{forecast_time}']:
-            for contour in f[f'Deviation Probability/{forecast_time}/{flight_level}']:
-                for threshold in f[f'Deviation Probability/{forecast_time}/{flight_level}/{contour}']:
-                    for polygon in f[f'Deviation Probability/{forecast_time}/{flight_level}/{contour}/{threshold}']:
-                        # Construct the full path for the dataset
-                        dataset_name = f'Deviation Probability/{forecast_time}/{flight_level}/{contour}/{threshold}/{polygon}'
-
-                        dataset = f[dataset_name][:]
-                        latitudes, longitudes = dataset[0], dataset[1]
-
-                        fcst = forecast_time
-                        flvl = flight_level
-                        trsh = threshold
-                        poly = polygon
-
-                        data_entries.append({
-                            "Forecast Time (FCST)" : fcst,
-                            "Flight Level (FLVL)" : flvl,
-                            "Threshold (TRSH)" : trsh,
-                            "Polygon Number (POLY)" : poly,
-                            "Latitudes" : latitudes,
-                            "Longitudes" : longitudes
-                        })
+    for fcst, flvl, contour, trsh, poly, group in iter_cwam_polygons(
+            f, forecast_times, flight_levels, thresholds, contours):
+        dataset = group[poly][:]
+        latitudes, longitudes = dataset[0], dataset[1]
+
+        data_entries.append({
+            "Forecast Time (FCST)" : fcst,
+            "Flight Level (FLVL)" : flvl,
+            "Threshold (TRSH)" : trsh,
+            "Polygon Number (POLY)" : poly,
+            "Latitudes" : latitudes,
+            "Longitudes" : longitudes
+        })
     return pd.DataFrame(data_entries)
 
-def load_data(data_type, dataset_purpose, path_level=None, month=None, day=None, file_name=None, base_dir=None):
+cwam_columns = ["Forecast Time (FCST)", "Flight Level (FLVL)", "Threshold (TRSH)", "Polygon Number (POLY)"]
+
+# Short names of the CWAM group levels kept by CWAMPolygonStore, in the order of cwam_columns
+cwam_levels = ['fcst', 'flvl', 'trsh', 'poly']
+
+class CWAMPolygonStore:
+    """
+    CWAM polygons in a ragged array layout.
+
+    The (latitude, longitude) pairs of all polygons live in one float32 coordinates buffer,
+    polygon i spans coordinates[offsets[i]:offsets[i + 1]]. FCST, FLVL, TRSH and POLY are
+    stored as int32 codes, codes["flvl"][i] indexes the group names in labels["flvl"].
+    """
+
+    def __init__(self, coordinates, offsets, codes, labels):
+        self.coordinates = coordinates
+        self.offsets = offsets
+        self.codes = codes
+        self.labels = labels
+
+    @classmethod
+    def from_file(cls, f, forecast_times=None, flight_levels=None, thresholds=None, contours=None):
+        """Read the polygons of an opened CWAM file, the filters are the same as in iter_cwam_polygons."""
+        polygons = []
+        names = {level: [] for level in cwam_levels}
+        for fcst, flvl, contour, trsh, poly, group in iter_cwam_polygons(
+                f, forecast_times, flight_levels, thresholds, contours):
+            polygons.append(np.asarray(group[poly][:2], dtype=np.float32).T)
+            for level, name in zip(cwam_levels, (fcst, flvl, trsh, poly)):
+                names[level].append(name)
+        return cls._from_parts(polygons, names)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Convert the DataFrame returned by get_dataset."""
+        polygons = [np.column_stack([latitudes, longitudes]).astype(np.float32)
+                    for latitudes, longitudes in zip(df["Latitudes"], df["Longitudes"])]
+        names = {level: list(df[column]) for level, column in zip(cwam_levels, cwam_columns)}
+        return cls._from_parts(polygons, names)
+
+    @classmethod
+    def _from_parts(cls, polygons, names):
+        lengths = np.array([len(polygon) for polygon in polygons], dtype=np.int64)
+        offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        coordinates = np.concatenate(polygons) if polygons else np.empty((0, 2), dtype=np.float32)
+
+        codes = {}
+        labels = {}
+        for level in cwam_levels:
+            level_codes, level_labels = pd.factorize(pd.Series(names[level], dtype=object))
+            codes[level] = level_codes.astype(np.int32)
+            labels[level] = np.array([str(label) for label in level_labels], dtype=str)
+        return cls(coordinates, offsets, codes, labels)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def polygon(self, position):
+        """Return the latitudes and longitudes of one polygon as views on the coordinates buffer."""
+        points = self.coordinates[self.offsets[position]:self.offsets[position + 1]]
+        return points[:, 0], points[:, 1]
+
+    def column(self, level):
+        """Return the group names of one level ("fcst", "flvl", "trsh" or "poly") for every polygon."""
+        return self.labels[level][self.codes[level]]
+
+    def to_dataframe(self):
+        """Convert back to the DataFrame format of get_dataset."""
+        df = pd.DataFrame({column: self.column(level) for level, column in zip(cwam_levels, cwam_columns)})
+        points = np.split(self.coordinates.astype(np.float64), self.offsets[1:-1]) if len(self) else []
+        df["Latitudes"] = [polygon[:, 0].copy() for polygon in points]
+        df["Longitudes"] = [polygon[:, 1].copy() for polygon in points]
+        return df
+
+    def to_arrow(self):
+        """
+        Convert to a pyarrow.Table with the columns of get_dataset: the group levels as dictionary
+        arrays over the int32 codes, and "Latitudes" and "Longitudes" as large_list<float> columns,
+        one array each instead of one per polygon. Both use the int64 offsets of the store without
+        copying them, the latitudes and longitudes are copied out of the coordinates buffer.
+        """
+        offsets = pyarrow.array(self.offsets)
+        columns = {column: pyarrow.DictionaryArray.from_arrays(self.codes[level], self.labels[level].tolist())
+                   for level, column in zip(cwam_levels, cwam_columns)}
+        columns["Latitudes"] = pyarrow.LargeListArray.from_arrays(offsets, np.ascontiguousarray(self.coordinates[:, 0]))
+        columns["Longitudes"] = pyarrow.LargeListArray.from_arrays(offsets, np.ascontiguousarray(self.coordinates[:, 1]))
+        return pyarrow.table(columns)
+
+    def _arrays(self):
+        arrays = {'coordinates': self.coordinates, 'offsets': self.offsets}
+        for level in cwam_levels:
+            arrays[f'{level}_codes'] = self.codes[level]
+            arrays[f'{level}_labels'] = self.labels[level]
+        return arrays
+
+    def save(self, path):
+        """
+        Save the store to a ".npz" file, or to a directory of ".npy" files for any other path.
+        Only the directory format can be memory-mapped by load.
+        """
+        if path.endswith('.npz'):
+            np.savez(path, **self._arrays())
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, array in self._arrays().items():
+            np.save(os.path.join(path, f'{name}.npy'), array)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """
+        Load a store written by save.
+
+        Parameters:
+        - path (str): ".npz" file or directory of ".npy" files.
+        - mmap_mode (str): Memory-map the arrays of a directory, e.g. "r". Ignored for ".npz" files.
+        """
+        if path.endswith('.npz'):
+            with np.load(path) as arrays:
+                arrays = {name: arrays[name] for name in arrays.files}
+        else:
+            arrays = {name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+                      for name in os.listdir(path) if name.endswith('.npy')}
+        codes = {level: arrays[f'{level}_codes'] for level in cwam_levels}
+        labels = {level: arrays[f'{level}_labels'] for level in cwam_levels}
+        return cls(arrays['coordinates'], arrays['offsets'], codes, labels)
+
+# Mean earth radius, used to turn degrees into kilometers for CWAM radius queries
+earth_radius_km = 6371.0
+km_per_degree = np.pi / 180 * earth_radius_km
+
+def _expand_ranges(starts, counts):
+    """For ranges [start, start + count), return the owner position and the value of every element."""
+    owners = np.repeat(np.arange(len(counts)), counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owners, np.repeat(starts, counts) + steps
+
+def _level_values(labels):
+    """Return the number in every group name, e.g. 60.0 for "TRSH60", NaN when there is none."""
+    numbers = pd.Series(labels, dtype=object).str.extract(r'(\d+(?:\.\d+)?)', expand=False)
+    return pd.to_numeric(numbers).to_numpy(dtype=float)
+
+class CWAMSpatialIndex:
+    """
+    Spatial index over the polygons of a CWAMPolygonStore.
+
+    Polygon bounding boxes are registered in a regular latitude/longitude grid. Queries look up
+    the grid cells around every point, keep the polygons whose bounding box is close enough and
+    run the point-in-polygon and distance tests for all remaining (point, polygon) pairs at once.
+    """
+
+    def __init__(self, store, cell_size=1.0, chunk_size=10000):
+        """
+        Parameters:
+        - store (CWAMPolygonStore): Polygons to index.
+        - cell_size (float): Grid cell size in degrees.
+        - chunk_size (int): Number of query points handled together, bounds the memory of a query.
+        """
+        self.store = store
+        self.cell_size = cell_size
+        self.chunk_size = chunk_size
+        self.thresholds = _level_values(store.labels['trsh'])[store.codes['trsh']]
+
+        offsets = store.offsets
+        lengths = np.diff(offsets)
+        latitudes = np.asarray(store.coordinates[:, 0], dtype=np.float64)
+        longitudes = np.asarray(store.coordinates[:, 1], dtype=np.float64)
+        self._latitudes = latitudes
+        self._longitudes = longitudes
+
+        # Every vertex starts an edge that ends at the next vertex of the same polygon
+        self._next_vertex = np.arange(1, len(latitudes) + 1)
+        has_points = lengths > 0
+        self._next_vertex[offsets[1:][has_points] - 1] = offsets[:-1][has_points]
+
+        # Bounding box of every polygon, empty polygons get NaN and never match
+        self.bounds = np.full((len(store), 4), np.nan)
+        starts = offsets[:-1][has_points]
+        if len(starts):
+            self.bounds[has_points, 0] = np.minimum.reduceat(latitudes, starts)
+            self.bounds[has_points, 1] = np.maximum.reduceat(latitudes, starts)
+            self.bounds[has_points, 2] = np.minimum.reduceat(longitudes, starts)
+            self.bounds[has_points, 3] = np.maximum.reduceat(longitudes, starts)
+
+        # Register every polygon in all grid cells its bounding box touches
+        polygons = np.flatnonzero(has_points)
+        rows_from = self._cell(self.bounds[polygons, 0])
+        rows_to = self._cell(self.bounds[polygons, 1])
+        cols_from = self._cell(self.bounds[polygons, 2])
+        cols_to = self._cell(self.bounds[polygons, 3])
+        self._col_base = cols_from.min() if len(polygons) else 0
+        self._num_cols = (cols_to.max() - self._col_base + 1) if len(polygons) else 1
+        num_cols = cols_to - cols_from + 1
+        owners, cells = _expand_ranges(np.zeros(len(polygons), dtype=np.int64),
+                                       (rows_to - rows_from + 1) * num_cols)
+        keys = self._cell_key(rows_from[owners] + cells // num_cols[owners],
+                              cols_from[owners] + cells % num_cols[owners])
+        order = np.argsort(keys, kind='stable')
+        self._cell_keys = keys[order]
+        self._cell_polygons = polygons[owners][order]
+
+    def _cell(self, degrees):
+        return np.floor(degrees / self.cell_size).astype(np.int64)
+
+    def _cell_key(self, rows, cols):
+        return rows * self._num_cols + (cols - self._col_base)
+
+    def _polygon_mask(self, forecast_times=None, flight_levels=None, thresholds=None):
+        """Boolean mask of the polygons in the given groups, same matching rules as the load filters."""
+        mask = np.ones(len(self.store), dtype=bool)
+        for level, allowed in (('fcst', forecast_times), ('flvl', flight_levels), ('trsh', thresholds)):
+            allowed = _normalize_cwam_filter(allowed)
+            if allowed is None:
+                continue
+            selected = np.array([_cwam_group_selected(label, allowed) for label in self.store.labels[level]],
+                                dtype=bool)
+            mask &= selected[self.store.codes[level]] if len(selected) else False
+        return mask
+
+    def _candidates(self, latitudes, longitudes, radius_km, mask):
+        """Return (point, polygon) pairs whose bounding boxes are within radius_km of each other."""
+        radius_lat = radius_km / km_per_degree
+        radius_lon = radius_lat / np.maximum(np.cos(np.radians(latitudes)), 1e-6)
+        lat_from, lat_to = latitudes - radius_lat, latitudes + radius_lat
+        lon_from, lon_to = longitudes - radius_lon, longitudes + radius_lon
+
+        # Grid cells around every point, clipped to the columns that hold polygons
+        rows_from, rows_to = self._cell(lat_from), self._cell(lat_to)
+        cols_from = np.maximum(self._cell(lon_from), self._col_base)
+        cols_to = np.minimum(self._cell(lon_to), self._col_base + self._num_cols - 1)
+        num_cols = np.maximum(cols_to - cols_from + 1, 0)
+        points, cells = _expand_ranges(np.zeros(len(latitudes), dtype=np.int64),
+                                       (rows_to - rows_from + 1) * num_cols)
+        keys = self._cell_key(rows_from[points] + cells // np.maximum(num_cols[points], 1),
+                              cols_from[points] + cells % np.maximum(num_cols[points], 1))
+
+        # Polygons registered in those cells
+        first = np.searchsorted(self._cell_keys, keys, side='left')
+        last = np.searchsorted(self._cell_keys, keys, side='right')
+        owners, entries = _expand_ranges(first, last - first)
+        points = points[owners]
+        polygons = self._cell_polygons[entries]
+
+        # A polygon can sit in several cells around a point, keep each pair once
+        pairs = np.unique(points * len(self.store) + polygons)
+        points, polygons = pairs // len(self.store), pairs % len(self.store)
+
+        bounds = self.bounds[polygons]
+        close = (mask[polygons]
+                 & (bounds[:, 0] <= lat_to[points]) & (bounds[:, 1] >= lat_from[points])
+                 & (bounds[:, 2] <= lon_to[points]) & (bounds[:, 3] >= lon_from[points]))
+        return points[close], polygons[close]
+
+    def _pair_edges(self, polygons):
+        """Return the pair position and the first vertex of every edge of the given polygons."""
+        offsets = self.store.offsets
+        return _expand_ranges(offsets[polygons], offsets[polygons + 1] - offsets[polygons])
+
+    def _inside(self, latitudes, longitudes, points, polygons):
+        """Ray casting point-in-polygon test for every (point, polygon) pair."""
+        pairs, vertices = self._pair_edges(polygons)
+        y, x = latitudes[points][pairs], longitudes[points][pairs]
+        y1, x1 = self._latitudes[vertices], self._longitudes[vertices]
+        y2, x2 = self._latitudes[self._next_vertex[vertices]], self._longitudes[self._next_vertex[vertices]]
+        straddles = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crosses = straddles & (x < (x2 - x1) * (y - y1) / (y2 - y1) + x1)
+        return np.bincount(pairs, weights=crosses, minlength=len(polygons)) % 2 == 1
+
+    def _distance_km(self, latitudes, longitudes, points, polygons):
+        """Distance from every point to the outline of its paired polygon, on a local flat projection."""
+        pairs, vertices = self._pair_edges(polygons)
+        lat0, lon0 = latitudes[points][pairs], longitudes[points][pairs]
+        scale = np.cos(np.radians(lat0)) * km_per_degree
+        x1 = (self._longitudes[vertices] - lon0) * scale
+        y1 = (self._latitudes[vertices] - lat0) * km_per_degree
+        x2 = (self._longitudes[self._next_vertex[vertices]] - lon0) * scale
+        y2 = (self._latitudes[self._next_vertex[vertices]] - lat0) * km_per_degree
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(length > 0, np.clip(-(x1 * dx + y1 * dy) / length, 0, 1), 0)
+        distances = np.hypot(x1 + t * dx, y1 + t * dy)
+        starts = np.flatnonzero(np.r_[True, pairs[1:] != pairs[:-1]]) if len(pairs) else pairs
+        return np.minimum.reduceat(distances, starts) if len(pairs) else distances
+
+    def query_radius(self, latitudes, longitudes, radius_km, forecast_times=None, flight_levels=None,
+                     thresholds=None):
+        """
+        Find the polygons that intersect a circle around each point.
+
+        Parameters:
+        - latitudes (array): Latitudes of the points.
+        - longitudes (array): Longitudes of the points.
+        - radius_km (float): Circle radius in kilometers, 0 finds the polygons containing each point.
+        - forecast_times, flight_levels, thresholds (list): Only search these groups, None searches all.
+
+        Returns:
+        - DataFrame with one row per intersecting (point, polygon) pair: the point position, the
+          polygon position in the store, its group names and its distance in kilometers (0 inside).
+        """
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        mask = self._polygon_mask(forecast_times, flight_levels, thresholds)
+
+        found_points, found_polygons, found_distances = [], [], []
+        for start in range(0, len(latitudes), self.chunk_size):
+            chunk_latitudes = latitudes[start:start + self.chunk_size]
+            chunk_longitudes = longitudes[start:start + self.chunk_size]
+            points, polygons = self._candidates(chunk_latitudes, chunk_longitudes, radius_km, mask)
+            inside = self._inside(chunk_latitudes, chunk_longitudes, points, polygons)
+            distances = np.zeros(len(points))
+            outside = ~inside
+            if radius_km > 0:
+                distances[outside] = self._distance_km(chunk_latitudes, chunk_longitudes,
+                                                       points[outside], polygons[outside])
+            else:
+                distances[outside] = np.inf
+            keep = distances <= radius_km
+            found_points.append(points[keep] + start)
+            found_polygons.append(polygons[keep])
+            found_distances.append(distances[keep])
+
+        points = np.concatenate(found_points) if found_points else np.empty(0, dtype=np.int64)
+        polygons = np.concatenate(found_polygons) if found_polygons else np.empty(0, dtype=np.int64)
+        result = pd.DataFrame({'point': points, 'polygon': polygons})
+        for level, column in zip(cwam_levels, cwam_columns):
+            result[column] = self.store.column(level)[polygons]
+        result['distance_km'] = np.concatenate(found_distances) if found_distances else np.empty(0)
+        return result
+
+    def max_threshold(self, latitudes, longitudes, forecast_times=None, flight_levels=None):
+        """
+        Return, for every point, the highest threshold of the polygons covering it,
+        read from the number in the TRSH group name. Points outside every polygon get NaN.
+        """
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        covering = self.query_radius(latitudes, longitudes, 0, forecast_times, flight_levels)
+        result = np.full(len(latitudes), np.nan)
+        np.fmax.at(result, covering['point'].to_numpy(), self.thresholds[covering['polygon'].to_numpy()])
+        return result
+
+class CWAMLazyDataset:
+    """
+    Lazy handle on a CWAM file. Only the group names are listed when it is created,
+    the coordinates of a polygon are read when its row is accessed.
+    Close the handle, or use it in a with statement, when done.
+    """
+
+    def __init__(self, file_path, forecast_times=None, flight_levels=None, thresholds=None, contours=None):
+        self.file_path = file_path
+        self._file = h5py.File(file_path, 'r')
+        self._paths = []
+        index_entries = []
+        for fcst, flvl, contour, trsh, poly, group in iter_cwam_polygons(
+                self._file, forecast_times, flight_levels, thresholds, contours):
+            self._paths.append(f"{group.name}/{poly}")
+            index_entries.append({
+                "Forecast Time (FCST)" : fcst,
+                "Flight Level (FLVL)" : flvl,
+                "Threshold (TRSH)" : trsh,
+                "Polygon Number (POLY)" : poly
+            })
+        # Group names of every polygon, without coordinates
+        self.index = pd.DataFrame(index_entries, columns=cwam_columns)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __getitem__(self, position):
+        """Read one polygon and return it as a row of get_dataset."""
+        dataset = self._file[self._paths[position]][:]
+        row = self.index.iloc[position].to_dict()
+        row["Latitudes"] = dataset[0]
+        row["Longitudes"] = dataset[1]
+        return row
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def read(self, positions=None):
+        """
+        Read polygons into the DataFrame format of get_dataset.
+
+        Parameters:
+        - positions (list): Row positions in index to read, None reads every row.
+        """
+        positions = range(len(self)) if positions is None else positions
+        columns = list(self.index.columns) + ["Latitudes", "Longitudes"]
+        return pd.DataFrame([self[position] for position in positions], columns=columns)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# FUSER file names, e.g. "KATL_2022-09-01.configs_data_set" or "KATL_2022-09-01_2022-09-30.MFS_data_set"
+fuser_file_pattern = re.compile(r'^(?P<airport>\w+)'
+                                r'_(?P<date_range>\d{4}-\d{2}-\d{2}(_\d{4}-\d{2}-\d{2})?)'
+                                r'\.(?P<file_type>\w+)_data_set$')
+
+def extract_file_type(file_name):
+    """Return the file type of a FUSER file name, or None if the name does not follow the convention."""
+    match = fuser_file_pattern.match(file_name)
+    if match:
+        return match.group('file_type')
+    return None
+
+# FUSER file schemas by file type: dtypes of the value columns, timestamp columns (parsed as UTC),
+# categorical columns and the default time column of time_window filters. Columns a file does
+# not have are ignored, columns a schema does not list keep the dtype pandas infers.
+fuser_schemas = {
+    'runways': {
+        'dtypes': {'gufi': 'string'},
+        'timestamps': ['departure_runway_actual_time', 'arrival_runway_actual_time'],
+        'categoricals': ['airport_id', 'departure_runway_actual', 'arrival_runway_actual'],
+        'time_column': 'arrival_runway_actual_time'
+    },
+    'ETD': {
+        'dtypes': {'gufi': 'string'},
+        'timestamps': ['timestamp', 'departure_runway_estimated_time'],
+        'categoricals': ['airport_id'],
+        'time_column': 'departure_runway_estimated_time'
+    },
+    'TFM_track': {
+        'dtypes': {'gufi': 'string'},
+        'timestamps': ['timestamp', 'arrival_runway_estimated_time'],
+        'categoricals': ['airport_id'],
+        'time_column': 'arrival_runway_estimated_time'
+    },
+    'TBFM': {
+        'dtypes': {'gufi': 'string'},
+        'timestamps': ['timestamp', 'arrival_runway_sta'],
+        'categoricals': ['airport_id'],
+        'time_column': 'arrival_runway_sta'
+    },
+    'configs': {
+        'dtypes': {},
+        'timestamps': ['timestamp', 'data_timestamp', 'start_time'],
+        'categoricals': ['airport_id', 'departure_runways', 'arrival_runways'],
+        'time_column': 'start_time'
+    },
+    'LAMP': {
+        'dtypes': {'temperature': 'float32', 'wind_direction': 'float32', 'wind_speed': 'float32',
+                   'wind_gust': 'float32', 'cloud_ceiling': 'float32', 'visibility': 'float32'},
+        'timestamps': ['timestamp', 'forecast_timestamp'],
+        'categoricals': ['airport_id', 'cloud', 'lightning_prob', 'precip'],
+        'time_column': 'forecast_timestamp'
+    },
+    'MFS': {
+        'dtypes': {'gufi': 'string'},
+        'timestamps': [],
+        'categoricals': ['airport_id', 'aircraft_engine_class', 'aircraft_type', 'major_carrier', 'flight_type',
+                         'arrival_aerodrome_icao_name', 'departure_aerodrome_icao_name'],
+        'time_column': None
+    },
+    'first_position': {
+        'dtypes': {'gufi': 'string'},
+        'timestamps': ['time_first_tracked'],
+        'categoricals': ['airport_id'],
+        'time_column': 'time_first_tracked'
+    }
+}
+
+# FUSER files smaller than this are read with the C engine: the pyarrow engine costs more to set up
+# than it saves on files of a few hundred kB, such as the daily sample files. The pyarrow engine also
+# parses timestamps in columns fuser_schemas does not list, the C engine leaves them strings.
+fuser_pyarrow_min_size = 8 * 1024 * 1024
+
+def _fuser_read_plan(file_type, columns, time_window, time_column):
+    """
+    Return the schema, the usecols of read_csv (None for all columns, else a callable that takes
+    the wanted columns the file has) and the time filter column of a FUSER file.
+    """
+    schema = fuser_schemas.get(file_type, {'dtypes': {}, 'timestamps': [], 'categoricals': [], 'time_column': None})
+    if time_window is not None:
+        time_column = time_column or schema['time_column']
+    usecols = None
+    if columns is not None:
+        wanted = set(columns)
+        if time_window is not None:
+            wanted.add(time_column)
+        usecols = wanted.__contains__
+    return schema, usecols, time_column
+
+def _check_time_column(df, file_path, time_column, time_window):
+    """Raise a ValueError when a time window is given and the file has no time_column."""
+    if time_window is not None and time_column not in df.columns:
+        raise ValueError(f"Time window column {time_column} not found in {file_path}")
+
+def _apply_fuser_schema(df, schema, time_column=None, time_window=None):
+    """Parse the timestamps of a FUSER chunk, keep the rows in time_window, then apply the dtypes."""
+    if time_window is not None:
+        start, end = (pd.Timestamp(value, tz='UTC') if value is not None else None for value in time_window)
+        times = pd.to_datetime(df[time_column], utc=True, errors='coerce', format='ISO8601')
+        keep = times.notna()
+        if start is not None:
+            keep &= times >= start
+        if end is not None:
+            keep &= times < end
+        df = df[keep.to_numpy()].copy()
+        df[time_column] = times[keep.to_numpy()]
+
+    for column in schema['timestamps']:
+        if column in df.columns and column != time_column:
+            df[column] = pd.to_datetime(df[column], utc=True, errors='coerce', format='ISO8601')
+    if time_window is None and time_column in df.columns:
+        df[time_column] = pd.to_datetime(df[time_column], utc=True, errors='coerce', format='ISO8601')
+    for column, dtype in schema['dtypes'].items():
+        if column in df.columns:
+            df[column] = df[column].astype(dtype)
+    for column in schema['categoricals']:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+def read_fuser_csv(file_path, file_type=None, columns=None, time_window=None, time_column=None, nrows=None):
+    """
+    Read a FUSER CSV file with the schema of its file type.
+
+    Parameters:
+    - file_path (str): Path of the CSV file.
+    - file_type (str): FUSER file type, e.g. "runways", selects the schema in fuser_schemas.
+    - columns (list): Columns to read, None reads all of them.
+    - time_window (tuple): (start, end) of the rows to keep, start <= time < end, None for no bound.
+    - time_column (str): Column of the time window, defaults to the time column of the schema.
+    - nrows (int): Number of rows to read, None reads the whole file.
+
+    Returns:
+    - DataFrame with typed columns. The time column is kept even when columns does not list it.
+    """
+    schema, usecols, time_column = _fuser_read_plan(file_type, columns, time_window, time_column)
+    dtypes = {column: dtype for column, dtype in schema['dtypes'].items() if dtype != 'string'}
+    # The pyarrow engine parses large files in parallel. The C engine reads small files faster and is
+    # the one that supports nrows and a callable usecols.
+    engine = 'c'
+    if (pyarrow is not None and nrows is None and usecols is None
+            and os.path.getsize(file_path) >= fuser_pyarrow_min_size):
+        engine = 'pyarrow'
+    # An empty dtype mapping is slower to read with than none
+    df = pd.read_csv(file_path, usecols=usecols, dtype=dtypes or None, engine=engine, nrows=nrows)
+    _check_time_column(df, file_path, time_column, time_window)
+    return _apply_fuser_schema(df, schema, time_column, time_window)
+
+def iter_fuser(file_path, file_type=None, columns=None, start=None, end=None, time_column=None,
+               chunksize=100000, assume_sorted=False):
+    """
+    Read a FUSER CSV file in typed chunks, keeping only the rows with start <= time < end.
+    Peak memory is bounded by the chunk size instead of the file size.
+
+    Parameters:
+    - file_path (str): Path of the CSV file.
+    - file_type (str): FUSER file type, selects the schema in fuser_schemas. Defaults to the
+      file type in the file name.
+    - columns (list): Columns to read, None reads all of them.
+    - start, end (str or Timestamp): Time window on time_column, None for no bound.
+    - time_column (str): Column of the time window, defaults to the time column of the schema.
+    - chunksize (int): Number of rows read at a time.
+    - assume_sorted (bool): The file is sorted on time_column, stop reading after the first
+      chunk that reaches end.
+
+    Yields:
+    - Non-empty DataFrames of at most chunksize rows.
+    """
+    if file_type is None:
+        file_type = extract_file_type(os.path.basename(file_path)[:-len('.csv')])
+    time_window = None if start is None and end is None else (start, end)
+    schema, usecols, time_column = _fuser_read_plan(file_type, columns, time_window, time_column)
+    dtypes = {column: dtype for column, dtype in schema['dtypes'].items() if dtype != 'string'}
+    end = pd.Timestamp(end, tz='UTC') if end is not None else None
+
+    with pd.read_csv(file_path, usecols=usecols, dtype=dtypes or None, chunksize=chunksize) as reader:
+        for chunk in reader:
+            _check_time_column(chunk, file_path, time_column, time_window)
+            if time_window is not None and assume_sorted and end is not None:
+                # Look at the last time of the raw chunk before filtering drops it
+                times = pd.to_datetime(chunk[time_column], utc=True, errors='coerce', format='ISO8601')
+                reached_end = times.max() >= end
+            else:
+                reached_end = False
+            chunk = _apply_fuser_schema(chunk, schema, time_column, time_window)
+            if not chunk.empty:
+                yield chunk
+            if reached_end:
+                break
+
+# Bump when a parser changes in a way the regular expressions do not show, to invalidate ParseCache entries
+parser_version = '3'
+
+def file_fingerprint(file_path):
+    """Return the absolute path, size and modification time (ns) of a file."""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+def parser_version_hash():
+    """Return a hash of parser_version and the parsing regular expressions, those of the token parser included."""
+    digest = hashlib.sha1(parser_version.encode())
+    for pattern in (metar_pattern, taf_pattern, fuser_file_pattern, *metar_token_patterns, *taf_token_patterns):
+        digest.update(pattern.pattern.encode())
+    return digest.hexdigest()[:16]
+
+def _columnar_round_trip(df):
+    """
+    True when Parquet and Feather give a frame back with the same values and column types. Lists
+    and dictionaries (cloud_layers) come back as numpy arrays and a categorical column without
+    categories as an object column, frames with them are pickled.
+    """
+    for name, dtype in df.dtypes.items():
+        column = df[name]
+        if isinstance(dtype, pd.CategoricalDtype):
+            if len(dtype.categories) == 0:
+                return False
+        elif dtype == object:
+            first = column.first_valid_index()
+            if first is not None and isinstance(column[first], (list, tuple, dict, np.ndarray)):
+                return False
+    return True
+
+class ParseCache:
+    """
+    On-disk cache of parsed load_data results.
+
+    Entries are keyed by the source file fingerprint, the parser version hash and the load options,
+    so editing a source file or a parser makes old entries unreachable. Entries are stored as
+    Parquet or Feather, frames those formats cannot hold or would not give back unchanged are
+    pickled (see _columnar_round_trip). When the cache grows past max_bytes the least recently
+    used entries are removed.
+    """
+
+    formats = {'parquet': '.parquet', 'feather': '.feather', 'pickle': '.pkl'}
+
+    def __init__(self, cache_dir, max_bytes=10 * 1024 ** 3, file_format='parquet'):
+        """
+        Parameters:
+        - cache_dir (str): Directory of the cache files, created when missing.
+        - max_bytes (int): Size limit of the cache directory.
+        - file_format (str): "parquet", "feather" or "pickle".
+        """
+        if file_format not in self.formats:
+            raise ValueError(f"Unsupported cache format: {file_format}")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.file_format = file_format
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, file_path, **options):
+        """Return the cache key of a source file parsed with the given load options."""
+        digest = hashlib.sha1(repr((file_fingerprint(file_path), parser_version_hash(),
+                                    sorted(options.items()))).encode())
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        return [os.path.join(self.cache_dir, key + extension) for extension in self.formats.values()]
+
+    def get(self, key):
+        """Return the cached DataFrame of a key, or None on a miss."""
+        for path in self._paths(key):
+            if not os.path.exists(path):
+                continue
+            if path.endswith('.parquet'):
+                df = pd.read_parquet(path)
+            elif path.endswith('.feather'):
+                df = pd.read_feather(path)
+            else:
+                df = pd.read_pickle(path)
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+            return df
+        return None
+
+    def put(self, key, df):
+        """Store a DataFrame under a key, then evict old entries if the cache is too large."""
+        file_format = self.file_format if _columnar_round_trip(df) else 'pickle'
+        path = os.path.join(self.cache_dir, key + self.formats[file_format])
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        # The temporary file is removed whichever write fails, the pickle fallback included
+        try:
+            try:
+                if file_format == 'parquet':
+                    df.to_parquet(temp_path)
+                elif file_format == 'feather':
+                    df.reset_index(drop=True).to_feather(temp_path)
+                else:
+                    df.to_pickle(temp_path)
+            except (ImportError, NotImplementedError, TypeError, ValueError, pickle.PicklingError):
+                # Columns of Python objects the columnar formats cannot hold
+                if file_format == 'pickle':
+                    raise
+                path = os.path.join(self.cache_dir, key + self.formats['pickle'])
+                df.to_pickle(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict()
+
+    def entries(self):
+        """Return (path, size, last use) of every cache entry, least recently used first."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(tuple(self.formats.values())):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for path, size, last_use in entries)
+        for path, size, last_use in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for path, size, last_use in self.entries():
+            os.remove(path)
+
+def load_data(data_type, dataset_purpose, path_level=None, month=None, day=None, file_name=None, base_dir=None,
+              forecast_times=None, flight_levels=None, thresholds=None, contours=None, lazy=False,
+              output="dataframe", cache=None, columns=None, time_window=None, time_column=None, typed=False,
+              chunksize=None, stats=None, cloud_format="list", compact=False, dedupe=False, parser="tokens"):
     """
     Loads a data file from a specified path or defult path.
 
@@ -592,11 +2786,42 @@ def load_data(data_type, dataset_purpose, path_level=None, month=None, day=None,
     - day (str): Day, e.g., "29".
     - file_name (str): Filename (without extension or type-specific suffix), e.g., "2022_09_29_20_00_GMT.Forecast".
     - base_dir (str): Root directory of the data, e.g., "/home/finalProject/data".
+    - forecast_times (list): CWAM only, forecast time groups to read, None reads all of them.
+    - flight_levels (list): CWAM only, flight level groups to read, None reads all of them.
+    - thresholds (list): CWAM only, threshold groups to read, None reads all of them.
+    - contours (list): CWAM only, contour groups to read, None reads all of them.
+    - lazy (bool): CWAM only, return a CWAMLazyDataset that reads polygons on access.
+    - output (str): "dataframe", "arrow" to return a pyarrow.Table with the same columns, or for
+      CWAM "ragged" to return a CWAMPolygonStore and "index" to return a CWAMSpatialIndex over the
+      polygons. Arrow tables are built from the parsed columns without a DataFrame for METAR, CWAM
+      (large_list<float> coordinates, see CWAMPolygonStore.to_arrow) and untyped FUSER files, and can be
+      handed to pandas, Polars or DuckDB without copying their buffers.
+    - cache (ParseCache, str or bool): Reuse parsed DataFrames from a ParseCache, a cache directory,
+      or True for a ".parse_cache" directory in base_dir.
+    - columns (list): FUSER only, columns to read.
+    - time_window (tuple): FUSER only, (start, end) of the rows to keep on time_column.
+    - time_column (str): FUSER only, column of time_window, defaults to the one in fuser_schemas.
+    - typed (bool): FUSER only, apply the dtypes, timestamps and categoricals of fuser_schemas.
+      Also turned on by columns and time_window.
+    - chunksize (int): FUSER only, with a time_window read the file in chunks of this many rows
+      through iter_fuser, so rows outside the window are dropped while reading.
+    - stats (LoadStats): Collect the wall time of every stage and the matched, rejected and
+      fallback record counts of the parsers, attributed to the file path.
+    - cloud_format (str): METAR and TAF, "list" for a cloud_layers column of dictionaries,
+      "columns" for the fixed-width numeric columns of cloud_layer_columns.
+    - compact (bool): METAR and TAF, return the smaller column types of compact_frame.
+    - dedupe (bool): METAR and TAF, keep one version of every report, see dedupe_reports. The
+      number of duplicates dropped is counted as "duplicate" in stats.
+    - parser (str): METAR and TAF, "tokens" to match reports with the single pass token parser
+      (extract_metar_tokens, taf_token_groups), "regex" with metar_pattern and taf_pattern.
+      Both give the same frames.
 
     Returns:
-    - DataFrame, HDF5 file object, or string content based on file type.
+    - DataFrame, HDF5 file object, or string content based on file type, a pyarrow.Table with output="arrow".
     """
     base_dir = defult_base_dir if not base_dir else base_dir
+    if output == "arrow" and pyarrow is None:
+        raise ImportError("output=\"arrow\" requires pyarrow")
 
     # Specify file extensions
     file_ext = file_extension[data_type]
@@ -637,94 +2862,139 @@ def load_data(data_type, dataset_purpose, path_level=None, month=None, day=None,
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
+    with stats.track(file_path) if stats is not None else nullcontext():
+        return _load_file(file_path, data_type, dataset_purpose, path_level, month, day, file_name, base_dir,
+                          forecast_times, flight_levels, thresholds, contours, lazy, output, cache, columns,
+                          time_window, time_column, typed, chunksize, stats, cloud_format, compact, dedupe,
+                          parser)
+
+def _dedupe_loaded(df, data_type, stats):
+    """dedupe_reports for load_data, counting the dropped duplicates in stats."""
+    with _stage(stats, 'post-process'):
+        df, dropped = dedupe_reports(df, data_type)
+    if stats is not None:
+        stats.count(data_type.lower(), 'duplicate', dropped)
+    return df.reset_index(drop=True) if dropped else df
+
+def _load_file(file_path, data_type, dataset_purpose, path_level, month, day, file_name, base_dir,
+               forecast_times, flight_levels, thresholds, contours, lazy, output, cache, columns,
+               time_window, time_column, typed, chunksize, stats, cloud_format, compact, dedupe, parser):
+    """Read and parse the file of load_data."""
+    # Reuse a cached parse of the same file, only DataFrames are cached
+    if cache and not lazy and output == "dataframe":
+        if not isinstance(cache, ParseCache):
+            cache = ParseCache(cache if isinstance(cache, str) else os.path.join(base_dir, '.parse_cache'))
+        options = {'forecast_times': forecast_times, 'flight_levels': flight_levels,
+                   'thresholds': thresholds, 'contours': contours, 'columns': columns,
+                   'time_window': time_window, 'time_column': time_column, 'typed': typed,
+                   'chunksize': chunksize, 'cloud_format': cloud_format, 'compact': compact,
+                   'dedupe': dedupe, 'parser': parser}
+        key = cache.key(file_path, data_type=data_type, **options)
+        with _stage(stats, 'read'):
+            df = cache.get(key)
+        if stats is not None:
+            stats.count('cache', 'miss' if df is None else 'hit')
+        if df is None:
+            df = load_data(data_type, dataset_purpose, path_level, month, day, file_name, base_dir, **options,
+                           stats=stats)
+            cache.put(key, df)
+        return df
+
     # Load file based on file type
     if data_type == "FUSER":
-        def extract_file_type(file_name):
-            pattern = r'^(?P<airport>\w+)' \
-                      r'_(?P<date_range>\d{4}-\d{2}-\d{2}(_\d{4}-\d{2}-\d{2})?)' \
-                      r'\.(?P<file_type>\w+)_data_set$'
-
-            match = re.match(pattern, file_name)
-
-            if match:
-                file_type = match.group('file_type')
-                return file_type
-            else:
-                return None
-
-        df = pd.read_csv(file_path)
         file_type = extract_file_type(file_name)
+        with _stage(stats, 'read'):
+            if time_window is not None and chunksize:
+                chunks = list(iter_fuser(file_path, file_type, columns, time_window[0], time_window[1],
+                                         time_column, chunksize))
+                # An empty window still gets the typed columns of the file
+                df = pd.concat(chunks, ignore_index=True) if chunks else read_fuser_csv(
+                    file_path, file_type, columns, time_window, time_column, nrows=0)
+            elif typed or columns is not None or time_window is not None:
+                df = read_fuser_csv(file_path, file_type, columns, time_window, time_column)
+            elif output == "arrow":
+                table = pyarrow.csv.read_csv(file_path)
+                table = table.append_column('file_type', pyarrow.repeat(pyarrow.scalar(file_type, pyarrow.string()),
+                                                                        table.num_rows))
+                if stats is not None:
+                    stats.count('fuser', 'matched', table.num_rows)
+                return table
+            else:
+                df = pd.read_csv(file_path)
         df['file_type'] = file_type
-        return df
+        if stats is not None:
+            stats.count('fuser', 'matched', len(df))
+        return _arrow_output(df) if output == "arrow" else df
     elif data_type in ["METAR", "TAF"]:
         if data_type == "METAR":
-            with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
-                lines = file.readlines()
-                lines = [line.strip() for line in lines if line.strip()]
-                data_entries = []
-                date_time = None  # To keep track of the current date and time
-
-                for line in lines:
-                    # Check if the line is a date line
-                    if re.match(r'\d{4}/\d{2}/\d{2} \d{2}:\d{2}', line):
-                        date_time = line  # Store the date and time
-                        #print(date_time)
-                    elif date_time:  # If we have a date_time, process the METAR line
-                        parsed_data = parse_metar_line(date_time, line)
-                        if parsed_data:
-                            data_entries.append(parsed_data)
-                        date_time = None
-            return pd.DataFrame(data_entries)
+            with _stage(stats, 'read'):
+                with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+                    lines = file.readlines()
+            # Each report is paired with its date line and all reports are parsed in one batch
+            with _stage(stats, 'split'):
+                pairs = pair_metar_lines(lines)
+            if output == "arrow" and not dedupe and not compact:
+                return parse_metar_batch(pairs, stats, cloud_format, output="arrow", parser=parser)
+            df = parse_metar_batch(pairs, stats, cloud_format, parser=parser)
+            if dedupe:
+                df = _dedupe_loaded(df, data_type, stats)
+            if compact:
+                with _stage(stats, 'frame'):
+                    df = compact_frame(df)
+            return _arrow_output(df, report_arrow_types(data_type)) if output == "arrow" else df
         else:
-            with open(file_path, 'r', encoding='ISO-8859-1') as file:
-                lines = file.readlines()
+            if cloud_format not in ("list", "columns"):
+                raise ValueError(f"Unsupported cloud format: {cloud_format}")
+            with _stage(stats, 'read'):
+                with open(file_path, 'r', encoding='ISO-8859-1') as file:
+                    lines = file.readlines()
+            with _stage(stats, 'split'):
+                reports = split_taf_reports(lines, parser)
 
             data_entries = []
-            current_date_time = None
-            current_report_lines = []
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue  # Skip empty lines
-                # Check if the line contains a date-time
-                date_time_match = re.match(r'\d{4}/\d{2}/\d{2} \d{2}:\d{2}', line)
-                if date_time_match:
-                    # If there’s an accumulated report, parse it
-                    if current_report_lines:
-                        full_report = ' '.join(current_report_lines)
-                        # Split multiple TAF reports within the same block
-                        taf_reports = re.split(r'=\s*', full_report)
-                        for report in taf_reports:
-                            report = report.strip()
-                            if report:
-                                report = remove_duplicates_in_report(report)
-                                parsed_data = parse_taf_block(current_date_time, report)
-                                if parsed_data:
-                                    data_entries.append(parsed_data)
-                        current_report_lines = []
-                    current_date_time = date_time_match.group()
-                else:
-                    # Continue accumulating lines for the current report
-                    current_report_lines.append(line)
-
-            # Process the last report if any
-            if current_report_lines:
-                full_report = ' '.join(current_report_lines)
-                taf_reports = re.split(r'=\s*', full_report)
-                for report in taf_reports:
-                    report = report.strip()
-                    if report:
-                        report = remove_duplicates_in_report(report)
-                        parsed_data = parse_taf_block(current_date_time, report)
-                        if parsed_data:
-                            data_entries.append(parsed_data)
-            return pd.DataFrame(data_entries)
+            with _stage(stats, 'match'):
+                for date_time, report in reports:
+                    parsed_data = parse_taf_block(date_time, report, resolve_times=False, stats=stats,
+                                                  decode_clouds=cloud_format == "list", parser=parser)
+                    if parsed_data:
+                        data_entries.append(parsed_data)
+            with _stage(stats, 'frame'):
+                df = pd.DataFrame(data_entries)
+            # Validity and temperature times, and cloud columns, are resolved for all reports at once
+            with _stage(stats, 'post-process'):
+                df = resolve_taf_frame(df, stats)
+                df = expand_cloud_layers(df) if cloud_format == "columns" else df
+            if dedupe:
+                df = _dedupe_loaded(df, data_type, stats)
+            if compact:
+                with _stage(stats, 'frame'):
+                    df = compact_frame(df)
+            if output == "arrow":
+                with _stage(stats, 'frame'):
+                    return _arrow_output(df, report_arrow_types(data_type))
+            return df
     elif data_type == "CWAM":
+        if lazy:
+            return CWAMLazyDataset(file_path, forecast_times, flight_levels, thresholds, contours)
         with h5py.File(file_path, 'r') as file:  # Load HDF5 data
-
-            return get_dataset(file)
+            with _stage(stats, 'read'):
+                if output in ("ragged", "index", "arrow"):
+                    store = CWAMPolygonStore.from_file(file, forecast_times, flight_levels, thresholds, contours)
+                else:
+                    df = get_dataset(file, forecast_times, flight_levels, thresholds, contours)
+            if stats is not None:
+                stats.count('cwam', 'matched', len(store) if output in ("ragged", "index", "arrow") else len(df))
+            if output == "ragged":
+                return store
+            if output == "arrow":
+                with _stage(stats, 'frame'):
+                    return store.to_arrow()
+            if output == "index":
+                with _stage(stats, 'post-process'):
+                    return CWAMSpatialIndex(store)
+            return df
     else:
-        raise ValueError(f"Unsupported file type: {file_ext}")
+        raise ValueError(f"Unsupported data type: {data_type}")
 
 def get_fuser_file_name(airport, data_range,file_type):
     """
@@ -805,3 +3075,1166 @@ def check_output_file_exists(data_type, dataset_purpose, month=None, day=None, f
     file_path = os.path.join(path, f"{file_name}.{file_ext}")
 
     return os.path.exists(file_path)
+
+def fuser_specs(dataset_purpose, airports, dates, file_types, base_dir=None):
+    """
+    Return the load_many specs of the FUSER input files that exist for a range of airports and dates.
+
+    Parameters:
+    - dataset_purpose (str): "train" or "test", indicating training or testing data.
+    - airports (list): Airport names, e.g., ["KATL", "KDEN"].
+    - dates (list): Dates as strings or timestamps, e.g., pd.date_range("2022-09-01", "2022-09-30").
+    - file_types (list): FUSER file types, e.g., ["runways", "configs"].
+    - base_dir (str): Root directory of the data, e.g., "/home/finalProject/data".
+
+    Returns:
+    - List of (data_type, dataset_purpose, path_level, file_name) tuples ordered by date, file type and airport.
+    """
+    specs = []
+    for date in dates:
+        data_range = pd.Timestamp(date).strftime('%Y-%m-%d')
+        for file_type in file_types:
+            for airport in airports:
+                file_name = get_fuser_file_name(airport=airport, data_range=data_range, file_type=file_type)
+                if check_input_file_exists('FUSER', dataset_purpose, path_level=airport,
+                                           file_name=file_name, base_dir=base_dir):
+                    specs.append(('FUSER', dataset_purpose, airport, file_name))
+    return specs
+
+def _load_spec(spec):
+    """Load one load_many spec and tag the result with its airport and file type."""
+    data = load_data(**spec)
+    if not isinstance(data, pd.DataFrame):
+        raise ValueError(f"load_many only supports DataFrame results, got {type(data).__name__}")
+
+    data_type = spec['data_type']
+    if 'airport_id' not in data.columns:
+        airport = None
+        if data_type == 'FUSER':
+            airport = spec.get('path_level')
+        elif 'station' in data.columns:
+            airport = data['station']
+        data['airport_id'] = airport
+    if 'file_type' not in data.columns:
+        data['file_type'] = data_type
+    return data
+
+def load_many(specs=None, dataset_purpose=None, airports=None, dates=None, file_types=None, base_dir=None,
+              max_workers=None, use_processes=False):
+    """
+    Load many files concurrently and concatenate them.
+
+    Parameters:
+    - specs (list): (data_type, dataset_purpose, path_level, file_name) tuples, or dictionaries of
+      load_data arguments. When missing, the FUSER files of dataset_purpose, airports, dates and
+      file_types that exist are loaded, see fuser_specs.
+    - dataset_purpose, airports, dates, file_types: Range of FUSER files to load when specs is missing.
+    - base_dir (str): Root directory of the data, used for specs that do not set their own.
+    - max_workers (int): Size of the worker pool, defaults to the number of CPUs.
+    - use_processes (bool): Use a process pool instead of a thread pool.
+
+    Returns:
+    - DataFrame with the rows of every file in the order of the specs, tagged with
+      "airport_id" and "file_type" columns.
+    """
+    if specs is None:
+        specs = fuser_specs(dataset_purpose, airports, dates, file_types, base_dir=base_dir)
+
+    load_specs = []
+    for spec in specs:
+        if not isinstance(spec, dict):
+            data_type, purpose, path_level, file_name = spec
+            spec = {'data_type': data_type, 'dataset_purpose': purpose,
+                    'path_level': path_level, 'file_name': file_name}
+        load_specs.append({'base_dir': base_dir, **spec})
+    if not load_specs:
+        return pd.DataFrame(columns=['airport_id', 'file_type'])
+
+    max_workers = max_workers or os.cpu_count()
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=min(max_workers, len(load_specs))) as executor:
+        # map returns the results in the order of the specs
+        results = list(executor.map(_load_spec, load_specs))
+    return concat_compact(results)
+
+# Dates in CWAM, METAR and TAF file names, e.g. "2022_09_29_20_00_GMT.Forecast" or "2022-09-29"
+file_name_date_pattern = re.compile(r'(?P<year>\d{4})[-_]?(?P<month>\d{2})[-_]?(?P<day>\d{2})')
+
+catalog_columns = ['data_type', 'purpose', 'path_level', 'month', 'day', 'airport', 'file_type',
+                   'start_date', 'end_date', 'file_name', 'path']
+
+class FileCatalog:
+    """
+    Index of the data files that exist under base_dir, built by walking the directory tree once.
+
+    Every row describes one file with its data type, purpose, path level (airport for FUSER,
+    part_X for CWAM and METAR), CWAM month and day folders, airport, file type, covered dates,
+    the file name load_data expects and the full path. Cleaned FUSER outputs in
+    data/FUSER/{purpose}/ get the file type "output".
+    """
+
+    def __init__(self, base_dir=None):
+        self.base_dir = defult_base_dir if not base_dir else base_dir
+        self.refresh()
+
+    def refresh(self):
+        """Scan base_dir again."""
+        entries = []
+        for data_type in file_extension:
+            root = os.path.join(self.base_dir, data_type)
+            for dir_path, dir_names, file_names in os.walk(root):
+                dir_names.sort()
+                parts = os.path.relpath(dir_path, root).split(os.sep)
+                for name in sorted(file_names):
+                    entry = self._describe(data_type, parts, name)
+                    if entry is not None:
+                        entry['path'] = os.path.join(dir_path, name)
+                        entries.append(entry)
+
+        df = pd.DataFrame(entries, columns=catalog_columns)
+        df['start_date'] = pd.to_datetime(df['start_date'], errors='coerce')
+        df['end_date'] = pd.to_datetime(df['end_date'], errors='coerce')
+        self.files = df
+
+    def _describe(self, data_type, parts, name):
+        """Return the catalog entry of a file, or None if it is not a data file of the expected layout."""
+        parts = [part for part in parts if part != '.']
+        if not parts:
+            return None
+        entry = dict.fromkeys(catalog_columns)
+        entry.update(data_type=data_type, purpose=parts[0])
+
+        if data_type == 'FUSER':
+            if not name.endswith('.csv'):
+                return None
+            file_name = name[:-len('.csv')]
+            if len(parts) == 1:
+                # Cleaned daily output, data/FUSER/{purpose}/{date}.csv
+                try:
+                    date = pd.Timestamp(file_name)
+                except ValueError:
+                    return None
+                entry.update(file_type='output', start_date=date, end_date=date, file_name=file_name)
+                return entry
+            match = fuser_file_pattern.match(file_name)
+            if len(parts) != 2 or not match:
+                return None
+            dates = match.group('date_range').split('_')
+            entry.update(path_level=parts[1], airport=match.group('airport'), file_type=match.group('file_type'),
+                         start_date=dates[0], end_date=dates[-1], file_name=file_name)
+            return entry
+
+        suffix = '.h5.CWAM.h5' if data_type == 'CWAM' else f'.{file_extension[data_type]}'
+        if not name.endswith(suffix):
+            return None
+        file_name = name[:-len(suffix)]
+        entry.update(file_type=data_type, file_name=file_name)
+        if len(parts) > 1:
+            entry['path_level'] = parts[1]
+
+        date = file_name_date_pattern.search(file_name)
+        if data_type == 'CWAM':
+            # CWAM Path: data/CWAM/{purpose}/part_X/MM/DD
+            if len(parts) != 4:
+                return None
+            entry.update(month=parts[2], day=parts[3])
+            if date:
+                entry['start_date'] = entry['end_date'] = f"{date.group('year')}-{parts[2]}-{parts[3]}"
+        elif date:
+            entry['start_date'] = entry['end_date'] = '-'.join(date.group('year', 'month', 'day'))
+        return entry
+
+    def find(self, data_type=None, purpose=None, airport=None, file_type=None, path_level=None,
+             start=None, end=None, period=None):
+        """
+        Return the catalog rows matching every given condition.
+
+        Parameters:
+        - data_type, purpose, airport, file_type, path_level (str or list): Values to keep.
+        - start, end (str or Timestamp): Keep files covering at least one day of [start, end].
+        - period (str): Shortcut for start and end, e.g. "2022-10" or "2022".
+
+        Example: catalog.find("FUSER", airport="KATL", file_type="configs", period="2022-10")
+        """
+        if period is not None:
+            period = pd.Period(period)
+            start, end = period.start_time.normalize(), period.end_time.normalize()
+
+        df = self.files
+        mask = np.ones(len(df), dtype=bool)
+        for column, values in (('data_type', data_type), ('purpose', purpose), ('airport', airport),
+                               ('file_type', file_type), ('path_level', path_level)):
+            if values is not None:
+                values = [values] if isinstance(values, str) else list(values)
+                mask &= df[column].isin(values).to_numpy()
+        if start is not None:
+            mask &= (df['end_date'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (df['start_date'] <= pd.Timestamp(end)).to_numpy()
+        return df[mask]
+
+    def exists(self, **conditions):
+        """Return True if at least one file matches the find conditions."""
+        return not self.find(**conditions).empty
+
+    def dates(self, **conditions):
+        """Return the sorted days covered by the files matching the find conditions."""
+        df = self.find(**conditions).dropna(subset=['start_date', 'end_date'])
+        days = [pd.date_range(start, end) for start, end in zip(df['start_date'], df['end_date'])]
+        return pd.DatetimeIndex(np.unique(np.concatenate(days))) if days else pd.DatetimeIndex([])
+
+    def specs(self, files=None):
+        """Return load_many specs for catalog rows, every row of the catalog when files is None."""
+        files = self.files if files is None else files
+        files = files[files['file_type'] != 'output']
+        specs = []
+        for row in files.itertuples(index=False):
+            spec = {'data_type': row.data_type, 'dataset_purpose': row.purpose, 'path_level': row.path_level,
+                    'file_name': row.file_name, 'base_dir': self.base_dir}
+            if row.data_type == 'CWAM':
+                spec.update(month=row.month, day=row.day)
+            specs.append(spec)
+        return specs
+
+# Interval settings of the cleaned FUSER tables: 12 intervals of 15 minutes after each ref_time
+NUM_INTERVALS = 12
+INTERVAL_LENGTH = 15
+
+# Events counted per interval: column label -> (FUSER file type, event time column)
+interval_event_sources = {
+    'Arrival': ('runways', 'arrival_runway_actual_time'),
+    'ETD': ('ETD', 'departure_runway_estimated_time'),
+    'TFM': ('TFM_track', 'arrival_runway_estimated_time'),
+    'TBFM': ('TBFM', 'arrival_runway_sta')
+}
+
+def count_events_in_intervals(event_times, ref_times, interval_length=INTERVAL_LENGTH, num_intervals=NUM_INTERVALS):
+    """
+    Count the events falling in each interval after every reference time, for one airport.
+
+    An event at time t belongs to interval i (1-based) of ref_time when
+    ref_time + (i - 1) * interval_length <= t < ref_time + i * interval_length.
+
+    Parameters:
+    - event_times (array): Event timestamps, missing values are ignored.
+    - ref_times (array): Reference timestamps.
+    - interval_length (int): Interval length in minutes.
+    - num_intervals (int): Number of intervals.
+
+    Returns:
+    - int64 array of shape (len(ref_times), num_intervals).
+    """
+    events = pd.to_datetime(pd.Series(event_times), utc=True, errors='coerce').dropna()
+    events = np.sort(events.to_numpy(dtype='datetime64[ns]').astype(np.int64))
+    refs = pd.to_datetime(pd.Series(ref_times), utc=True, errors='coerce')
+    valid = refs.notna().to_numpy()
+    refs = refs.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+    counts = np.zeros((len(refs), num_intervals), dtype=np.int64)
+    if not len(events) or not valid.any():
+        return counts
+    step = np.int64(interval_length) * 60 * 10 ** 9
+    bounds = refs[valid, None] + np.arange(num_intervals + 1, dtype=np.int64) * step
+    counts[valid] = np.diff(np.searchsorted(events, bounds, side='left'), axis=1)
+    return counts
+
+def build_interval_counts(configs, frames, interval_length=INTERVAL_LENGTH, num_intervals=NUM_INTERVALS,
+                          sources=None, ref_column='start_time'):
+    """
+    Build the interval_N_{Arrival, ETD, TFM, TBFM} count columns of the cleaned FUSER tables
+    for every config row at once, with one sorted pass per airport and event type.
+
+    Parameters:
+    - configs (DataFrame): Reference rows with "airport_id" and ref_column.
+    - frames (dict): FUSER DataFrames by file type, e.g. {"runways": ..., "ETD": ...}, each with
+      "airport_id", "gufi" and the time column of interval_event_sources. Missing or empty
+      frames give zero counts.
+    - interval_length (int): Interval length in minutes.
+    - num_intervals (int): Number of intervals.
+    - sources (dict): Label -> (file type, time column), defaults to interval_event_sources.
+    - ref_column (str): Reference time column of configs.
+
+    Returns:
+    - DataFrame with "airport_id", "ref_time" and the count columns, in the row order of configs.
+    """
+    sources = interval_event_sources if sources is None else sources
+    airports = configs['airport_id'].to_numpy()
+    ref_times = pd.to_datetime(configs[ref_column], utc=True, errors='coerce')
+
+    result = pd.DataFrame({'airport_id': airports, 'ref_time': ref_times.reset_index(drop=True)})
+    for label, (file_type, time_column) in sources.items():
+        counts = np.zeros((len(configs), num_intervals), dtype=np.int64)
+        frame = frames.get(file_type)
+        if frame is not None and not frame.empty and time_column in frame.columns:
+            # Only events with a gufi are counted
+            events = frame[frame['gufi'].notna()] if 'gufi' in frame.columns else frame
+            events_by_airport = dict(tuple(events.groupby('airport_id')[time_column]))
+            for airport in pd.unique(airports):
+                rows = np.flatnonzero(airports == airport)
+                if airport in events_by_airport:
+                    counts[rows] = count_events_in_intervals(events_by_airport[airport], ref_times.iloc[rows],
+                                                             interval_length, num_intervals)
+        for i in range(num_intervals):
+            result[f'interval_{i + 1}_{label}'] = counts[:, i]
+    return result
+
+# Weather columns joined onto ref_times by WeatherAsOfIndex, the ones missing from a frame are skipped
+metar_feature_columns = ['date_time', 'temperature', 'dewpoint', 'visibility_meters', 'wind_speed_mps', 'pressure']
+taf_feature_columns = ['date_time', 'valid_start_date', 'valid_end_date', 'amended', 'wind_direction',
+                       'wind_speed_kt', 'wind_gust_kt', 'visibility_meters', 'weather_score', 'qnh_hpa',
+                       'probability', 'max_temp_value', 'min_temp_value']
+
+def _utc_ns(values):
+    """UTC nanoseconds of timestamps, naive values are taken as UTC and NaT gives the int64 minimum."""
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True, errors='coerce')).as_unit('ns').asi8
+
+def _station_slices(stations):
+    """{station: (start, end)} of a station array sorted by station."""
+    names, starts = np.unique(stations, return_index=True)
+    ends = np.append(starts[1:], len(stations))
+    return dict(zip(names, zip(starts, ends)))
+
+class WeatherAsOfIndex:
+    """
+    Bulk as-of lookup of the METAR and TAF in force at (station, time) queries.
+
+    Reports are sorted by station and time once, then every query is answered with a binary
+    search in the sorted times of its station:
+    - METAR: the latest report with date_time <= t.
+    - TAF: among the reports issued at or before t (date_time <= t) with
+      valid_start_date <= t < valid_end_date, the latest issue. Amended and corrected reports
+      win over a routine report of the same issue time.
+
+    Parameters:
+    - metar (DataFrame): Output of load_data('METAR'), with "station" and "date_time".
+    - taf (DataFrame): Output of load_data('TAF'), with "station", "date_time", "valid_start_date"
+      and "valid_end_date".
+    - metar_columns, taf_columns (list): Columns to return, default to metar_feature_columns and
+      taf_feature_columns.
+    - metar_tolerance (str or Timedelta): Oldest METAR to return, None returns any age.
+    """
+
+    def __init__(self, metar=None, taf=None, metar_columns=None, taf_columns=None, metar_tolerance=None):
+        self.metar_tolerance = None if metar_tolerance is None else pd.Timedelta(metar_tolerance).value
+        self.metar = self.taf = None
+        self.metar_slices, self.taf_slices = {}, {}
+
+        if metar is not None:
+            columns = metar_feature_columns if metar_columns is None else metar_columns
+            metar = metar[metar['station'].notna()]
+            times = _utc_ns(metar['date_time'])
+            order = np.lexsort((times, metar['station'].to_numpy(dtype=str)))
+            order = order[times[order] != np.iinfo(np.int64).min]
+            columns = [column for column in columns if column in metar.columns]
+            self.metar = metar[columns].iloc[order].reset_index(drop=True)
+            self.metar_times = times[order]
+            self.metar_slices = _station_slices(metar['station'].to_numpy(dtype=str)[order])
+
+        if taf is not None:
+            columns = taf_feature_columns if taf_columns is None else taf_columns
+            taf = taf[taf['station'].notna()]
+            issued = _utc_ns(taf['date_time'])
+            start = _utc_ns(taf['valid_start_date'])
+            end = _utc_ns(taf['valid_end_date'])
+            preferred = np.zeros(len(taf), dtype=bool)
+            for flag in ('amended', 'corection'):
+                if flag in taf.columns:
+                    preferred |= taf[flag].fillna(False).to_numpy(dtype=bool)
+            # Within a station by issue time, an amendment sorts after the routine report it replaces
+            order = np.lexsort((preferred, issued, taf['station'].to_numpy(dtype=str)))
+            missing = np.iinfo(np.int64).min
+            order = order[(issued[order] != missing) & (start[order] != missing) & (end[order] != missing)]
+            columns = [column for column in columns if column in taf.columns]
+            self.taf = taf[columns].iloc[order].reset_index(drop=True)
+            self.taf_issued, self.taf_start, self.taf_end = issued[order], start[order], end[order]
+            self.taf_slices = _station_slices(taf['station'].to_numpy(dtype=str)[order])
+            # A report issued longer than this before t has ended before t
+            self.taf_max_validity = (self.taf_end - self.taf_issued).max() if len(order) else 0
+
+    @staticmethod
+    def _query_groups(stations):
+        """Yield (station, query positions) for every distinct station of the queries."""
+        codes, names = pd.factorize(pd.Series(stations, dtype=object))
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        for code, name in enumerate(names):
+            yield name, order[bounds[code]:bounds[code + 1]]
+
+    def metar_positions(self, stations, times):
+        """Row of self.metar for every query, -1 when there is none."""
+        times = _utc_ns(times)
+        positions = np.full(len(times), -1, dtype=np.int64)
+        for station, query in self._query_groups(stations):
+            if station not in self.metar_slices:
+                continue
+            start, end = self.metar_slices[station]
+            found = np.searchsorted(self.metar_times[start:end], times[query], side='right') - 1
+            keep = found >= 0
+            if self.metar_tolerance is not None:
+                keep &= times[query] - self.metar_times[start + np.maximum(found, 0)] <= self.metar_tolerance
+            positions[query[keep]] = start + found[keep]
+        return positions
+
+    def taf_positions(self, stations, times):
+        """Row of self.taf in force for every query, -1 when there is none."""
+        times = _utc_ns(times)
+        positions = np.full(len(times), -1, dtype=np.int64)
+        for station, query in self._query_groups(stations):
+            if station not in self.taf_slices:
+                continue
+            start, end = self.taf_slices[station]
+            issued = self.taf_issued[start:end]
+            valid_start, valid_end = self.taf_start[start:end], self.taf_end[start:end]
+            t = times[query]
+            # Walk back from the last report issued at or before t until one is in force
+            candidate = np.searchsorted(issued, t, side='right') - 1
+            oldest = t - self.taf_max_validity
+            active = np.flatnonzero(candidate >= 0)
+            while len(active):
+                rows = candidate[active]
+                in_force = (valid_start[rows] <= t[active]) & (t[active] < valid_end[rows])
+                positions[query[active[in_force]]] = start + rows[in_force]
+                active = active[~in_force]
+                candidate[active] -= 1
+                rows = candidate[active]
+                active = active[(rows >= 0) & (issued[np.maximum(rows, 0)] >= oldest[active])]
+        return positions
+
+    @staticmethod
+    def _take(frame, positions, prefix):
+        columns = frame.reindex(positions).reset_index(drop=True)
+        return columns.add_prefix(prefix)
+
+    def lookup(self, stations, times):
+        """
+        Return the METAR and TAF columns of every (station, time) query.
+
+        Parameters:
+        - stations (array): Station code of every query, e.g. "KATL".
+        - times (array): Query timestamps, naive ones are taken as UTC.
+
+        Returns:
+        - DataFrame in query order with the METAR columns prefixed "metar_" and the TAF columns
+          prefixed "taf_", missing values where no report applies.
+        """
+        stations = np.asarray(stations, dtype=object)
+        parts = []
+        if self.metar is not None:
+            parts.append(self._take(self.metar, self.metar_positions(stations, times), 'metar_'))
+        if self.taf is not None:
+            parts.append(self._take(self.taf, self.taf_positions(stations, times), 'taf_'))
+        return pd.concat(parts, axis=1) if parts else pd.DataFrame(index=range(len(stations)))
+
+    def join(self, frame, station_column='airport_id', time_column='ref_time'):
+        """Return frame with the lookup columns of its stations and times appended, e.g. an interval table."""
+        features = self.lookup(frame[station_column].to_numpy(dtype=object), frame[time_column])
+        return pd.concat([frame.reset_index(drop=True), features], axis=1)
+
+# TAF change groups in additional_sections: FM DDHHMM, or BECMG, TEMPO and PROBnn followed by a DDHH/DDHH period
+taf_change_pattern = re.compile(r'^(?:FM(?P<day>\d{2})(?P<hour>\d{2})(?P<minute>\d{2})|(?P<kind>BECMG|TEMPO)'
+                                r'|PROB(?P<probability>\d{2}))$')
+taf_period_pattern = re.compile(r'^(\d{2})(\d{2})/(\d{2})(\d{2})$')
+taf_wind_group_pattern = re.compile(r'^(VRB|\d{3})\d{2,3}(G\d{2,3})?(KT|MPS|KMH)$')
+taf_visibility_group_pattern = re.compile(r'^(?:(?P<meters>\d{4})|P?(?P<miles>\d+)SM|(?P<numerator>\d)/(?P<denominator>\d)SM)$')
+taf_weather_group_pattern = re.compile(r'^(\+|-)?(VC)?(MI|PR|BC|DR|BL|SH|TS|FZ)?'
+                                       r'(DZ|RA|SN|SG|IC|PL|GR|GS|UP|BR|FG|FU|VA|DU|SA|HZ|PY|PO|SQ|FC|SS|DS)*$')
+
+# Prevailing conditions of a TafTimeline step, and the worst case of the TEMPO and PROB groups in
+# force, kept as "tempo_" columns: field -> True when a higher value is worse
+taf_timeline_fields = ['wind_direction', 'wind_speed_kt', 'wind_gust_kt', 'visibility_meters', 'weather_score',
+                       'ceiling_ft']
+taf_temporary_fields = {'probability': True, 'wind_speed_kt': True, 'wind_gust_kt': True,
+                        'visibility_meters': False, 'weather_score': True, 'ceiling_ft': False}
+
+def taf_timeline_columns():
+    """Names of the float32 columns of TafTimeline."""
+    return taf_timeline_fields + [f'tempo_{field}' for field in taf_temporary_fields]
+
+@_memoized
+def decode_taf_condition(token):
+    """
+    Decode a condition group of a TAF change group, e.g. "BKN030" or "31019KT".
+
+    Returns:
+    - Tuple of the (field, value) pairs of taf_timeline_fields the group sets, empty for groups
+      that set none, e.g. temperatures. A NaN ceiling_ft means no ceiling.
+    """
+    if token == 'CAVOK':
+        return ('visibility_meters', 10000.0), ('weather_score', 0.0), ('ceiling_ft', np.nan)
+    if token == 'NSW':
+        return (('weather_score', 0.0),)
+    if taf_wind_group_pattern.match(token):
+        _, _, direction, speed, gust = decode_wind(token)
+        return (('wind_direction', float(direction)), ('wind_speed_kt', np.nan if speed is None else float(speed)),
+                ('wind_gust_kt', np.nan if gust is None else float(gust)))
+    match = taf_visibility_group_pattern.match(token)
+    if match:
+        if match['meters']:
+            return (('visibility_meters', float(match['meters'])),)
+        miles = float(match['miles']) if match['miles'] else int(match['numerator']) / int(match['denominator'])
+        return (('visibility_meters', float(int(miles * 1609.34))),)
+    match = cloud_group_pattern.fullmatch(token)
+    if match:
+        cloud_code, altitude, _ = match.groups()
+        is_ceiling = altitude and cloud_cover_dict.get(cloud_code) in ceiling_sky_covers
+        return (('ceiling_ft', float(int(altitude) * 100) if is_ceiling else np.nan),)
+    if taf_weather_group_pattern.match(token):
+        return (('weather_score', float(decode_weather(token))),)
+    return ()
+
+def _add_condition(conditions, token):
+    """Add a condition group to conditions, the lowest ceiling and the highest weather score of a group win."""
+    for field, value in decode_taf_condition(token):
+        if field == 'ceiling_ft' and field in conditions:
+            value = np.fmin(conditions[field], value)
+        elif field == 'weather_score' and field in conditions:
+            value = max(conditions[field], value)
+        conditions[field] = value
+
+def _taf_group_time(reference, day, hour, minute=0):
+    """Time of a DDHH(MM) group in the month of reference or the one before or after, the closest to reference."""
+    month = reference.astype('datetime64[M]')
+    offset = np.timedelta64(((day - 1) * 24 + hour) * 60 + minute, 'm')
+    candidates = [(month + months).astype('datetime64[ns]') + offset for months in (-1, 0, 1)]
+    return min(candidates, key=lambda time: abs(time - reference))
+
+def parse_taf_changes(additional_sections, valid_start):
+    """
+    Parse the change groups of a TAF's additional_sections.
+
+    Repeated words are dropped before a report is matched (remove_duplicates_in_report or
+    taf_token_groups), so a second "TEMPO" or "PROB30" of a report is gone and only its period
+    is left. Such a period continues the kind of the last BECMG, TEMPO or PROB group before it.
+
+    Parameters:
+    - additional_sections (str): additional_sections of parse_taf_block.
+    - valid_start (Timestamp): valid_start_date of the report, day and hour fields resolve to the
+      matching time closest to it.
+
+    Returns:
+    - (base, groups): base is the dict of conditions before the first change group (the part of
+      the base forecast taf_pattern did not capture). groups is a list of dicts with "kind" ("FM",
+      "BECMG", "TEMPO" or "PROB"), "probability" (None without PROB), "start" and "end"
+      (datetime64[ns] UTC, end None for FM) and "conditions" ({field of taf_timeline_fields: value}).
+    """
+    reference = pd.Timestamp(valid_start).to_datetime64().astype('datetime64[ns]')
+    base, groups = {}, []
+    conditions, pending = base, None
+    for token in (additional_sections or '').split():
+        match = taf_change_pattern.match(token)
+        if match:
+            if match['day']:
+                start = _taf_group_time(reference, int(match['day']), int(match['hour']), int(match['minute']))
+                groups.append({'kind': 'FM', 'probability': None, 'start': start, 'end': None, 'conditions': {}})
+                pending = None
+            elif match['kind'] == 'TEMPO' and pending is not None and pending['kind'] == 'PROB':
+                pending['kind'] = 'TEMPO'  # PROB30 TEMPO
+                continue
+            else:
+                probability = int(match['probability']) / 100 if match['probability'] else None
+                pending = {'kind': match['kind'] or 'PROB', 'probability': probability, 'start': None, 'end': None,
+                           'conditions': {}}
+                groups.append(pending)
+            conditions = groups[-1]['conditions']
+            continue
+
+        match = taf_period_pattern.match(token)
+        if match:
+            if pending is None:
+                previous = next((group for group in reversed(groups) if group['kind'] != 'FM'), None)
+                if previous is None:
+                    continue
+                pending = dict(previous, conditions={})
+                groups.append(pending)
+                conditions = pending['conditions']
+            start_day, start_hour, end_day, end_hour = map(int, match.groups())
+            pending['start'] = _taf_group_time(reference, start_day, start_hour)
+            pending['end'] = _taf_group_time(reference, end_day, end_hour)
+            pending = None
+            continue
+
+        _add_condition(conditions, token)
+    return base, [group for group in groups if group['start'] is not None]
+
+def _float_or_nan(value):
+    return np.nan if value is None or pd.isna(value) else float(value)
+
+def _base_ceiling(cloud_layers):
+    """Lowest BKN, OVC or VV altitude of parse_cloud_layers output, NaN for none."""
+    altitudes = [layer['altitude_ft'] for layer in cloud_layers
+                 if layer['sky_cover'] in ceiling_sky_covers and layer['altitude_ft'] is not None]
+    return float(min(altitudes)) if altitudes else np.nan
+
+class TafTimeline:
+    """
+    TAF forecasts materialized on a regular time grid per station, for O(1) lookups of what the
+    TAF in force says at a time.
+
+    Every step carries the prevailing conditions (taf_timeline_fields) of the latest TAF issued
+    at or before the step and in force at it, the same choice as WeatherAsOfIndex. Steps start at
+    multiples of step and take the conditions at their start:
+    - The base forecast applies from valid_start_date. Its wind, visibility and clouds missed by
+      taf_pattern are taken from the groups before the first change group.
+    - FM groups apply from their time, BECMG groups from the end of their period, when the change
+      is complete. Fields a group does not give are carried over.
+    - TEMPO and PROB groups do not change the prevailing conditions, the worst case of those in
+      force is kept in the "tempo_" columns of taf_temporary_fields. "tempo_probability" is the
+      PROB value, 0.9 for TEMPO without PROB like process_probability.
+
+    The grid of each station is a slice of flat float32 arrays, like the ragged layout of
+    CWAMPolygonStore.
+
+    Parameters:
+    - stations (array): Station codes.
+    - starts (array): First step of every station, UTC nanoseconds.
+    - offsets (array): Start of every station in the arrays, with the total length appended.
+    - step (int): Step length in nanoseconds.
+    - arrays (dict): Column name -> flat array, with "issue_time" in UTC nanoseconds.
+    """
+
+    def __init__(self, stations, starts, offsets, step, arrays):
+        self.stations = np.asarray(stations, dtype=str)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.step = int(step)
+        self.arrays = arrays
+        self.station_index = pd.Index(self.stations)
+
+    @classmethod
+    def from_frame(cls, taf, step='1h'):
+        """
+        Build the timeline of a TAF frame.
+
+        Parameters:
+        - taf (DataFrame): Output of load_data('TAF'), with "additional_sections", and either
+          "cloud_layers" or the "ceiling_ft" column of cloud_format="columns".
+        - step (str or Timedelta): Grid step, e.g. "1h" or "15min".
+        """
+        step = pd.Timedelta(step).value
+        taf = taf[taf['station'].notna()]
+        issued = _utc_ns(taf['date_time'])
+        valid_start = _utc_ns(taf['valid_start_date'])
+        valid_end = _utc_ns(taf['valid_end_date'])
+        preferred = np.zeros(len(taf), dtype=bool)
+        for flag in ('amended', 'corection'):
+            if flag in taf.columns:
+                preferred |= taf[flag].fillna(False).to_numpy(dtype=bool)
+        station_codes = taf['station'].to_numpy(dtype=str)
+        order = np.lexsort((preferred, issued, station_codes))
+        missing = np.iinfo(np.int64).min
+        order = order[(issued[order] != missing) & (valid_start[order] != missing) & (valid_end[order] != missing)]
+        first = np.maximum(valid_start, issued)[order]
+        last = valid_end[order]
+        order, first, last = order[first < last], first[first < last], last[first < last]
+
+        slices = _station_slices(station_codes[order])
+        stations = list(slices)
+        starts = np.array([first[start:end].min() // step * step for start, end in slices.values()], dtype=np.int64)
+        counts = np.array([-((starts[i] - last[start:end].max()) // step) for i, (start, end) in
+                           enumerate(slices.values())], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        arrays = {name: np.full(offsets[-1], np.nan, dtype=np.float32) for name in taf_timeline_columns()}
+        arrays['issue_time'] = np.full(offsets[-1], missing, dtype=np.int64)
+
+        rows = taf.iloc[order]
+        columns = {field: rows[field].to_numpy(dtype=object) if field in rows.columns else np.full(len(rows), None)
+                   for field in ['wind_direction', 'wind_speed_kt', 'wind_gust_kt', 'visibility_meters',
+                                 'weather_score', 'additional_sections', 'has_prob', 'probability']}
+        if 'ceiling_ft' in rows.columns:
+            ceilings = rows['ceiling_ft'].to_numpy(dtype=np.float64, na_value=np.nan)
+        elif 'cloud_layers' in rows.columns:
+            ceilings = np.array([_base_ceiling(layers) if isinstance(layers, list) else np.nan
+                                 for layers in rows['cloud_layers']], dtype=np.float64)
+        else:
+            ceilings = np.full(len(rows), np.nan)
+
+        for station_number, (start, end) in enumerate(slices.values()):
+            grid_start, offset = starts[station_number], offsets[station_number]
+
+            def index(time):
+                # First step at or after time
+                return offset + -((grid_start - int(time)) // step)
+
+            for row in range(start, end):
+                a, b = index(first[row]), index(last[row])
+                if a >= b:
+                    continue
+
+                sections = columns['additional_sections'][row]
+                if columns['has_prob'][row] is not None and bool(columns['has_prob'][row]):
+                    # taf_pattern took the PROB word of the first change group
+                    sections = f"PROB{round(columns['probability'][row] * 100):02d} {sections or ''}"
+                leading, groups = parse_taf_changes(sections, pd.Timestamp(valid_start[order[row]], tz='UTC'))
+                direction = columns['wind_direction'][row]
+                base = {'wind_direction': np.nan if direction is None or direction == -2 else float(direction),
+                        'wind_speed_kt': _float_or_nan(columns['wind_speed_kt'][row]),
+                        'wind_gust_kt': _float_or_nan(columns['wind_gust_kt'][row]),
+                        'visibility_meters': _float_or_nan(columns['visibility_meters'][row]),
+                        'weather_score': _float_or_nan(columns['weather_score'][row]),
+                        'ceiling_ft': ceilings[row]}
+                for field, value in leading.items():
+                    if np.isnan(base[field]):
+                        base[field] = value
+
+                for field in taf_timeline_fields:
+                    arrays[field][a:b] = base[field]
+                for name in taf_temporary_fields:
+                    arrays[f'tempo_{name}'][a:b] = np.nan
+                arrays['issue_time'][a:b] = issued[order[row]]
+
+                permanent = sorted((group for group in groups if group['kind'] in ('FM', 'BECMG')),
+                                   key=lambda group: group['start'] if group['kind'] == 'FM' else group['end'])
+                for group in permanent:
+                    effective = group['start'] if group['kind'] == 'FM' else group['end']
+                    i = max(a, index(effective.astype(np.int64)))
+                    for field, value in group['conditions'].items():
+                        arrays[field][i:b] = value
+
+                for group in groups:
+                    if group['kind'] in ('FM', 'BECMG'):
+                        continue
+                    i = max(a, index(group['start'].astype(np.int64)))
+                    j = min(b, index(group['end'].astype(np.int64)))
+                    if i >= j:
+                        continue
+                    values = dict(group['conditions'], probability=group['probability'] or 0.9)
+                    for field, higher_is_worse in taf_temporary_fields.items():
+                        if field in values and not np.isnan(values[field]):
+                            target = arrays[f'tempo_{field}'][i:j]
+                            (np.fmax if higher_is_worse else np.fmin)(target, values[field], out=target)
+
+        return cls(stations, starts, offsets, step, arrays)
+
+    def positions(self, stations, times):
+        """Flat array position of every (station, time) query, -1 outside the grid of its station."""
+        times = _utc_ns(times)
+        codes = self.station_index.get_indexer(pd.Index(np.asarray(stations, dtype=object)))
+        positions = np.full(len(times), -1, dtype=np.int64)
+        known = np.flatnonzero((codes >= 0) & (times != np.iinfo(np.int64).min))
+        steps = (times[known] - self.starts[codes[known]]) // self.step
+        counts = self.offsets[codes[known] + 1] - self.offsets[codes[known]]
+        inside = (steps >= 0) & (steps < counts)
+        positions[known[inside]] = self.offsets[codes[known[inside]]] + steps[inside]
+        return positions
+
+    def lookup(self, stations, times):
+        """
+        Return the timeline columns of every (station, time) query.
+
+        Parameters:
+        - stations (array): Station code of every query, e.g. "KATL".
+        - times (array): Query timestamps, naive ones are taken as UTC.
+
+        Returns:
+        - DataFrame in query order with taf_timeline_fields, the "tempo_" columns and "issue_time"
+          of the TAF in force, missing values where no TAF applies.
+        """
+        positions = self.positions(stations, times)
+        found = positions >= 0
+        take = np.where(found, positions, 0)
+        result = {}
+        for name, values in self.arrays.items():
+            if name == 'issue_time':
+                issue_time = np.where(found, values[take] if len(values) else 0, np.iinfo(np.int64).min)
+                result[name] = pd.to_datetime(issue_time, utc=True)
+            else:
+                result[name] = np.where(found, values[take] if len(values) else 0, np.nan).astype(np.float32)
+        return pd.DataFrame(result)
+
+    def station_frame(self, station):
+        """Return the timeline of one station, indexed by step time (UTC)."""
+        number = self.station_index.get_loc(station)
+        start, end = self.offsets[number], self.offsets[number + 1]
+        index = pd.to_datetime(self.starts[number] + self.step * np.arange(end - start), utc=True)
+        frame = pd.DataFrame({name: values[start:end] for name, values in self.arrays.items()}, index=index)
+        frame['issue_time'] = pd.to_datetime(frame['issue_time'].to_numpy(), utc=True)
+        return frame
+
+    def _arrays(self):
+        arrays = {'stations': self.stations, 'starts': self.starts, 'offsets': self.offsets,
+                  'step': np.array(self.step, dtype=np.int64)}
+        arrays.update({f'column_{name}': values for name, values in self.arrays.items()})
+        return arrays
+
+    def save(self, path):
+        """Save the timeline to a ".npz" file, or to a directory of ".npy" files like CWAMPolygonStore.save."""
+        if path.endswith('.npz'):
+            np.savez(path, **self._arrays())
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, array in self._arrays().items():
+            np.save(os.path.join(path, f'{name}.npy'), array)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Load a timeline written by save, mmap_mode works for directories like CWAMPolygonStore.load."""
+        if path.endswith('.npz'):
+            with np.load(path) as arrays:
+                arrays = {name: arrays[name] for name in arrays.files}
+        else:
+            arrays = {name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+                      for name in os.listdir(path) if name.endswith('.npy')}
+        columns = {name: arrays[f'column_{name}'] for name in taf_timeline_columns() + ['issue_time']}
+        return cls(arrays['stations'], arrays['starts'], arrays['offsets'], int(arrays['step']), columns)
+
+# Columns of the cleaned FUSER tables with one value per interval, e.g. "interval_3_ETD"
+interval_column_pattern = re.compile(r'^interval_(\d+)_(.+)$')
+
+def interval_labels(columns, num_intervals=NUM_INTERVALS):
+    """Labels of the interval_N_{label} columns that have all num_intervals intervals, in column order."""
+    found = {}
+    for column in columns:
+        match = interval_column_pattern.match(column)
+        if match:
+            found.setdefault(match[2], set()).add(int(match[1]))
+    return [label for label, intervals in found.items() if intervals >= set(range(1, num_intervals + 1))]
+
+def _is_feature_dtype(dtype):
+    """True for numeric and boolean dtypes, those of the default static columns of build_feature_tensor."""
+    return pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype)
+
+def _feature_values(series):
+    """float32 values of a feature column: numbers and booleans as they are, categories as codes, text coerced."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy(dtype=np.float32)
+        codes[codes < 0] = np.nan
+        return codes
+    if _is_feature_dtype(series.dtype):
+        return series.to_numpy(dtype=np.float32, na_value=np.nan)
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float32, na_value=np.nan)
+
+def _weather_features(weather, airports, ref_times, num_intervals, interval_length):
+    """
+    Return {feature name: (source, values)} of the weather sources, values of shape (samples,) for
+    a WeatherAsOfIndex snapshot at ref_time, (samples, num_intervals) for a TafTimeline.
+    """
+    features = {}
+    for source in weather:
+        if isinstance(source, TafTimeline):
+            # The TAF in force at the start of every interval
+            step = np.int64(interval_length) * 60 * 10 ** 9
+            times = ref_times[:, None] + np.arange(num_intervals, dtype=np.int64) * step
+            times[ref_times == np.iinfo(np.int64).min] = np.iinfo(np.int64).min
+            found = source.lookup(np.repeat(airports, num_intervals), pd.to_datetime(times.ravel(), utc=True))
+            for column in taf_timeline_columns():
+                values = found[column].to_numpy(dtype=np.float32).reshape(len(airports), num_intervals)
+                features[f'taf_timeline_{column}'] = ('taf_timeline', values)
+        elif isinstance(source, WeatherAsOfIndex):
+            found = source.lookup(airports, pd.to_datetime(ref_times, utc=True))
+            for column in found.columns:
+                # Report times are skipped, the rest are numbers, possibly in object columns
+                if not pd.api.types.is_datetime64_any_dtype(found[column]):
+                    features[column] = ('weather', _feature_values(found[column]))
+        else:
+            raise ValueError(f"Unsupported weather source: {type(source).__name__}")
+    return features
+
+class FeatureTensor:
+    """
+    Features of cleaned FUSER interval tables as one dense float32 array of shape
+    (samples, intervals, features), with the airport and ref_time of every sample.
+
+    The manifest names the features and how they were built:
+    - "features": feature names, in the order of the last axis.
+    - "sources": source of every feature, "interval" for the interval_N_{label} columns,
+      "table" for other table columns repeated over the intervals, "weather" for WeatherAsOfIndex
+      columns at ref_time repeated over the intervals, "taf_timeline" for TafTimeline columns at
+      the start of every interval.
+    - "airports": airport names of airport_codes.
+    - "num_intervals", "interval_length", "shape", "dtype" and the build_params "params".
+
+    Parameters:
+    - values (array): float32 array of shape (samples, num_intervals, features), missing values are NaN.
+    - airport_codes (array): int32 position of the airport of every sample in manifest["airports"].
+    - ref_times (array): ref_time of every sample, UTC nanoseconds.
+    - manifest (dict): Description of the features, see above.
+    """
+
+    def __init__(self, values, airport_codes, ref_times, manifest):
+        self.values = values
+        self.airport_codes = np.asarray(airport_codes, dtype=np.int32)
+        self.ref_times = np.asarray(ref_times, dtype=np.int64)
+        self.manifest = manifest
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def features(self):
+        return self.manifest['features']
+
+    @property
+    def airports(self):
+        return np.asarray(self.manifest['airports'], dtype=str)
+
+    def feature_index(self, names):
+        """Position of every feature name on the last axis of values."""
+        positions = {name: position for position, name in enumerate(self.features)}
+        return [positions[name] for name in names]
+
+    def index_frame(self):
+        """Return the "airport_id" and "ref_time" of every sample."""
+        return pd.DataFrame({'airport_id': self.airports[self.airport_codes],
+                             'ref_time': pd.to_datetime(self.ref_times, utc=True)})
+
+    def save(self, path):
+        """
+        Save the tensor to a directory of ".npy" files and a "manifest.json", that load can
+        memory-map. A tensor built with a path is already written there and is only flushed.
+        """
+        os.makedirs(path, exist_ok=True)
+        values_path = os.path.join(path, 'values.npy')
+        if isinstance(self.values, np.memmap) and os.path.abspath(self.values.filename) == os.path.abspath(values_path):
+            self.values.flush()
+        else:
+            np.save(values_path, self.values)
+        np.save(os.path.join(path, 'airport_codes.npy'), self.airport_codes)
+        np.save(os.path.join(path, 'ref_times.npy'), self.ref_times)
+        # The manifest is written last, so a directory with a manifest is complete
+        manifest_path = os.path.join(path, 'manifest.json')
+        temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(self.manifest, file, indent=1)
+        os.replace(temp_path, manifest_path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Load a tensor written by save.
+
+        Parameters:
+        - path (str): Directory of the tensor.
+        - mmap_mode (str): Memory-map values, e.g. "r" so that several processes share the pages of
+          one file without copying them. None reads it into memory.
+        """
+        with open(os.path.join(path, 'manifest.json'), 'r') as file:
+            manifest = json.load(file)
+        return cls(np.load(os.path.join(path, 'values.npy'), mmap_mode=mmap_mode),
+                   np.load(os.path.join(path, 'airport_codes.npy')), np.load(os.path.join(path, 'ref_times.npy')),
+                   manifest)
+
+def build_feature_tensor(tables, labels=None, static_columns=None, weather=None, num_intervals=NUM_INTERVALS,
+                         interval_length=INTERVAL_LENGTH, path=None):
+    """
+    Build a FeatureTensor from cleaned FUSER interval tables, without per-row Python work: the
+    numeric columns of every table are converted at once and copied into the tensor column by column.
+
+    Parameters:
+    - tables (DataFrame, str or list): Cleaned tables with "airport_id", "ref_time" and
+      interval_N_{label} columns, or paths of their CSV files, e.g. "./data/FUSER/train/2022-09-01.csv".
+      Only the columns in use are read from the files.
+    - labels (list): Interval labels, e.g. ["Arrival", "ETD"], defaults to the interval_labels of
+      the first table. Missing columns give NaN.
+    - static_columns (list): Other table columns repeated over the intervals, e.g. ["temperature"],
+      defaults to the numeric and boolean columns of the first table. Categorical columns give
+      their codes.
+    - weather (WeatherAsOfIndex, TafTimeline or list): Weather joined on airport_id and ref_time.
+      WeatherAsOfIndex adds its lookup columns at ref_time except the report times, TafTimeline
+      adds taf_timeline_columns at the start of every interval, prefixed "taf_timeline_".
+    - num_intervals (int): Number of intervals.
+    - interval_length (int): Interval length in minutes.
+    - path (str): Directory to build the tensor in, values are written to a memory-mapped
+      "values.npy" there instead of memory, see FeatureTensor.save.
+
+    Returns:
+    - FeatureTensor, samples in the order of the tables and their rows.
+    """
+    tables = [tables] if isinstance(tables, (pd.DataFrame, str)) else list(tables)
+    weather = [] if weather is None else list(weather) if isinstance(weather, (list, tuple)) else [weather]
+
+    def read(table, usecols):
+        return pd.read_csv(table, usecols=usecols) if isinstance(table, str) else table
+
+    # The header of the first table gives the columns to read, the defaults of static_columns also
+    # need the dtypes of its other columns
+    header = pd.read_csv(tables[0], nrows=0).columns if isinstance(tables[0], str) else tables[0].columns
+    labels = interval_labels(header, num_intervals) if labels is None else list(labels)
+    interval_columns = {f'interval_{i}_{label}' for label in labels for i in range(1, num_intervals + 1)}
+    candidates = static_columns
+    if static_columns is None:
+        candidates = [column for column in header if column not in ('airport_id', 'ref_time')
+                      and not interval_column_pattern.match(column)]
+    wanted = {'airport_id', 'ref_time', *interval_columns, *candidates}
+    first = read(tables[0], lambda column: column in wanted)
+    if static_columns is None:
+        static_columns = [column for column in candidates if _is_feature_dtype(first[column].dtype)]
+    static_columns = list(static_columns)
+    wanted = {'airport_id', 'ref_time', *interval_columns, *static_columns}
+    frames = [first] + [read(table, lambda column: column in wanted) for table in tables[1:]]
+
+    airports = np.concatenate([frame['airport_id'].to_numpy(dtype=str) for frame in frames])
+    ref_times = _utc_ns(pd.concat([frame['ref_time'] for frame in frames], ignore_index=True))
+    weather_features = _weather_features(weather, airports, ref_times, num_intervals, interval_length)
+
+    features = labels + static_columns + list(weather_features)
+    sources = (['interval'] * len(labels) + ['table'] * len(static_columns)
+               + [source for source, _ in weather_features.values()])
+    if len(set(features)) != len(features):
+        raise ValueError("Duplicate feature names, a static column repeats an interval label or weather column")
+    shape = (len(airports), num_intervals, len(features))
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+        values = np.lib.format.open_memmap(os.path.join(path, 'values.npy'), mode='w+', dtype=np.float32, shape=shape)
+    else:
+        values = np.empty(shape, dtype=np.float32)
+
+    # Table column -> (intervals, feature position) it fills
+    targets = {f'interval_{i + 1}_{label}': ([i], position)
+               for position, label in enumerate(labels) for i in range(num_intervals)}
+    targets.update({column: (slice(None), position) for position, column in enumerate(static_columns, len(labels))})
+    row = 0
+    for frame in frames:
+        block = values[row:row + len(frame)]
+        block[:, :, :len(labels) + len(static_columns)] = np.nan
+        dtypes = frame.dtypes
+        # The numeric columns are converted in one go, the others one by one
+        present = [column for column in targets if column in dtypes.index]
+        numeric = [column for column in present if _is_feature_dtype(dtypes[column])]
+        for column, column_values in zip(numeric, frame[numeric].to_numpy(dtype=np.float32, na_value=np.nan).T):
+            intervals, position = targets[column]
+            block[:, intervals, position] = column_values[:, None]
+        for column in set(present) - set(numeric):
+            intervals, position = targets[column]
+            block[:, intervals, position] = _feature_values(frame[column])[:, None]
+        row += len(frame)
+    for position, (source, feature) in enumerate(weather_features.values(), len(labels) + len(static_columns)):
+        values[:, :, position] = feature if feature.ndim == 2 else feature[:, None]
+
+    names, codes = np.unique(airports, return_inverse=True)
+    manifest = {'features': features, 'sources': sources, 'airports': names.tolist(),
+                'num_intervals': num_intervals, 'interval_length': interval_length,
+                'shape': list(shape), 'dtype': 'float32', 'params': build_params(num_intervals, interval_length)}
+    tensor = FeatureTensor(values, codes.astype(np.int32), ref_times, manifest)
+    if path is not None:
+        tensor.save(path)
+    return tensor
+
+def write_csv_atomic(df, file_path, **kwargs):
+    """
+    Write a DataFrame to CSV through a temporary file in the same directory, so a crash never
+    leaves a partly written file at file_path. kwargs are passed to DataFrame.to_csv.
+    """
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        df.to_csv(temp_path, **kwargs)
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def source_hash(functions):
+    """Return a hash of the source code of functions."""
+    digest = hashlib.sha1()
+    for function in functions:
+        digest.update(inspect.getsource(function).encode())
+    return digest.hexdigest()[:16]
+
+# Functions a daily FUSER build runs on its inputs. Editing one of them marks the outputs of a
+# BuildManifest stale, the METAR and TAF parsers are left out.
+fuser_build_functions = [load_data, _load_file, extract_file_type]
+
+def fuser_version_hash(functions=()):
+    """
+    Return a hash of fuser_file_pattern and the source of fuser_build_functions and functions, the
+    code a FUSER build depends on.
+
+    Parameters:
+    - functions (list): Functions of the build outside this module, e.g. the cleaning steps of
+      cleanFUSERData.ipynb.
+    """
+    digest = hashlib.sha1(fuser_file_pattern.pattern.encode())
+    digest.update(source_hash([*fuser_build_functions, *functions]).encode())
+    return digest.hexdigest()[:16]
+
+def build_params(num_intervals=NUM_INTERVALS, interval_length=INTERVAL_LENGTH, functions=(), **extra):
+    """Return the build parameters recorded in a BuildManifest, with the FUSER version hash of functions."""
+    return {'NUM_INTERVALS': num_intervals, 'INTERVAL_LENGTH': interval_length,
+            'fuser_version': fuser_version_hash(functions), **extra}
+
+class BuildManifest:
+    """
+    Record of how each cleaned output file was built: the fingerprint (size and modification time)
+    of every input file and the build parameters. An output has to be rebuilt when it is missing,
+    was never recorded, or when its inputs or parameters changed since it was recorded.
+
+    Record an output only after it was written completely, e.g. with write_csv_atomic, so a
+    crashed build is rebuilt on the next run.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters:
+        - path (str): JSON file of the manifest, e.g. "./data/FUSER/train/manifest.json".
+        """
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.entries = json.load(file)
+
+    @staticmethod
+    def _params(params):
+        """params as the manifest file holds them (tuples become lists), so they compare equal to loaded entries."""
+        return json.loads(json.dumps(build_params() if params is None else params))
+
+    @staticmethod
+    def _inputs(input_paths):
+        inputs = {}
+        for input_path in sorted(input_paths):
+            path, size, mtime_ns = file_fingerprint(input_path)
+            inputs[path] = [size, mtime_ns]
+        return inputs
+
+    def is_stale(self, output_path, input_paths, params=None):
+        """Return True if output_path has to be rebuilt from input_paths with params."""
+        params = self._params(params)
+        entry = self.entries.get(os.path.abspath(output_path))
+        if entry is None or not os.path.exists(output_path):
+            return True
+        try:
+            inputs = self._inputs(input_paths)
+        except FileNotFoundError:
+            return True
+        return entry['inputs'] != inputs or entry['params'] != params
+
+    def stale_outputs(self, jobs, params=None):
+        """Return the output paths of jobs, a dictionary of output path -> input paths, that have to be rebuilt."""
+        return [output_path for output_path, input_paths in jobs.items()
+                if self.is_stale(output_path, input_paths, params)]
+
+    def record(self, output_path, input_paths, params=None, save=True):
+        """Record that output_path was built from input_paths with params."""
+        params = self._params(params)
+        self.entries[os.path.abspath(output_path)] = {'inputs': self._inputs(input_paths), 'params': params}
+        if save:
+            self.save()
+
+    def save(self):
+        """Write the manifest through a temporary file, like write_csv_atomic."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(self.entries, file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+def fuser_build_jobs(catalog, dataset_purpose, output_dir, file_types=None):
+    """
+    Return the daily FUSER build jobs of a FileCatalog: {output path: input paths}.
+
+    Parameters:
+    - catalog (FileCatalog): Catalog of the raw FUSER files.
+    - dataset_purpose (str): "train" or "test".
+    - output_dir (str): Root of the cleaned outputs, e.g. "./data". Outputs are written to
+      {output_dir}/FUSER/{dataset_purpose}/{date}.csv.
+    - file_types (list): Input file types of a day, None uses every file type.
+    """
+    inputs = catalog.find('FUSER', purpose=dataset_purpose, file_type=file_types)
+    inputs = inputs[inputs['file_type'] != 'output'].dropna(subset=['start_date', 'end_date'])
+    jobs = {}
+    for start_date, end_date, input_path in zip(inputs['start_date'], inputs['end_date'], inputs['path']):
+        for date in pd.date_range(start_date, end_date):
+            output_path = os.path.join(output_dir, 'FUSER', dataset_purpose, f"{date:%Y-%m-%d}.csv")
+            jobs.setdefault(output_path, []).append(input_path)
+    return dict(sorted(jobs.items()))
@@ -0,0 +1,406 @@
+"""
+Synthetic METAR, TAF, CWAM and FUSER files in the layouts load_data reads, for load tests at scale.
+
+All generators are seeded, the same arguments write the same files.
+
+Usage:
+    python generateData.py data_synthetic --airports KATL KDEN --start 2022-09-01 --days 7
+"""
+import argparse
+import os
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from fetchData import cwam_root, fuser_schemas, get_fuser_file_name
+
+# Runways, carriers, aircraft and origins the generated reports and flights pick from
+runway_names = ['08L', '08R', '09L', '09R', '26L', '26R', '27L', '27R']
+carriers = ['DAL', 'AAL', 'UAL', 'SWA', 'JBU', 'ASA']
+aircraft_types = ['B738', 'A321', 'B739', 'A320', 'CRJ9', 'E75L', 'B752']
+engine_classes = ['JET', 'TURBO', 'PISTON']
+flight_types = ['SCHEDULED_AIR_TRANSPORT', 'GENERAL_AVIATION', 'MILITARY']
+other_airports = ['KJFK', 'KLAX', 'KORD', 'KDFW', 'KMIA', 'KSEA', 'KBOS', 'KPHX']
+weather_codes = ['-RA', 'RA', '+TSRA', 'BR', 'FG', '-SN', 'HZ', 'VCSH']
+cloud_covers = ['FEW', 'SCT', 'BKN', 'OVC']
+
+# Default FUSER rows per hour of every file type
+fuser_rows_per_hour = {
+    'runways': 60, 'ETD': 30, 'TFM_track': 30, 'TBFM': 30, 'configs': 1, 'LAMP': 4, 'MFS': 60,
+    'first_position': 30
+}
+
+def date_line(time):
+    """Header line of a METAR or TAF report."""
+    return f"{time:%Y/%m/%d %H:%M}"
+
+def temperature_code(value):
+    """Temperature in whole degrees as in reports, M for minus."""
+    return f"M{-value:02d}" if value < 0 else f"{value:02d}"
+
+def metar_report(rng, station, time):
+    """One METAR report of station observed at time."""
+    us_station = station.startswith('K')
+    wind = f"{rng.integers(0, 36) * 10:03d}{rng.integers(0, 25):02d}"
+    if rng.random() < 0.2:
+        wind += f"G{rng.integers(25, 40):02d}"
+    wind += 'KT' if us_station else rng.choice(['KT', 'MPS'])
+    visibility = f"{rng.integers(1, 11)}SM" if us_station else rng.choice(['9999', '4000', '0800', 'CAVOK'])
+    groups = [station, f"{time:%d%H%M}Z"]
+    if rng.random() < 0.02:
+        groups.append('COR')
+    if rng.random() < 0.3:
+        groups.append('AUTO')
+    groups += [wind, visibility]
+    if rng.random() < 0.2:
+        groups.append(rng.choice(weather_codes))
+
+    altitude = int(rng.integers(5, 60))
+    for _ in range(rng.integers(1, 4)):
+        groups.append(f"{rng.choice(cloud_covers)}{altitude:03d}" + ('CB' if rng.random() < 0.05 else ''))
+        altitude += int(rng.integers(10, 100))
+
+    temperature = int(rng.integers(-20, 40))
+    dewpoint = temperature - int(rng.integers(0, 15))
+    groups.append(f"{temperature_code(temperature)}/{temperature_code(dewpoint)}")
+    groups.append(f"A{rng.integers(2900, 3100)}" if us_station else f"Q{rng.integers(980, 1040)}")
+    groups += ['RMK', 'AO2']
+    return ' '.join(groups)
+
+def taf_report(rng, station, issue_time, amendment=False, valid_hours=24):
+    """Lines of one TAF report of station issued at issue_time, the last one ends with '='."""
+    start = issue_time.ceil('h')
+    end = start + pd.Timedelta(hours=valid_hours)
+    max_time = start + pd.Timedelta(hours=int(rng.integers(1, valid_hours)))
+    min_time = start + pd.Timedelta(hours=int(rng.integers(1, valid_hours)))
+    temperature = int(rng.integers(-10, 35))
+
+    def conditions(visibility='P6SM'):
+        return (f"{rng.integers(0, 36) * 10:03d}{rng.integers(0, 25):02d}KT {visibility} "
+                f"{rng.choice(cloud_covers)}{rng.integers(10, 250):03d}")
+
+    # QNH in inches of mercury or hPa, or none. taf_pattern only reaches it after a visibility
+    # it knows, so the base forecast uses 9999 as often as P6SM.
+    qnh = rng.choice([f" QNH{rng.integers(2950, 3050)}INS", f" QNH{rng.integers(990, 1040):04d}HPA", ""])
+
+    lines = [f"TAF {'AMD ' if amendment else ''}{station} {issue_time:%d%H%M}Z {start:%d%H}/{end:%d%H} "
+             f"{conditions(rng.choice(['P6SM', '9999']))}{qnh} TX{temperature_code(temperature + 8)}/{max_time:%d%H}Z "
+             f"TN{temperature_code(temperature)}/{min_time:%d%H}Z"]
+    change_time = start
+    for _ in range(rng.integers(1, 4)):
+        change_time += pd.Timedelta(hours=int(rng.integers(2, 6)))
+        if change_time >= end:
+            break
+        change_end = min(change_time + pd.Timedelta(hours=int(rng.integers(1, 4))), end)
+        kind = rng.choice(['FM', 'BECMG', 'TEMPO', 'PROB30'])
+        if kind == 'FM':
+            lines.append(f"FM{change_time:%d%H%M} {conditions()}")
+        else:
+            lines.append(f"{kind} {change_time:%d%H}/{change_end:%d%H} {rng.choice(weather_codes)} "
+                         f"{rng.choice(cloud_covers)}{rng.integers(10, 100):03d}")
+    lines[-1] += '='
+    return lines
+
+def write_metar(file_path, stations, start, days=1, reports_per_hour=1, seed=0):
+    """
+    Write a METAR file with reports of every station, each under its date line.
+
+    Parameters:
+    - file_path (str): Path of the text file.
+    - stations (list): Station codes, e.g. ["KATL", "KDEN"].
+    - start (str or Timestamp): First day.
+    - days (int): Number of days.
+    - reports_per_hour (int): Reports per station and hour.
+    - seed (int): Random seed.
+
+    Returns:
+    - Number of reports written.
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(pd.Timestamp(start), periods=days * 24 * reports_per_hour,
+                          freq=pd.Timedelta(minutes=60 / reports_per_hour))
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as file:
+        for time in times:
+            for station in stations:
+                observed = time + pd.Timedelta(minutes=int(rng.integers(0, 60 // reports_per_hour)))
+                file.write(f"{date_line(observed)}\n{metar_report(rng, station, observed)}\n")
+    return len(times) * len(stations)
+
+def write_taf(file_path, stations, start, days=1, reports_per_day=4, amendment_rate=0.1, seed=0):
+    """
+    Write a TAF file. The reports of all stations issued at the same time share one date line,
+    each report spans several lines and ends with '='.
+
+    Parameters:
+    - file_path (str): Path of the text file.
+    - stations (list): Station codes.
+    - start (str or Timestamp): First day.
+    - days (int): Number of days.
+    - reports_per_day (int): Routine reports per station and day.
+    - amendment_rate (float): Probability of an amended report following a routine one.
+    - seed (int): Random seed.
+
+    Returns:
+    - Number of reports written.
+    """
+    rng = np.random.default_rng(seed)
+    issue_times = pd.date_range(pd.Timestamp(start), periods=days * reports_per_day,
+                                freq=pd.Timedelta(hours=24 / reports_per_day)) - pd.Timedelta(minutes=40)
+    num_reports = 0
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as file:
+        for issue_time in issue_times:
+            file.write(f"{date_line(issue_time)}\n")
+            for station in stations:
+                file.write('\n'.join(taf_report(rng, station, issue_time)) + '\n')
+                num_reports += 1
+            amended = [station for station in stations if rng.random() < amendment_rate]
+            if amended:
+                amendment_time = issue_time + pd.Timedelta(minutes=int(rng.integers(30, 120)))
+                file.write(f"{date_line(amendment_time)}\n")
+                for station in amended:
+                    file.write('\n'.join(taf_report(rng, station, amendment_time, amendment=True)) + '\n')
+                    num_reports += 1
+    return num_reports
+
+def write_cwam(file_path, forecast_times=(0, 15, 30, 45, 60), flight_levels=(200, 250, 300, 350, 400),
+               thresholds=(20, 40, 60, 80), polygons_per_group=10, points_per_polygon=12,
+               center=(33.64, -84.43), spread=3.0, seed=0):
+    """
+    Write a CWAM file with the Deviation Probability/FCST/FLVL/Contour/TRSH/POLY hierarchy,
+    each polygon a (2, points) array of latitudes and longitudes.
+
+    Parameters:
+    - file_path (str): Path of the HDF5 file.
+    - forecast_times, flight_levels, thresholds (tuple): Values of the FCST, FLVL and TRSH groups.
+    - polygons_per_group (int): Polygons of every threshold group.
+    - points_per_polygon (int): Vertices of every polygon.
+    - center (tuple): Latitude and longitude the polygons are spread around.
+    - spread (float): Standard deviation in degrees of the polygon centers.
+    - seed (int): Random seed.
+
+    Returns:
+    - Number of polygons written.
+    """
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, points_per_polygon, endpoint=False)
+    num_polygons = 0
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with h5py.File(file_path, 'w') as file:
+        for fcst in forecast_times:
+            for flvl in flight_levels:
+                for trsh in thresholds:
+                    group = file.create_group(f"{cwam_root}/FCST{fcst:03d}/FLVL{flvl:03d}/Contour/TRSH{trsh}")
+                    for poly in range(polygons_per_group):
+                        # Higher thresholds get smaller polygons, like nested contours
+                        radius = rng.uniform(0.05, 0.5) * (100 - trsh) / 80
+                        radii = radius * rng.uniform(0.7, 1.3, points_per_polygon)
+                        lat, lon = rng.normal(center, spread)
+                        group.create_dataset(f"POLY{poly}", data=np.vstack(
+                            [lat + radii * np.cos(angles), lon + radii * np.sin(angles)]))
+                        num_polygons += 1
+    return num_polygons
+
+def format_times(times):
+    """Format a Series of timestamps like the FUSER CSV files, missing times stay empty."""
+    return times.dt.strftime('%Y-%m-%d %H:%M:%S')
+
+def flights(rng, airport, date, flights_per_hour):
+    """Flights of airport on date, shared by all FUSER file types so gufis match across files."""
+    day = pd.Timestamp(date)
+    num_flights = flights_per_hour * 24
+    runway_time = day + pd.to_timedelta(np.sort(rng.uniform(0, 86400, num_flights)).round(), unit='s')
+    is_arrival = rng.random(num_flights) < 0.5
+    carrier = rng.choice(carriers, num_flights)
+    other = rng.choice(other_airports, num_flights)
+    origin = np.where(is_arrival, other, airport)
+    destination = np.where(is_arrival, airport, other)
+    gufi = [f"{carrier[i]}{1000 + i}.{origin[i]}.{destination[i]}.{day:%y%m%d}.{runway_time[i]:%H%M}.{i:04d}.TFM"
+            for i in range(num_flights)]
+    return pd.DataFrame({'gufi': gufi, 'is_arrival': is_arrival, 'runway_time': runway_time,
+                         'runway': rng.choice(runway_names, num_flights), 'origin': origin,
+                         'destination': destination, 'carrier': carrier})
+
+def fuser_frame(rng, file_type, airport, date, flight_table, rows_per_hour):
+    """Rows of one FUSER file type, sorted on the time column of its schema."""
+    day = pd.Timestamp(date)
+    arrivals = flight_table[flight_table['is_arrival']].reset_index(drop=True)
+    departures = flight_table[~flight_table['is_arrival']].reset_index(drop=True)
+
+    def minutes(low, high, size):
+        return pd.to_timedelta(rng.uniform(low, high, size).round(), unit='min')
+
+    def estimates(table):
+        num_rows = min(len(table), rows_per_hour * 24)
+        rows = table.sample(n=num_rows, random_state=int(rng.integers(2 ** 31))).reset_index(drop=True)
+        estimated = rows['runway_time'] + minutes(-10, 10, num_rows)
+        return rows, estimated, estimated - minutes(10, 180, num_rows)
+
+    if file_type == 'runways':
+        arrival = flight_table['is_arrival']
+        df = pd.DataFrame({
+            'gufi': flight_table['gufi'],
+            'departure_runway_actual_time': format_times(flight_table['runway_time'].where(~arrival)),
+            'departure_runway_actual': flight_table['runway'].where(~arrival),
+            'arrival_runway_actual_time': format_times(flight_table['runway_time'].where(arrival)),
+            'arrival_runway_actual': flight_table['runway'].where(arrival)
+        })
+    elif file_type in ('ETD', 'TFM_track', 'TBFM'):
+        rows, estimated, timestamp = estimates(departures if file_type == 'ETD' else arrivals)
+        df = pd.DataFrame({'gufi': rows['gufi'], 'timestamp': format_times(timestamp),
+                           fuser_schemas[file_type]['time_column']: format_times(estimated)})
+    elif file_type == 'first_position':
+        tracked = arrivals['runway_time'] - minutes(30, 240, len(arrivals))
+        df = pd.DataFrame({'gufi': arrivals['gufi'], 'time_first_tracked': format_times(tracked)})
+    elif file_type == 'MFS':
+        num_rows = len(flight_table)
+        df = pd.DataFrame({
+            'gufi': flight_table['gufi'],
+            'aircraft_engine_class': rng.choice(engine_classes, num_rows, p=[0.9, 0.07, 0.03]),
+            'aircraft_type': rng.choice(aircraft_types, num_rows),
+            'major_carrier': flight_table['carrier'],
+            'flight_type': rng.choice(flight_types, num_rows, p=[0.9, 0.08, 0.02]),
+            'arrival_aerodrome_icao_name': flight_table['destination'],
+            'departure_aerodrome_icao_name': flight_table['origin']
+        })
+    elif file_type == 'configs':
+        start_time = pd.Series(day + np.arange(rows_per_hour * 24) * pd.Timedelta(minutes=60 / rows_per_hour))
+        pairs = ['26R, 27L', '8L, 9R', '26L, 27R', '8R, 9L']
+        df = pd.DataFrame({
+            'timestamp': format_times(start_time - minutes(0, 5, len(start_time))),
+            'data_timestamp': format_times(start_time),
+            'start_time': format_times(start_time),
+            'departure_runways': rng.choice(pairs, len(start_time)),
+            'arrival_runways': rng.choice(pairs, len(start_time))
+        })
+    elif file_type == 'LAMP':
+        issued = pd.Series(day + np.arange(24) * pd.Timedelta(hours=1)).repeat(rows_per_hour).reset_index(drop=True)
+        num_rows = len(issued)
+        lead = pd.to_timedelta(np.tile(np.arange(1, rows_per_hour + 1), 24), unit='h')
+        df = pd.DataFrame({
+            'timestamp': format_times(issued),
+            'forecast_timestamp': format_times(issued + lead),
+            'temperature': rng.normal(75, 10, num_rows).round(),
+            'wind_direction': rng.integers(0, 36, num_rows) * 10,
+            'wind_speed': rng.integers(0, 25, num_rows),
+            'wind_gust': np.where(rng.random(num_rows) < 0.2, rng.integers(20, 40, num_rows), 0),
+            'cloud_ceiling': rng.integers(1, 9, num_rows),
+            'visibility': rng.integers(1, 8, num_rows),
+            'cloud': rng.choice(['CL', 'FW', 'SC', 'BK', 'OV'], num_rows),
+            'lightning_prob': rng.choice(['N', 'L', 'M', 'H'], num_rows, p=[0.85, 0.1, 0.04, 0.01]),
+            'precip': rng.random(num_rows) < 0.15
+        })
+    else:
+        raise ValueError(f"Unsupported FUSER file type: {file_type}")
+
+    time_column = fuser_schemas[file_type]['time_column']
+    if time_column is not None:
+        df = df.sort_values(time_column, kind='stable', na_position='last').reset_index(drop=True)
+    return df
+
+def write_fuser(base_dir, dataset_purpose, airport, date, file_types=None, rows_per_hour=None, seed=0):
+    """
+    Write the FUSER files of one airport and day to base_dir/FUSER/{purpose}/{airport}/,
+    named per get_fuser_file_name.
+
+    Parameters:
+    - base_dir (str): Data directory.
+    - dataset_purpose (str): "train" or "test".
+    - airport (str): Airport code, e.g. "KATL".
+    - date (str): Day, e.g. "2022-09-01".
+    - file_types (list): FUSER file types to write, None writes all of fuser_schemas.
+    - rows_per_hour (dict): Rows per hour of file types, defaults to fuser_rows_per_hour.
+    - seed (int): Random seed.
+
+    Returns:
+    - {file_type: number of rows written}.
+    """
+    rng = np.random.default_rng(seed)
+    rows_per_hour = {**fuser_rows_per_hour, **(rows_per_hour or {})}
+    flight_table = flights(rng, airport, date, rows_per_hour['runways'])
+    path = os.path.join(base_dir, 'FUSER', dataset_purpose, airport)
+    os.makedirs(path, exist_ok=True)
+
+    num_rows = {}
+    for file_type in file_types or list(fuser_schemas):
+        df = fuser_frame(rng, file_type, airport, date, flight_table, rows_per_hour[file_type])
+        df.to_csv(os.path.join(path, f"{get_fuser_file_name(airport, date, file_type)}.csv"), index=False)
+        num_rows[file_type] = len(df)
+    return num_rows
+
+def generate(base_dir, airports, start, days=1, dataset_purpose='train', reports_per_hour=1, taf_per_day=4,
+             polygons_per_group=10, fuser_types=None, fuser_rows=None, seed=0):
+    """
+    Write METAR, TAF, CWAM and FUSER files for airports and days under base_dir, one file per
+    day and data type (per airport and file type for FUSER).
+
+    METAR files go to METAR/{purpose}/part_1 for train and METAR/{purpose} for test, TAF files to
+    TAF/{purpose}, CWAM files to CWAM/{purpose}/part_1/MM/DD, all named after their day.
+
+    Parameters:
+    - base_dir (str): Data directory.
+    - airports (list): Airport codes, also used as METAR and TAF stations.
+    - start (str): First day, e.g. "2022-09-01".
+    - days (int): Number of days.
+    - dataset_purpose (str): "train" or "test".
+    - reports_per_hour (int): METAR reports per station and hour.
+    - taf_per_day (int): Routine TAF reports per station and day.
+    - polygons_per_group (int): CWAM polygons per forecast time, flight level and threshold.
+    - fuser_types (list): FUSER file types to write, None writes all of them.
+    - fuser_rows (dict): FUSER rows per hour of file types.
+    - seed (int): Random seed, every file gets its own seed derived from it.
+
+    Returns:
+    - DataFrame with data_type, path_level, file_name and number of items of every file written.
+    """
+    written = []
+    seeds = np.random.SeedSequence(seed)
+    metar_dir = os.path.join(base_dir, 'METAR', dataset_purpose, *(['part_1'] if dataset_purpose == 'train' else []))
+    for day in pd.date_range(pd.Timestamp(start), periods=days, freq='D'):
+        date = f"{day:%Y-%m-%d}"
+        day_seeds = iter(seeds.spawn(3 + len(airports)))
+
+        file_name = f"metar.{day:%Y%m%d}"
+        count = write_metar(os.path.join(metar_dir, f"{file_name}.txt"), airports, day, 1, reports_per_hour,
+                            next(day_seeds))
+        written.append(('METAR', 'part_1' if dataset_purpose == 'train' else None, file_name, count))
+
+        file_name = f"taf.{day:%Y%m%d}"
+        count = write_taf(os.path.join(base_dir, 'TAF', dataset_purpose, f"{file_name}.txt"), airports, day, 1,
+                          taf_per_day, seed=next(day_seeds))
+        written.append(('TAF', None, file_name, count))
+
+        file_name = f"{day:%Y_%m_%d_%H_%M}_GMT.Forecast"
+        count = write_cwam(os.path.join(base_dir, 'CWAM', dataset_purpose, 'part_1', f"{day:%m}", f"{day:%d}",
+                                        f"{file_name}.h5.CWAM.h5"),
+                           polygons_per_group=polygons_per_group, seed=next(day_seeds))
+        written.append(('CWAM', 'part_1', file_name, count))
+
+        for airport in airports:
+            counts = write_fuser(base_dir, dataset_purpose, airport, date, fuser_types, fuser_rows, next(day_seeds))
+            for file_type, count in counts.items():
+                written.append(('FUSER', airport, get_fuser_file_name(airport, date, file_type), count))
+    return pd.DataFrame(written, columns=['data_type', 'path_level', 'file_name', 'items'])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base_dir', help='Directory to write the data to')
+    parser.add_argument('--airports', nargs='+', default=['KATL'])
+    parser.add_argument('--start', default='2022-09-01', help='First day')
+    parser.add_argument('--days', type=int, default=1)
+    parser.add_argument('--purpose', default='train', choices=['train', 'test'])
+    parser.add_argument('--reports-per-hour', type=int, default=1, help='METAR reports per station and hour')
+    parser.add_argument('--taf-per-day', type=int, default=4, help='TAF reports per station and day')
+    parser.add_argument('--polygons', type=int, default=10, help='CWAM polygons per threshold group')
+    parser.add_argument('--fuser-types', nargs='+', help='FUSER file types, defaults to all of them')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    written = generate(args.base_dir, args.airports, args.start, args.days, args.purpose, args.reports_per_hour,
+                       args.taf_per_day, args.polygons, args.fuser_types, seed=args.seed)
+    print(written.groupby('data_type')['items'].agg(['count', 'sum']).rename(columns={'count': 'files'}))
+
+if __name__ == '__main__':
+    main()